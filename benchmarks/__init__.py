@@ -0,0 +1,9 @@
+# benchmarks/__init__.py
+# Benchmarks manuais (não rodam em CI). Executar da raiz do repo: python -m benchmarks.<nome>
+import os
+import sys
+
+# Os módulos da aplicação importam a partir de src/ (como no main.py)
+_SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
@@ -0,0 +1,137 @@
+# benchmarks/bench_inicializacao.py
+# Custo de boot do app: tempo de import (python -X importtime) e RSS de um processo que
+# só faz "import main", com os maiores módulos por tempo cumulativo. Falha (saída 1) se
+# o total passar do orçamento ou se alguma biblioteca pesada que deveria ser carregada
+# só no primeiro uso (pdfplumber, requests, SDKs de IA) aparecer no boot.
+# Uso (raiz do repo):
+#   python -m benchmarks.bench_inicializacao
+#   python -m benchmarks.bench_inicializacao --orcamento-ms 800 --repeticoes 7 --top 25
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Carregados sob demanda (services/carregamento.py e imports dentro das funções)
+PROIBIDOS_NO_BOOT = ("pdfplumber", "pdfminer", "google.genai", "requests", "urllib3", "langchain", "openai")
+
+# Roda no processo filho: importa o app e devolve RSS e módulos carregados
+_SONDA = """
+import sys, json, resource
+import main
+pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"pico_rss_kb": pico // 1024 if sys.platform == "darwin" else pico,
+                  "modulos": sorted(sys.modules)}))
+"""
+
+_LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _ambiente(pasta):
+    """
+    Banco e índice de busca temporários e sem worker embutido da fila: o boot medido é o
+    do app, sem thread de polling nem arquivos no diretório do repo.
+    """
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(pasta, 'boot.db')}",
+        "CHAT_BUSCA_SQLITE": os.path.join(pasta, "busca.db"),
+        "FILA_WORKER_EMBUTIDO": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, (SRC, os.environ.get("PYTHONPATH")))),
+    })
+    return env
+
+
+def _executar(pasta, importtime):
+    comando = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _SONDA]
+    processo = subprocess.run(comando, cwd=pasta, env=_ambiente(pasta), capture_output=True, text=True)
+    if processo.returncode != 0:
+        raise SystemExit(f"Falha ao importar o app:\n{processo.stderr[-3000:]}")
+    return json.loads(processo.stdout.strip().splitlines()[-1]), processo.stderr
+
+
+def _importtime(stderr):
+    """
+    Linhas do -X importtime -> {módulo: (próprio_us, cumulativo_us)} e o total (soma dos
+    cumulativos de nível superior).
+    """
+    modulos, total = {}, 0
+    for linha in stderr.splitlines():
+        m = _LINHA_IMPORTTIME.match(linha)
+        if not m:
+            continue
+        proprio, cumulativo, recuo, nome = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        modulos[nome] = (proprio, cumulativo)
+        if len(recuo) <= 1:  # Sem recuo extra = import de nível superior
+            total += cumulativo
+    return modulos, total
+
+
+def _args():
+    parser = argparse.ArgumentParser(description="Tempo de import e RSS do boot do app")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--orcamento-ms", type=float, default=1000.0, help="Mediana máxima do import total")
+    parser.add_argument("--top", type=int, default=15, help="Quantos módulos listar por tempo cumulativo")
+    parser.add_argument("--json", metavar="ARQUIVO", help="Grava o resultado")
+    return parser.parse_args()
+
+
+def main():
+    args = _args()
+    pasta = tempfile.mkdtemp(prefix="bench_boot_")
+    try:
+        _executar(pasta, importtime=False)  # Aquece o cache de bytecode e o disco
+        totais, rss, ultimo = [], [], None
+        for _ in range(args.repeticoes):
+            sonda, stderr = _executar(pasta, importtime=True)
+            ultimo, total = _importtime(stderr)
+            totais.append(total / 1000)
+            sonda_sem_importtime, _ = _executar(pasta, importtime=False)  # -X importtime infla o RSS
+            rss.append(sonda_sem_importtime["pico_rss_kb"] / 1024)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    carregados = set(sonda["modulos"])
+    proibidos = sorted(p for p in PROIBIDOS_NO_BOOT if p in carregados)
+    resultado = {
+        "import_ms_p50": round(statistics.median(totais), 1),
+        "import_ms_min": round(min(totais), 1),
+        "rss_mb_p50": round(statistics.median(rss), 1),
+        "modulos_carregados": len(carregados),
+        "proibidos_no_boot": proibidos,
+        "maiores": [
+            {"modulo": nome, "cumulativo_ms": round(cum / 1000, 1), "proprio_ms": round(proprio / 1000, 1)}
+            for nome, (proprio, cum) in sorted(ultimo.items(), key=lambda i: -i[1][1])[:args.top]
+        ],
+    }
+
+    print(f"import main: {resultado['import_ms_p50']} ms (mediana de {args.repeticoes}, mín {resultado['import_ms_min']} ms)"
+          f" | RSS {resultado['rss_mb_p50']} MB | {resultado['modulos_carregados']} módulos")
+    print(f"\n{'módulo':<45} {'cumulativo ms':>14} {'próprio ms':>11}")
+    for m in resultado["maiores"]:
+        print(f"{m['modulo']:<45} {m['cumulativo_ms']:>14.1f} {m['proprio_ms']:>11.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    falhas = []
+    if resultado["import_ms_p50"] > args.orcamento_ms:
+        falhas.append(f"import {resultado['import_ms_p50']} ms > orçamento {args.orcamento_ms:.0f} ms")
+    if proibidos:
+        falhas.append(f"carregados no boot (deveriam ser tardios): {', '.join(proibidos)}")
+    if falhas:
+        print("\nFALHOU:\n  " + "\n  ".join(falhas))
+        raise SystemExit(1)
+    print(f"\nOK (orçamento {args.orcamento_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+# benchmarks/corpus.py
+# Corpus sintético de NF-e pros benchmarks: as mesmas notas saem como XML NF-e 4.00
+# (nfeProc com protocolo), no CSV ';' que o upload aceita (uma linha por item + TOTAL) e
+# como DANFE em PDF (texto posicionado, layout padrão, com FOLHA n/N). Itens variam em
+# quantidade e grupo de imposto: ICMS00/10/20/60, IPITrib/IPINT/sem IPI, PIS/COFINS
+# Aliq/NT, com totais batendo entre itens e ICMSTot. Determinístico pela seed.
+# Uso (raiz do repo): python -m benchmarks.corpus --notas 200 --saida /tmp/corpus
+
+import os
+import random
+import argparse
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+_PRODUTOS = (
+    ("PARAFUSO SEXTAVADO ZINCADO M8X40", "73181500", "UN"),
+    ("ARRUELA LISA ACO CARBONO 3/8", "73182200", "UN"),
+    ("CABO FLEXIVEL 2,5MM 750V AZUL", "85444900", "M"),
+    ("DISJUNTOR TERMOMAGNETICO 32A", "85362000", "UN"),
+    ("TINTA ACRILICA FOSCA BRANCA 18L", "32091010", "GL"),
+    ("CIMENTO PORTLAND CP II 50KG", "25232910", "SC"),
+    ("OLEO LUBRIFICANTE 15W40 1L", "27101932", "LT"),
+    ("PNEU 175/70 R13", "40111000", "UN"),
+    ("NOTEBOOK 15 POL 8GB SSD 256GB", "84713012", "UN"),
+    ("PAPEL SULFITE A4 75G 500FLS", "48025610", "PCT"),
+    ("CAFE TORRADO E MOIDO 500G", "09012100", "PCT"),
+    ("REFRIGERANTE COLA 2L", "22021000", "UN"),
+)
+_CIDADES = (("SAO PAULO", "SP", "3550308"), ("CAMPINAS", "SP", "3509502"), ("CURITIBA", "PR", "4106902"),
+            ("BELO HORIZONTE", "MG", "3106200"), ("PORTO ALEGRE", "RS", "4314902"))
+_RAZOES = ("COMERCIO", "DISTRIBUIDORA", "INDUSTRIA", "ATACADO", "FERRAGENS", "ALIMENTOS")
+
+# Grupo de ICMS -> (peso no sorteio, CST, CFOP)
+_GRUPOS_ICMS = {
+    "ICMS00": (50, "00", "5102"),
+    "ICMS10": (15, "10", "5401"),
+    "ICMS20": (15, "20", "5102"),
+    "ICMS60": (20, "60", "5405"),
+}
+
+
+def _dv_cnpj(base):
+    for pesos in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        resto = sum(int(d) * p for d, p in zip(base, pesos)) % 11
+        base += str(0 if resto < 2 else 11 - resto)
+    return base
+
+
+def _dv_chave(base):
+    # Mesmo cálculo que processors.chave_acesso.chave_valida confere
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(base)))
+    dv = 11 - soma % 11
+    return base + str(0 if dv >= 10 else dv)
+
+
+def gerar_empresas(rnd, quantidade):
+    empresas = []
+    for n in range(quantidade):
+        cidade, uf, cod_mun = rnd.choice(_CIDADES)
+        empresas.append({
+            "cnpj": _dv_cnpj(f"{rnd.randrange(10**7, 10**8)}0001"),
+            "nome": f"{rnd.choice(_RAZOES)} {chr(65 + n % 26)}{n} LTDA",
+            "ie": str(rnd.randrange(10**11, 10**12)),
+            "lgr": f"RUA {rnd.choice(('DAS FLORES', 'XV DE NOVEMBRO', 'SETE DE SETEMBRO', 'DO COMERCIO'))}",
+            "nro": str(rnd.randint(1, 3000)),
+            "bairro": "CENTRO",
+            "mun": cidade,
+            "uf": uf,
+            "cod_mun": cod_mun,
+            "cep": f"{rnd.randrange(10**7, 10**8)}",
+        })
+    return empresas
+
+
+def _r(valor):
+    return round(valor + 1e-9, 2)
+
+
+def _gerar_item(rnd, n):
+    descricao, ncm, unidade = rnd.choice(_PRODUTOS)
+    quantidade = rnd.randint(1, 50)
+    unitario = _r(rnd.uniform(1, 500))
+    total = _r(quantidade * unitario)
+    grupo = rnd.choices(list(_GRUPOS_ICMS), weights=[g[0] for g in _GRUPOS_ICMS.values()])[0]
+    _, cst_icms, cfop = _GRUPOS_ICMS[grupo]
+    item = {
+        "n": n, "codigo": f"P{rnd.randint(1, 9999):05d}", "descricao": descricao, "ncm": ncm,
+        "cfop": cfop, "unidade": unidade, "quantidade": quantidade, "valor_unitario": unitario,
+        "valor_total": total, "grupo_icms": grupo, "cst_icms": cst_icms,
+        "aliq_icms": 0.0, "red_bc": 0.0, "bc_icms": 0.0, "icms_valor": 0.0,
+        "mva": 0.0, "bc_st": 0.0, "aliq_st": 0.0, "st_valor": 0.0,
+    }
+
+    sorteio = rnd.random()  # IPI: 40% tributado, 30% não tributado, 30% sem grupo IPI
+    if sorteio < 0.4:
+        aliq_ipi = rnd.choice((5.0, 10.0, 15.0))
+        item.update(grupo_ipi="IPITrib", cst_ipi="50", aliq_ipi=aliq_ipi, ipi_valor=_r(total * aliq_ipi / 100))
+    elif sorteio < 0.7:
+        item.update(grupo_ipi="IPINT", cst_ipi="53", aliq_ipi=0.0, ipi_valor=0.0)
+    else:
+        item.update(grupo_ipi=None, cst_ipi="", aliq_ipi=0.0, ipi_valor=0.0)
+
+    if grupo != "ICMS60":
+        item["aliq_icms"] = rnd.choice((7.0, 12.0, 18.0))
+        item["red_bc"] = 33.33 if grupo == "ICMS20" else 0.0
+        item["bc_icms"] = _r(total * (1 - item["red_bc"] / 100))
+        item["icms_valor"] = _r(item["bc_icms"] * item["aliq_icms"] / 100)
+    if grupo == "ICMS10":
+        item.update(mva=40.0, aliq_st=18.0)
+        item["bc_st"] = _r((total + item["ipi_valor"]) * 1.4)
+        item["st_valor"] = max(0.0, _r(item["bc_st"] * 0.18 - item["icms_valor"]))
+
+    if rnd.random() < 0.8:  # PIS/COFINS não cumulativo; o resto monofásico (NT, CST 04)
+        item.update(grupo_pis="Aliq", cst_pis="01", pis_valor=_r(total * 0.0165),
+                    cst_cofins="01", cofins_valor=_r(total * 0.076))
+    else:
+        item.update(grupo_pis="NT", cst_pis="04", pis_valor=0.0, cst_cofins="04", cofins_valor=0.0)
+    return item
+
+
+def _itens_na_nota(rnd, minimo, maximo):
+    # Maioria das notas com poucos itens, cauda longa até o máximo
+    return minimo + int((maximo - minimo) * rnd.random() ** 3)
+
+
+def gerar_notas(quantidade, seed=42, itens_min=1, itens_max=40, empresas=12):
+    """
+    Notas estruturadas (dicts) do corpus. A primeira empresa é a "usuária": emitente
+    de metade das notas (Saída) e destinatária da outra metade (Entrada).
+    Retorna (usuario, notas).
+    """
+    rnd = random.Random(seed)
+    cadastro = gerar_empresas(rnd, empresas)
+    usuario, parceiros = cadastro[0], cadastro[1:]
+    inicio = date(2024, 1, 1)
+    notas = []
+    for numero in range(1, quantidade + 1):
+        saida = rnd.random() < 0.5
+        parceiro = rnd.choice(parceiros)
+        emitente, destinatario = (usuario, parceiro) if saida else (parceiro, usuario)
+        emissao = inicio + timedelta(days=rnd.randrange(365))
+        itens = [_gerar_item(rnd, n) for n in range(1, _itens_na_nota(rnd, itens_min, itens_max) + 1)]
+        chave = _dv_chave(
+            f"{_codigo_uf(emitente['uf'])}{emissao:%y%m}{emitente['cnpj']}55001{numero:09d}1{rnd.randrange(10**8):08d}"
+        )
+        totais = {
+            "bc_icms": _r(sum(i["bc_icms"] for i in itens)),
+            "icms": _r(sum(i["icms_valor"] for i in itens)),
+            "bc_st": _r(sum(i["bc_st"] for i in itens)),
+            "st": _r(sum(i["st_valor"] for i in itens)),
+            "produtos": _r(sum(i["valor_total"] for i in itens)),
+            "ipi": _r(sum(i["ipi_valor"] for i in itens)),
+            "pis": _r(sum(i["pis_valor"] for i in itens)),
+            "cofins": _r(sum(i["cofins_valor"] for i in itens)),
+        }
+        totais["nota"] = _r(totais["produtos"] + totais["st"] + totais["ipi"])
+        notas.append({
+            "numero": numero, "serie": "1", "chave": chave, "data_emissao": emissao,
+            "natureza_operacao": "VENDA DE MERCADORIA" if rnd.random() < 0.85 else "REMESSA PARA CONSERTO",
+            "emitente": emitente, "destinatario": destinatario, "itens": itens, "totais": totais,
+            "protocolo": f"1{rnd.randrange(10**13, 10**14)}",
+        })
+    return usuario, notas
+
+
+def _codigo_uf(uf):
+    return {"SP": "35", "PR": "41", "MG": "31", "RS": "43"}[uf]
+
+
+# 🔹 XML NF-e 4.00
+
+def _f(valor, casas=2):
+    return f"{valor:.{casas}f}"
+
+
+def _endereco_xml(tag, e):
+    return (
+        f"<{tag}><xLgr>{escape(e['lgr'])}</xLgr><nro>{e['nro']}</nro><xBairro>{e['bairro']}</xBairro>"
+        f"<cMun>{e['cod_mun']}</cMun><xMun>{e['mun']}</xMun><UF>{e['uf']}</UF><CEP>{e['cep']}</CEP>"
+        f"<cPais>1058</cPais><xPais>BRASIL</xPais></{tag}>"
+    )
+
+
+def _icms_xml(i):
+    g = i["grupo_icms"]
+    if g == "ICMS60":
+        corpo = "<vBCSTRet>0.00</vBCSTRet><pST>18.0000</pST><vICMSSubstituto>0.00</vICMSSubstituto><vICMSSTRet>0.00</vICMSSTRet>"
+    else:
+        corpo = "<modBC>3</modBC>"
+        if g == "ICMS20":
+            corpo += f"<pRedBC>{_f(i['red_bc'], 4)}</pRedBC>"
+        corpo += f"<vBC>{_f(i['bc_icms'])}</vBC><pICMS>{_f(i['aliq_icms'], 4)}</pICMS><vICMS>{_f(i['icms_valor'])}</vICMS>"
+        if g == "ICMS10":
+            corpo += (
+                f"<modBCST>4</modBCST><pMVAST>{_f(i['mva'], 4)}</pMVAST><vBCST>{_f(i['bc_st'])}</vBCST>"
+                f"<pICMSST>{_f(i['aliq_st'], 4)}</pICMSST><vICMSST>{_f(i['st_valor'])}</vICMSST>"
+            )
+    return f"<ICMS><{g}><orig>0</orig><CST>{i['cst_icms']}</CST>{corpo}</{g}></ICMS>"
+
+
+def _det_xml(i):
+    ipi = ""
+    if i["grupo_ipi"] == "IPITrib":
+        ipi = (f"<IPI><cEnq>999</cEnq><IPITrib><CST>50</CST><vBC>{_f(i['valor_total'])}</vBC>"
+               f"<pIPI>{_f(i['aliq_ipi'], 4)}</pIPI><vIPI>{_f(i['ipi_valor'])}</vIPI></IPITrib></IPI>")
+    elif i["grupo_ipi"] == "IPINT":
+        ipi = "<IPI><cEnq>999</cEnq><IPINT><CST>53</CST></IPINT></IPI>"
+    if i["grupo_pis"] == "Aliq":
+        pis = (f"<PIS><PISAliq><CST>01</CST><vBC>{_f(i['valor_total'])}</vBC><pPIS>1.6500</pPIS>"
+               f"<vPIS>{_f(i['pis_valor'])}</vPIS></PISAliq></PIS>")
+        cofins = (f"<COFINS><COFINSAliq><CST>01</CST><vBC>{_f(i['valor_total'])}</vBC><pCOFINS>7.6000</pCOFINS>"
+                  f"<vCOFINS>{_f(i['cofins_valor'])}</vCOFINS></COFINSAliq></COFINS>")
+    else:
+        pis = "<PIS><PISNT><CST>04</CST></PISNT></PIS>"
+        cofins = "<COFINS><COFINSNT><CST>04</CST></COFINSNT></COFINS>"
+    return (
+        f"<det nItem=\"{i['n']}\"><prod><cProd>{i['codigo']}</cProd><cEAN>SEM GTIN</cEAN>"
+        f"<xProd>{escape(i['descricao'])}</xProd><NCM>{i['ncm']}</NCM><CFOP>{i['cfop']}</CFOP>"
+        f"<uCom>{i['unidade']}</uCom><qCom>{_f(i['quantidade'], 4)}</qCom><vUnCom>{_f(i['valor_unitario'], 10)}</vUnCom>"
+        f"<vProd>{_f(i['valor_total'])}</vProd><cEANTrib>SEM GTIN</cEANTrib><uTrib>{i['unidade']}</uTrib>"
+        f"<qTrib>{_f(i['quantidade'], 4)}</qTrib><vUnTrib>{_f(i['valor_unitario'], 10)}</vUnTrib><indTot>1</indTot></prod>"
+        f"<imposto>{_icms_xml(i)}{ipi}{pis}{cofins}</imposto></det>"
+    )
+
+
+def nota_xml(nota):
+    """
+    nfeProc (NF-e 4.00 + protNFe) da nota, como o SEFAZ devolve pro emitente.
+    """
+    e, d, t = nota["emitente"], nota["destinatario"], nota["totais"]
+    emissao = f"{nota['data_emissao'].isoformat()}T10:{nota['numero'] % 60:02d}:00-03:00"
+    saida = "1"  # Toda nota do corpus é de saída do ponto de vista do emitente
+    interestadual = "2" if e["uf"] != d["uf"] else "1"
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe>'
+        f'<infNFe Id="NFe{nota["chave"]}" versao="4.00">'
+        f"<ide><cUF>{nota['chave'][:2]}</cUF><cNF>{nota['chave'][35:43]}</cNF><natOp>{nota['natureza_operacao']}</natOp>"
+        f"<mod>55</mod><serie>{nota['serie']}</serie><nNF>{nota['numero']}</nNF><dhEmi>{emissao}</dhEmi>"
+        f"<tpNF>{saida}</tpNF><idDest>{interestadual}</idDest><cMunFG>{e['cod_mun']}</cMunFG><tpImp>1</tpImp>"
+        f"<tpEmis>1</tpEmis><cDV>{nota['chave'][-1]}</cDV><tpAmb>1</tpAmb><finNFe>1</finNFe><indFinal>0</indFinal>"
+        "<indPres>1</indPres><procEmi>0</procEmi><verProc>1.0</verProc></ide>"
+        f"<emit><CNPJ>{e['cnpj']}</CNPJ><xNome>{escape(e['nome'])}</xNome>{_endereco_xml('enderEmit', e)}"
+        f"<IE>{e['ie']}</IE><CRT>3</CRT></emit>"
+        f"<dest><CNPJ>{d['cnpj']}</CNPJ><xNome>{escape(d['nome'])}</xNome>{_endereco_xml('enderDest', d)}"
+        f"<indIEDest>1</indIEDest><IE>{d['ie']}</IE></dest>"
+        + "".join(_det_xml(i) for i in nota["itens"]) +
+        f"<total><ICMSTot><vBC>{_f(t['bc_icms'])}</vBC><vICMS>{_f(t['icms'])}</vICMS><vICMSDeson>0.00</vICMSDeson>"
+        f"<vFCP>0.00</vFCP><vBCST>{_f(t['bc_st'])}</vBCST><vST>{_f(t['st'])}</vST><vFCPST>0.00</vFCPST>"
+        f"<vFCPSTRet>0.00</vFCPSTRet><vProd>{_f(t['produtos'])}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg>"
+        f"<vDesc>0.00</vDesc><vII>0.00</vII><vIPI>{_f(t['ipi'])}</vIPI><vIPIDevol>0.00</vIPIDevol>"
+        f"<vPIS>{_f(t['pis'])}</vPIS><vCOFINS>{_f(t['cofins'])}</vCOFINS><vOutro>0.00</vOutro>"
+        f"<vNF>{_f(t['nota'])}</vNF></ICMSTot></total>"
+        "<transp><modFrete>9</modFrete></transp>"
+        f"<pag><detPag><tPag>15</tPag><vPag>{_f(t['nota'])}</vPag></detPag></pag>"
+        "</infNFe></NFe>"
+        f"<protNFe versao=\"4.00\"><infProt><tpAmb>1</tpAmb><verAplic>SP_NFE_PL009_V4</verAplic>"
+        f"<chNFe>{nota['chave']}</chNFe><dhRecbto>{emissao}</dhRecbto><nProt>{nota['protocolo']}</nProt>"
+        "<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe></nfeProc>"
+    )
+
+
+# 🔹 CSV (layout do upload: uma linha por item + linha TOTAL por nota)
+
+COLUNAS_CSV = (
+    "numero_nota", "chave_acesso", "serie", "data_emissao", "emitente_cnpj", "emitente_razao_social",
+    "emitente_ie", "emitente_endereco", "destinatario_cnpj", "destinatario_razao_social", "destinatario_ie",
+    "destinatario_endereco", "natureza_operacao", "item", "produto_codigo", "produto_descricao", "produto_ncm",
+    "produto_cfop", "produto_unidade", "produto_quantidade", "produto_valor_unitario", "produto_valor_total",
+    "icms_cst", "icms_valor", "ipi_cst", "ipi_valor", "pis_cst", "pis_valor", "cofins_cst", "cofins_valor",
+    "cest", "valor_total_nota",
+)
+
+
+def _cnpj_formatado(cnpj):
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def _endereco_texto(e):
+    return f"{e['lgr']} {e['nro']} - {e['mun']}/{e['uf']}"
+
+
+def linhas_csv(nota):
+    e, d = nota["emitente"], nota["destinatario"]
+    base = [
+        str(nota["numero"]), nota["chave"], nota["serie"], nota["data_emissao"].isoformat(),
+        _cnpj_formatado(e["cnpj"]), e["nome"], e["ie"], _endereco_texto(e),
+        _cnpj_formatado(d["cnpj"]), d["nome"], d["ie"], _endereco_texto(d), nota["natureza_operacao"],
+    ]
+    for i in nota["itens"]:
+        yield ";".join(base + [
+            str(i["n"]), i["codigo"], i["descricao"], i["ncm"], i["cfop"], i["unidade"], str(i["quantidade"]),
+            _f(i["valor_unitario"]), _f(i["valor_total"]), i["cst_icms"], _f(i["icms_valor"]),
+            i["cst_ipi"], _f(i["ipi_valor"]), i["cst_pis"], _f(i["pis_valor"]), i["cst_cofins"],
+            _f(i["cofins_valor"]), "", "",
+        ])
+    yield ";".join(base + ["TOTAL"] + [""] * 17 + [_f(nota["totais"]["nota"])])
+
+
+def notas_csv(notas):
+    return "\n".join([";".join(COLUNAS_CSV)] + [linha for nota in notas for linha in linhas_csv(nota)]) + "\n"
+
+
+# 🔹 DANFE (PDF com texto posicionado, Helvetica/WinAnsi, sem dependências)
+
+_LARGURA, _ALTURA = 595, 842
+_ITENS_PRIMEIRA_FOLHA = 65
+_ITENS_POR_FOLHA = 95
+_COLUNAS_DANFE = (
+    (20, "CÓDIGO"), (60, "DESCRIÇÃO DO PRODUTO / SERVIÇO"), (210, "NCM/SH"), (245, "O/CST"), (268, "CFOP"),
+    (292, "UN"), (310, "QUANT"), (345, "VALOR UNIT"), (390, "VALOR TOTAL"), (440, "VALOR ICMS"),
+    (485, "VALOR IPI"), (525, "ALÍQ. ICMS"),
+)
+
+
+def _br(valor, casas=2):
+    return f"{valor:,.{casas}f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _pdf_escape(texto):
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_bytes(paginas):
+    """
+    PDF mínimo: cada página é uma lista de (x, topo, tamanho da fonte, texto).
+    """
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    filhos = " ".join(f"{4 + 2 * n} 0 R" for n in range(len(paginas)))
+    objetos.append(f"<< /Type /Pages /Kids [{filhos}] /Count {len(paginas)} >>".encode())
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for n, textos in enumerate(paginas):
+        conteudo = "".join(
+            f"BT /F1 {t} Tf {x:.2f} {_ALTURA - topo - t:.2f} Td ({_pdf_escape(s)}) Tj ET\n" for x, topo, t, s in textos
+        ).encode("cp1252")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_LARGURA} {_ALTURA}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * n} 0 R >>".encode()
+        )
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"endstream")
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for n, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += f"{n} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    xref = len(saida)
+    saida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for posicao in posicoes:
+        saida += f"{posicao:010d} 00000 n \n".encode()
+    saida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(saida)
+
+
+def _cabecalho_danfe(nota, folhas):
+    e, d, t = nota["emitente"], nota["destinatario"], nota["totais"]
+    chave = nota["chave"]
+    r = 6  # Tamanho dos rótulos
+    return [
+        (20, 20, 7, f"RECEBEMOS DE {e['nome']} OS PRODUTOS CONSTANTES DA NOTA FISCAL INDICADA AO LADO"),
+        (20, 60, r, "IDENTIFICAÇÃO DO EMITENTE"), (20, 70, 9, e["nome"]), (20, 82, 7, _endereco_texto(e)),
+        (250, 60, 10, "DANFE"), (250, 75, 8, f"Nº {nota['numero']:09,d}".replace(",", ".")),
+        (250, 85, 8, f"SÉRIE {nota['serie']}"), (250, 95, 8, f"FOLHA 1/{folhas}"),
+        (350, 60, r, "CHAVE DE ACESSO"), (350, 70, 8, " ".join(chave[n:n + 4] for n in range(0, 44, 4))),
+        (20, 100, r, "NATUREZA DA OPERAÇÃO"), (350, 100, r, "PROTOCOLO DE AUTORIZAÇÃO DE USO"),
+        (20, 108, 8, nota["natureza_operacao"]),
+        (350, 108, 8, f"{nota['protocolo']} {nota['data_emissao']:%d/%m/%Y}"),
+        (20, 125, r, "INSCRIÇÃO ESTADUAL"), (200, 125, r, "INSC.ESTADUAL DO SUBST. TRIB."), (400, 125, r, "CNPJ"),
+        (20, 133, 8, e["ie"]), (400, 133, 8, _cnpj_formatado(e["cnpj"])),
+        (20, 155, 7, "DESTINATÁRIO / REMETENTE"),
+        (20, 165, r, "NOME / RAZÃO SOCIAL"), (330, 165, r, "CNPJ / CPF"), (470, 165, r, "DATA DA EMISSÃO"),
+        (20, 173, 8, d["nome"]), (330, 173, 8, _cnpj_formatado(d["cnpj"])),
+        (470, 173, 8, f"{nota['data_emissao']:%d/%m/%Y}"),
+        (20, 185, r, "ENDEREÇO"), (330, 185, r, "INSCRIÇÃO ESTADUAL"),
+        (20, 193, 8, _endereco_texto(d)), (330, 193, 8, d["ie"]),
+        (20, 215, 7, "CÁLCULO DO IMPOSTO"),
+        (20, 225, r, "BASE DE CÁLC. DO ICMS"), (110, 225, r, "VALOR DO ICMS"), (190, 225, r, "VALOR DO ICMS SUBST."),
+        (290, 225, r, "VALOR TOTAL DOS PRODUTOS"),
+        (20, 233, 8, _br(t["bc_icms"])), (110, 233, 8, _br(t["icms"])), (190, 233, 8, _br(t["st"])),
+        (290, 233, 8, _br(t["produtos"])),
+        (20, 243, r, "VALOR DO IPI"), (110, 243, r, "VALOR DO PIS"), (190, 243, r, "VALOR DA COFINS"),
+        (290, 243, r, "VALOR TOTAL DA NOTA"),
+        (20, 251, 8, _br(t["ipi"])), (110, 251, 8, _br(t["pis"])), (190, 251, 8, _br(t["cofins"])),
+        (290, 251, 8, _br(t["nota"])),
+        (20, 268, 7, "DADOS DO PRODUTO / SERVIÇO"),
+    ]
+
+
+def nota_danfe(nota):
+    """
+    DANFE retrato da nota em PDF; itens que não cabem na primeira folha continuam
+    nas seguintes com o cabeçalho da tabela repetido.
+    """
+    itens = nota["itens"]
+    restantes = max(0, len(itens) - _ITENS_PRIMEIRA_FOLHA)
+    folhas = 1 + -(-restantes // _ITENS_POR_FOLHA)
+    pagina = _cabecalho_danfe(nota, folhas)
+    paginas = [pagina]
+    topo_tabela, topo = 278, 288
+    pagina.extend((x, topo_tabela, 5, rotulo) for x, rotulo in _COLUNAS_DANFE)
+    for n, i in enumerate(itens):
+        if n == _ITENS_PRIMEIRA_FOLHA or (n > _ITENS_PRIMEIRA_FOLHA and (n - _ITENS_PRIMEIRA_FOLHA) % _ITENS_POR_FOLHA == 0):
+            pagina = [(250, 20, 8, f"FOLHA {len(paginas) + 1}/{folhas}")]
+            paginas.append(pagina)
+            pagina.extend((x, 40, 5, rotulo) for x, rotulo in _COLUNAS_DANFE)
+            topo = 50
+        valores = (
+            i["codigo"], i["descricao"], i["ncm"], f"0{i['cst_icms']}", i["cfop"], i["unidade"],
+            _br(i["quantidade"], 4), _br(i["valor_unitario"]), _br(i["valor_total"]), _br(i["icms_valor"]),
+            _br(i["ipi_valor"]), _br(i["aliq_icms"]),
+        )
+        pagina.extend((x, topo, 5, v) for (x, _), v in zip(_COLUNAS_DANFE, valores))
+        topo += 8
+    pagina.append((20, topo + 10, 7, "DADOS ADICIONAIS"))
+    return pdf_bytes(paginas)
+
+
+def escrever_corpus(pasta, notas, formatos=("xml", "csv", "pdf")):
+    """
+    Grava o corpus em pasta/xml/<chave>-nfe.xml, pasta/notas.csv e pasta/pdf/<chave>.pdf.
+    Retorna {formato: lista de caminhos}.
+    """
+    caminhos = {}
+    if "xml" in formatos:
+        os.makedirs(os.path.join(pasta, "xml"), exist_ok=True)
+        caminhos["xml"] = []
+        for nota in notas:
+            caminho = os.path.join(pasta, "xml", f"{nota['chave']}-nfe.xml")
+            with open(caminho, "w", encoding="utf-8") as f:
+                f.write(nota_xml(nota))
+            caminhos["xml"].append(caminho)
+    if "csv" in formatos:
+        caminho = os.path.join(pasta, "notas.csv")
+        with open(caminho, "w", encoding="utf-8", newline="") as f:
+            f.write(notas_csv(notas))
+        caminhos["csv"] = [caminho]
+    if "pdf" in formatos:
+        os.makedirs(os.path.join(pasta, "pdf"), exist_ok=True)
+        caminhos["pdf"] = []
+        for nota in notas:
+            caminho = os.path.join(pasta, "pdf", f"{nota['chave']}.pdf")
+            with open(caminho, "wb") as f:
+                f.write(nota_danfe(nota))
+            caminhos["pdf"].append(caminho)
+    return caminhos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera corpus sintético de NF-e (XML, CSV e DANFE)")
+    parser.add_argument("--notas", type=int, default=200)
+    parser.add_argument("--itens-min", type=int, default=1)
+    parser.add_argument("--itens-max", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--formatos", default="xml,csv,pdf")
+    parser.add_argument("--saida", required=True)
+    args = parser.parse_args()
+
+    usuario, notas = gerar_notas(args.notas, args.seed, args.itens_min, args.itens_max)
+    caminhos = escrever_corpus(args.saida, notas, args.formatos.split(","))
+    itens = sum(len(n["itens"]) for n in notas)
+    print(f"{len(notas)} notas ({itens} itens) em {args.saida}: "
+          + ", ".join(f"{len(c)} {formato}" for formato, c in caminhos.items()))
+    print(f"CNPJ do usuário (emitente/destinatário das notas): {usuario['cnpj']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# benchmarks/paridade_xml.py
+# Paridade do extrator de NF-e (processors/xml_processor: extrair_nfe e processar_xml)
+# com a implementação anterior (um find() por campo), copiada abaixo como referência.
+# Roda sobre o corpus sintético (benchmarks/corpus.py: ICMS00/10/20/60, IPITrib/IPINT/sem
+# IPI, PIS/COFINS Aliq/NT) com user_cnpj vazio, do emitente, do destinatário e de
+# terceiro, e cada nota também com <ICMSTot> vazio (totais no default) e sem ele (None).
+# Sai com 1 se algum dict diferir. Diferença intencional, fora da comparação:
+# nota sem <dest> (NFC-e) agora é lida; a referência devolvia None.
+# Uso (raiz do repo):
+#   python -m benchmarks.paridade_xml
+#   python -m benchmarks.paridade_xml --notas 500 --itens-max 60 --seed 7
+
+import io
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+
+import benchmarks  # noqa: F401  (src/ no sys.path)
+from benchmarks.corpus import gerar_notas, nota_xml
+from processors.xml_processor import extrair_nfe, processar_xml, NS
+
+TERCEIRO = "99999999000191"
+
+
+def _referencia_processar_xml(caminho_arquivo, user_cnpj=""):
+    """
+    processar_xml antes da passagem única (mesma lógica; só o logging foi tirado).
+    """
+    try:
+        tree = ET.parse(caminho_arquivo)
+        root = tree.getroot()
+        ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+
+        ide = root.find('.//nfe:ide', ns)
+        if ide is None:
+            return None
+        numero = ide.find('nfe:nNF', ns).text if ide.find('nfe:nNF', ns) is not None else ''
+        data_emissao_elem = ide.find('nfe:dhEmi', ns)
+        data_emissao = data_emissao_elem.text[:10] if data_emissao_elem is not None else ''
+        natureza_operacao = ide.find('nfe:natOp', ns).text if ide.find('nfe:natOp', ns) is not None else ''
+        tp_nf = ide.find('nfe:tpNF', ns)
+        tipo_base = 'Saída' if tp_nf is not None and tp_nf.text == '1' else 'Entrada'
+
+        emit = root.find('.//nfe:emit', ns)
+        if emit is None:
+            return None
+        cnpj_emitente = emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else ''
+        nome_emitente = emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else ''
+        ie_emitente = emit.find('nfe:IE', ns).text if emit.find('nfe:IE', ns) is not None else ''
+        x_lgr = emit.find('.//nfe:xLgr', ns)
+        nro = emit.find('.//nfe:nro', ns)
+        x_bairro = emit.find('.//nfe:xBairro', ns)
+        x_mun = emit.find('.//nfe:xMun', ns)
+        uf = emit.find('.//nfe:UF', ns)
+        endereco_emitente = f"{x_lgr.text if x_lgr is not None else ''} {nro.text if nro is not None else ''}, {x_bairro.text if x_bairro is not None else ''}, {x_mun.text if x_mun is not None else ''} - {uf.text if uf is not None else ''}"
+
+        dest = root.find('.//nfe:dest', ns)
+        cnpj_destinatario = dest.find('nfe:CNPJ', ns).text if dest.find('nfe:CNPJ', ns) is not None else None
+        nome_destinatario = dest.find('nfe:xNome', ns).text if dest.find('nfe:xNome', ns) is not None else ''
+        ie_destinatario = dest.find('nfe:IE', ns).text if dest.find('nfe:IE', ns) is not None else None
+        x_lgr_dest = dest.find('.//nfe:xLgr', ns)
+        nro_dest = dest.find('.//nfe:nro', ns)
+        x_bairro_dest = dest.find('.//nfe:xBairro', ns)
+        x_mun_dest = dest.find('.//nfe:xMun', ns)
+        uf_dest = dest.find('.//nfe:UF', ns)
+        endereco_destinatario = f"{x_lgr_dest.text if x_lgr_dest is not None else ''} {nro_dest.text if nro_dest is not None else ''}, {x_bairro_dest.text if x_bairro_dest is not None else ''}, {x_mun_dest.text if x_mun_dest is not None else ''} - {uf_dest.text if uf_dest is not None else ''}"
+
+        if user_cnpj:
+            if user_cnpj == cnpj_emitente:
+                tipo_operacao = 'Saída'
+            elif user_cnpj == cnpj_destinatario:
+                tipo_operacao = 'Entrada'
+            else:
+                tipo_operacao = 'Desconhecida'
+        else:
+            tipo_operacao = tipo_base
+
+        icms_tot = root.find('.//nfe:ICMSTot', ns)
+        if icms_tot is None:
+            return None
+        valor_total_nota = icms_tot.find('nfe:vNF', ns).text if icms_tot.find('nfe:vNF', ns) is not None else '0.00'
+        v_icms_total = icms_tot.find('nfe:vICMS', ns).text if icms_tot.find('nfe:vICMS', ns) is not None else '0.00'
+        v_pis_total = icms_tot.find('nfe:vPIS', ns).text if icms_tot.find('nfe:vPIS', ns) is not None else '0.00'
+        v_cofins_total = icms_tot.find('nfe:vCOFINS', ns).text if icms_tot.find('nfe:vCOFINS', ns) is not None else '0.00'
+
+        inf_nfe = root.find('.//nfe:infNFe', ns)
+        chave_nfe = inf_nfe.get('Id').replace('NFe', '') if inf_nfe is not None else ''
+
+        itens = []
+        for det in root.findall('.//nfe:det', ns):
+            prod = det.find('nfe:prod', ns)
+            if prod is None:
+                continue
+            c_prod = prod.find('nfe:cProd', ns).text if prod.find('nfe:cProd', ns) is not None else ''
+            x_prod = prod.find('nfe:xProd', ns).text if prod.find('nfe:xProd', ns) is not None else ''
+            ncm = prod.find('nfe:NCM', ns).text if prod.find('nfe:NCM', ns) is not None else ''
+            cfop = prod.find('nfe:CFOP', ns).text if prod.find('nfe:CFOP', ns) is not None else ''
+            u_com = prod.find('nfe:uCom', ns).text if prod.find('nfe:uCom', ns) is not None else ''
+            q_com = prod.find('nfe:qCom', ns).text if prod.find('nfe:qCom', ns) is not None else '0'
+            v_un_com = prod.find('nfe:vUnCom', ns).text if prod.find('nfe:vUnCom', ns) is not None else '0.00'
+            v_prod = prod.find('nfe:vProd', ns).text if prod.find('nfe:vProd', ns) is not None else '0.00'
+
+            icms_item = det.find('.//nfe:ICMS00', ns) or det.find('.//nfe:ICMS10', ns)
+            v_icms_item = float(icms_item.find('nfe:vICMS', ns).text if icms_item is not None and icms_item.find('nfe:vICMS', ns) is not None else '0.00')
+            cst_icms = icms_item.find('nfe:CST', ns).text if icms_item is not None and icms_item.find('nfe:CST', ns) is not None else ''
+
+            pis_item = det.find('.//nfe:PISAliq', ns)
+            v_pis_item = float(pis_item.find('nfe:vPIS', ns).text if pis_item is not None and pis_item.find('nfe:vPIS', ns) is not None else '0.00')
+            cst_pis = pis_item.find('nfe:CST', ns).text if pis_item is not None and pis_item.find('nfe:CST', ns) is not None else ''
+
+            cofins_item = det.find('.//nfe:COFINSAliq', ns)
+            v_cofins_item = float(cofins_item.find('nfe:vCOFINS', ns).text if cofins_item is not None and cofins_item.find('nfe:vCOFINS', ns) is not None else '0.00')
+            cst_cofins = cofins_item.find('nfe:CST', ns).text if cofins_item is not None and cofins_item.find('nfe:CST', ns) is not None else ''
+
+            ipi_item = det.find('.//nfe:IPI', ns)
+            v_ipi_item = float(ipi_item.find('.//nfe:vIPI', ns).text if ipi_item is not None and ipi_item.find('.//nfe:vIPI', ns) is not None else '0.00')
+            cst_ipi = ipi_item.find('.//nfe:CST', ns).text if ipi_item is not None and ipi_item.find('.//nfe:CST', ns) is not None else cst_icms
+
+            itens.append({
+                'nota_id': None,
+                'codigo_produto': c_prod,
+                'descricao_produto': x_prod,
+                'ncm': ncm,
+                'cst_ipi': cst_ipi,
+                'cfop': cfop,
+                'unidade': u_com,
+                'quantidade': q_com,
+                'valor_unitario': v_un_com,
+                'valor_total': v_prod,
+                'cst_icms': cst_icms,
+                'cst_pis': cst_pis,
+                'cst_cofins': cst_cofins,
+                'cest': None,
+                'icms_valor': v_icms_item,
+                'ipi_valor': v_ipi_item,
+                'pis_valor': v_pis_item,
+                'cofins_valor': v_cofins_item
+            })
+
+        return {
+            'numero': numero,
+            'data_emissao': data_emissao,
+            'cnpj_emitente': cnpj_emitente,
+            'nome_emitente': nome_emitente,
+            'ie_emitente': ie_emitente,
+            'endereco_emitente': endereco_emitente,
+            'cnpj_destinatario': cnpj_destinatario,
+            'nome_destinatario': nome_destinatario,
+            'ie_destinatario': ie_destinatario,
+            'endereco_destinatario': endereco_destinatario,
+            'chave_nfe': chave_nfe,
+            'natureza_operacao': natureza_operacao,
+            'valor_total_nota': valor_total_nota,
+            'tipo_operacao': tipo_operacao,
+            'versao': '4.00',
+            'v_icms': v_icms_total,
+            'v_pis': v_pis_total,
+            'v_cofins': v_cofins_total,
+            'itens': itens
+        }
+
+    except Exception:
+        return None
+
+
+def _diferencas(esperado, obtido, caminho="nota"):
+    """
+    Lista de "caminho: esperado != obtido" (vazia = iguais, inclusive ordem das chaves e tipos).
+    """
+    if isinstance(esperado, dict) and isinstance(obtido, dict):
+        if list(esperado) != list(obtido):
+            return [f"{caminho}: chaves {list(esperado)} != {list(obtido)}"]
+        return [d for chave in esperado for d in _diferencas(esperado[chave], obtido[chave], f"{caminho}.{chave}")]
+    if isinstance(esperado, list) and isinstance(obtido, list):
+        if len(esperado) != len(obtido):
+            return [f"{caminho}: {len(esperado)} itens != {len(obtido)}"]
+        return [d for i, (e, o) in enumerate(zip(esperado, obtido)) for d in _diferencas(e, o, f"{caminho}[{i}]")]
+    if type(esperado) is not type(obtido) or esperado != obtido:
+        return [f"{caminho}: {esperado!r} != {obtido!r}"]
+    return []
+
+
+def _variantes(xml):
+    """
+    (rótulo, bytes) da nota original, com <ICMSTot> sem filhos e sem <ICMSTot>.
+    """
+    yield "", xml
+    for rotulo in ("ICMSTot vazio", "sem ICMSTot"):
+        raiz = ET.fromstring(xml)
+        for total in raiz.iter(NS + "total"):
+            for icms_tot in total.findall(NS + "ICMSTot"):
+                if rotulo == "sem ICMSTot":
+                    total.remove(icms_tot)
+                else:
+                    icms_tot.clear()
+        yield rotulo, ET.tostring(raiz)
+
+
+def _args():
+    parser = argparse.ArgumentParser(description="Paridade do extrator de NF-e com a implementação anterior")
+    parser.add_argument("--notas", type=int, default=200)
+    parser.add_argument("--itens-max", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mostrar", type=int, default=10, help="Quantas diferenças imprimir")
+    return parser.parse_args()
+
+
+def main():
+    args = _args()
+    logging.disable(logging.CRITICAL)  # Erros esperados (nota inválida) não poluem a saída
+    usuario, notas = gerar_notas(args.notas, seed=args.seed, itens_max=args.itens_max)
+
+    comparacoes, diferencas = 0, []
+    for nota in notas:
+        cnpjs = ("", nota["emitente"]["cnpj"], nota["destinatario"]["cnpj"], TERCEIRO)
+        for rotulo, xml in _variantes(nota_xml(nota).encode("utf-8")):
+            inf_nfe = next(ET.fromstring(xml).iter(NS + "infNFe"))
+            for user_cnpj in cnpjs:
+                esperado = _referencia_processar_xml(io.BytesIO(xml), user_cnpj)
+                for nome, obtido in (
+                    ("extrair_nfe", extrair_nfe(inf_nfe, user_cnpj)),
+                    ("processar_xml", processar_xml(io.BytesIO(xml), user_cnpj)),
+                ):
+                    comparacoes += 1
+                    diferencas.extend(
+                        f"N{nota['numero']}{f' ({rotulo})' if rotulo else ''} {nome} user_cnpj={user_cnpj or '-'} {d}"
+                        for d in _diferencas(esperado, obtido)
+                    )
+
+    itens = sum(len(nota["itens"]) for nota in notas)
+    print(f"{len(notas)} notas ({itens} itens), {comparacoes} comparações com a referência")
+    if diferencas:
+        print(f"\nFALHOU: {len(diferencas)} diferença(s)\n  " + "\n  ".join(diferencas[:args.mostrar]))
+        raise SystemExit(1)
+    print("OK: saída idêntica à implementação anterior")
+
+
+if __name__ == "__main__":
+    main()
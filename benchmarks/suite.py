@@ -0,0 +1,323 @@
+# benchmarks/suite.py
+# Suíte de benchmarks do pipeline sobre o corpus sintético (benchmarks/corpus.py):
+# parse de XML (processar_xml), texto de PDF (extrair_texto_pdf), leitura local do DANFE,
+# gravação (salvar_nota_no_db, um a um e em lote), importação de CSV (importar_csv, o
+# ramo CSV do upload) e contexto do chat (construir_contexto_chat). Cada caso roda num
+# processo novo (spawn), com SQLite próprio e logs desligados, e reporta vazão, latência
+# por unidade e pico de RSS do processo. Compara com um baseline JSON salvo antes.
+# Uso (raiz do repo):
+#   python -m benchmarks.suite --salvar-baseline              # grava benchmarks/baseline.json
+#   python -m benchmarks.suite --comparar                     # sai com 1 se algo piorou > tolerância
+#   python -m benchmarks.suite --casos xml,csv --notas 500 --comparar outro.json --tolerancia 0.15
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+_PERGUNTAS_CHAT = (
+    "quanto comprei de parafuso?",
+    "quais notas de cimento no mes de marco?",
+    "total de icms das vendas de notebook",
+    "me mostre as compras de tinta acrilica",
+    "qual o valor do ipi nas notas de pneu?",
+    "cafe e refrigerante comprados em 2024",
+)
+
+
+def _pico_rss_mb():
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024  # macOS: bytes; Linux: KB
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(len(ordenados) * p) - 1)]
+
+
+def _cronometrar(chamadas, repeticoes, antes_de_cada=None):
+    """
+    Roda a lista de chamadas `repeticoes` vezes (antes_de_cada() sem cronometrar, no
+    início de cada passada). Retorna (latências em ms, segundos totais).
+    """
+    latencias, total = [], 0.0
+    for _ in range(repeticoes):
+        if antes_de_cada:
+            antes_de_cada()
+        for chamada in chamadas:
+            inicio = time.perf_counter()
+            chamada()
+            decorrido = time.perf_counter() - inicio
+            latencias.append(decorrido * 1000)
+            total += decorrido
+    return latencias, total
+
+
+def _resultado(unidade, unidades, latencias, segundos, **extra):
+    return {
+        "unidade": unidade,
+        "por_segundo": round(unidades / segundos, 2) if segundos else 0.0,
+        "p50_ms": round(statistics.median(latencias), 3),
+        "p95_ms": round(_percentil(latencias, 0.95), 3),
+        **extra,
+    }
+
+
+# 🔹 Casos (rodam no processo filho, depois do DATABASE_URL apontar pro SQLite do caso)
+
+def _recriar_tabelas():
+    from database.connection import engine, Base
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def _notas_parseadas(ctx):
+    from processors.xml_processor import processar_xml
+    # Dono preenchido como na ingestão (analisar_arquivo), pro chat do usuário enxergar as notas
+    return [dict(processar_xml(caminho, ctx["usuario"]), owner_cnpj=ctx["usuario"]) for caminho in ctx["arquivos"]["xml"]]
+
+
+def _caso_xml(ctx):
+    from processors.xml_processor import processar_xml
+    caminhos, usuario = ctx["arquivos"]["xml"], ctx["usuario"]
+    latencias, segundos = _cronometrar([lambda c=c: processar_xml(c, usuario) for c in caminhos], ctx["repeticoes"])
+    vezes = len(caminhos) * ctx["repeticoes"]
+    return _resultado("notas", vezes, latencias, segundos, itens_por_segundo=round(ctx["itens"] * ctx["repeticoes"] / segundos, 1))
+
+
+def _caso_pdf_texto(ctx):
+    from processors.pdf_extractor import extrair_texto_pdf
+    caminhos = ctx["arquivos"]["pdf"]
+    latencias, segundos = _cronometrar([lambda c=c: extrair_texto_pdf(c) for c in caminhos], ctx["repeticoes"])
+    return _resultado("pdfs", len(caminhos) * ctx["repeticoes"], latencias, segundos)
+
+
+def _caso_pdf_danfe(ctx):
+    # Caminho local do upload de PDF: uma leitura (texto + palavras) e o parser do DANFE
+    from processors.pdf_extractor import extrair_pdf
+    from processors.danfe_parser import analisar_paginas
+    caminhos = ctx["arquivos"]["pdf"]
+    confiancas = []
+
+    def ler(caminho):
+        confiancas.append(analisar_paginas(extrair_pdf(caminho, com_palavras=True)["palavras"])["confianca"])
+
+    latencias, segundos = _cronometrar([lambda c=c: ler(c) for c in caminhos], ctx["repeticoes"])
+    return _resultado("pdfs", len(caminhos) * ctx["repeticoes"], latencias, segundos,
+                      confianca_media=round(statistics.mean(confiancas), 3))
+
+
+def _caso_db_salvar(ctx):
+    from services.nota_service import salvar_nota_no_db
+    notas = _notas_parseadas(ctx)
+    latencias, segundos = _cronometrar([lambda n=n: salvar_nota_no_db(n) for n in notas], ctx["repeticoes"], _recriar_tabelas)
+    return _resultado("notas", len(notas) * ctx["repeticoes"], latencias, segundos)
+
+
+def _caso_db_lote(ctx):
+    from services.nota_service import salvar_notas_no_db
+    notas = _notas_parseadas(ctx)
+    lotes = [notas[n:n + 100] for n in range(0, len(notas), 100)]
+    latencias, segundos = _cronometrar([lambda l=l: salvar_notas_no_db(l) for l in lotes], ctx["repeticoes"], _recriar_tabelas)
+    return _resultado("notas", len(notas) * ctx["repeticoes"], latencias, segundos, latencia="por lote de 100")
+
+
+def _caso_csv(ctx):
+    from services.ingestao_service import importar_csv
+    caminho, usuario = ctx["arquivos"]["csv"][0], ctx["usuario"]
+    gravadas = []
+
+    def importar():
+        resultados = importar_csv(caminho, "notas.csv", usuario)
+        gravadas.append(sum(1 for r in resultados if str(r.get("status", "")).startswith("sucesso")))
+
+    latencias, segundos = _cronometrar([importar], ctx["repeticoes"], _recriar_tabelas)
+    if min(gravadas) != ctx["notas"]:
+        raise RuntimeError(f"CSV gravou {min(gravadas)} de {ctx['notas']} notas")
+    return _resultado("notas", ctx["notas"] * ctx["repeticoes"], latencias, segundos, latencia="por arquivo")
+
+
+def _caso_chat_contexto(ctx):
+    from database.connection import SessionLocal
+    from services.nota_service import salvar_notas_no_db
+    from services.contexto_service import construir_contexto_chat, tipo_operacao_pergunta, estimar_tokens
+    salvar_notas_no_db(_notas_parseadas(ctx))
+    db = SessionLocal()
+    try:
+        usuario = ctx["usuario"]
+        inicio = time.perf_counter()
+        construir_contexto_chat(db, usuario, pergunta="aquecimento")  # Indexação FTS inicial fica fora da medida
+        indexacao_ms = (time.perf_counter() - inicio) * 1000
+        tokens = []
+
+        def contexto(pergunta):
+            tokens.append(estimar_tokens(
+                construir_contexto_chat(db, usuario, tipo_operacao_pergunta(pergunta), pergunta=pergunta)
+            ))
+
+        latencias, segundos = _cronometrar([lambda p=p: contexto(p) for p in _PERGUNTAS_CHAT], ctx["repeticoes"])
+    finally:
+        db.close()
+    return _resultado("perguntas", len(_PERGUNTAS_CHAT) * ctx["repeticoes"], latencias, segundos,
+                      tokens_medios=round(statistics.mean(tokens)), primeira_chamada_ms=round(indexacao_ms, 1))
+
+
+CASOS = {
+    "xml": _caso_xml,
+    "pdf_texto": _caso_pdf_texto,
+    "pdf_danfe": _caso_pdf_danfe,
+    "db_salvar": _caso_db_salvar,
+    "db_lote": _caso_db_lote,
+    "csv": _caso_csv,
+    "chat_contexto": _caso_chat_contexto,
+}
+
+
+def _executar_caso(nome, ctx):
+    """
+    Alvo do processo filho: banco e índice de busca próprios, imports da aplicação só
+    depois do ambiente configurado (a engine nasce no import de database.connection).
+    """
+    pasta_caso = os.path.join(ctx["pasta"], nome)
+    os.makedirs(pasta_caso, exist_ok=True)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(pasta_caso, 'bench.db')}"
+    os.environ["CHAT_BUSCA_SQLITE"] = os.path.join(pasta_caso, "busca.db")
+    os.environ.setdefault("PDF_ISOLADO", "0")
+    import benchmarks  # noqa: F401  (src/ no sys.path do processo filho)
+    logging.disable(logging.CRITICAL)  # Mede o processamento, não o volume de log em DEBUG
+
+    import models.nota_fiscal, models.usuario, models.resumo_mensal  # noqa: F401,E401  (tabelas no metadata)
+    import models.versao_dados, models.extracao_pdf, models.job_ingestao  # noqa: F401,E401
+    from database.connection import engine, Base
+    Base.metadata.create_all(bind=engine)
+
+    rss_antes = _pico_rss_mb()
+    resultado = CASOS[nome](ctx)
+    resultado["rss_antes_mb"] = round(rss_antes, 1)
+    resultado["pico_rss_mb"] = round(_pico_rss_mb(), 1)
+    engine.dispose()
+    return resultado
+
+
+def _medir(nome, ctx):
+    # Processo novo por caso: RSS e caches (engine, índice FTS, pdfminer) não vazam entre casos
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_executar_caso, nome, ctx).result()
+
+
+# 🔹 Baseline
+
+def comparar(atual, baseline, tolerancia):
+    """
+    Linhas (caso, métrica, baseline, atual, variação) e lista de regressões: vazão abaixo
+    de (1 - tolerancia) ou pico de RSS acima de (1 + tolerancia) do baseline.
+    """
+    linhas, regressoes = [], []
+    for nome, resultado in atual.items():
+        base = baseline.get(nome)
+        if not base:
+            continue
+        for metrica, maior_melhor in (("por_segundo", True), ("pico_rss_mb", False)):
+            antes, agora = base.get(metrica), resultado.get(metrica)
+            if not antes or agora is None:
+                continue
+            variacao = agora / antes - 1
+            piorou = variacao < -tolerancia if maior_melhor else variacao > tolerancia
+            linhas.append((nome, metrica, antes, agora, variacao, piorou))
+            if piorou:
+                regressoes.append(f"{nome}.{metrica}: {antes} -> {agora} ({variacao:+.1%})")
+    return linhas, regressoes
+
+
+def _args():
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline de NF-e (corpus sintético)")
+    parser.add_argument("--casos", default=",".join(CASOS), help=f"Lista separada por vírgula: {', '.join(CASOS)}")
+    parser.add_argument("--notas", type=int, default=200)
+    parser.add_argument("--itens-min", type=int, default=1)
+    parser.add_argument("--itens-max", type=int, default=40)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--salvar-baseline", nargs="?", const=BASELINE_PADRAO, metavar="JSON")
+    parser.add_argument("--comparar", nargs="?", const=BASELINE_PADRAO, metavar="JSON")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="Variação aceita antes de contar regressão")
+    parser.add_argument("--json", metavar="ARQUIVO", help="Grava o resultado desta execução")
+    parser.add_argument("--manter", action="store_true", help="Não apaga o corpus e os bancos temporários")
+    return parser.parse_args()
+
+
+def main():
+    args = _args()
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconhecidos = [c for c in casos if c not in CASOS]
+    if desconhecidos:
+        raise SystemExit(f"Casos desconhecidos: {', '.join(desconhecidos)}")
+
+    from benchmarks.corpus import gerar_notas, escrever_corpus
+    pasta = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        usuario, notas = gerar_notas(args.notas, args.seed, args.itens_min, args.itens_max)
+        inicio = time.perf_counter()
+        arquivos = escrever_corpus(os.path.join(pasta, "corpus"), notas)
+        itens = sum(len(n["itens"]) for n in notas)
+        print(f"Corpus: {len(notas)} notas, {itens} itens ({time.perf_counter() - inicio:.1f}s) em {pasta}")
+        ctx = {
+            "pasta": pasta, "arquivos": arquivos, "usuario": usuario["cnpj"],
+            "notas": len(notas), "itens": itens, "repeticoes": args.repeticoes,
+        }
+
+        resultados = {}
+        print(f"\n{'caso':<15} {'vazão':>16} {'p50 ms':>10} {'p95 ms':>10} {'pico RSS':>10}")
+        for nome in casos:
+            r = resultados[nome] = _medir(nome, ctx)
+            print(f"{nome:<15} {r['por_segundo']:>9.1f} {r['unidade'] + '/s':<6} {r['p50_ms']:>10.2f} "
+                  f"{r['p95_ms']:>10.2f} {r['pico_rss_mb']:>7.1f} MB")
+    finally:
+        if not args.manter:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    execucao = {
+        "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {k: getattr(args, k) for k in ("notas", "itens_min", "itens_max", "repeticoes", "seed")},
+        "casos": resultados,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, ensure_ascii=False, indent=2)
+
+    regressoes = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parametros") != execucao["parametros"]:
+            print(f"\nAVISO: parâmetros diferentes do baseline ({baseline.get('parametros')})")
+        linhas, regressoes = comparar(resultados, baseline.get("casos", {}), args.tolerancia)
+        print(f"\nComparação com {args.comparar} (tolerância {args.tolerancia:.0%}):")
+        for nome, metrica, antes, agora, variacao, piorou in linhas:
+            print(f"  {nome:<15} {metrica:<12} {antes:>10} -> {agora:>10} {variacao:>+8.1%}{'  REGRESSÃO' if piorou else ''}")
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline salvo em {args.salvar_baseline}")
+
+    if regressoes:
+        print("\nRegressões:\n  " + "\n  ".join(regressoes))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
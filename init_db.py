@@ -1,6 +1,14 @@
-from src.database.connection import engine, Base
-from src.models.usuario import Usuario
+# Cria as tabelas e aplica as migrações (database/migracoes.py) no banco de DATABASE_URL.
+# Idempotente: rodar antes de cada deploy (o Gunicorn não passa pelo __main__ do main.py).
+import os
+import sys
 
-print("🧱 Criando tabelas...")
-Base.metadata.create_all(bind=engine)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from services.logs import configurar_logs
+from database.migracoes import executar_migracoes
+
+configurar_logs()
+print("🧱 Criando tabelas e aplicando migrações...")
+executar_migracoes()
 print("✅ Banco de dados criado com sucesso!")
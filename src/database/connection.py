@@ -1,6 +1,14 @@
 # src/database/connection.py
+# Engine e sessões. criar_engine() aplica a configuração de produção por banco:
+# PostgreSQL com pool dimensionado (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT),
+# pre_ping (conexão derrubada pelo Render/pgbouncer é trocada antes do uso) e recycle
+# (DB_POOL_RECYCLE, segundos); SQLite local em WAL (leitores não bloqueiam o escritor),
+# synchronous=NORMAL e busy_timeout (SQLITE_BUSY_TIMEOUT_MS): upload e chat simultâneos
+# esperam o lock em vez de falhar com "database is locked".
+# Rotas Flask usam database.sessao_request.obter_db() (fechada no fim do request);
+# serviços, worker da fila e CLIs continuam abrindo SessionLocal() e fechando no finally.
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -8,6 +16,63 @@ from sqlalchemy.ext.declarative import declarative_base
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///database.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))  # Segundos esperando conexão livre
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # Abaixo do idle timeout do servidor/proxy
+POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "15000"))
+SQLITE_WAL = os.environ.get("SQLITE_WAL", "1") == "1"
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL é seguro com WAL
+
+
+def _sqlite_em_memoria(url):
+    caminho = url.split("///", 1)[1] if "///" in url else ""
+    return caminho in ("", ":memory:") or "mode=memory" in caminho
+
+
+def _configurar_sqlite(engine, memoria):
+    @event.listens_for(engine, "connect")
+    def _pragmas(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            if SQLITE_WAL and not memoria:
+                cursor.execute("PRAGMA journal_mode=WAL")  # Persistente no arquivo; repetir é barato
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        finally:
+            cursor.close()
+
+
+def criar_engine(url=DATABASE_URL, **opcoes):
+    """
+    Engine com pool/pragmas conforme o banco da URL. `opcoes` sobrescrevem os padrões
+    (ex: criar_engine(url, pool_size=1) num script).
+    """
+    if url.startswith("sqlite"):
+        memoria = _sqlite_em_memoria(url)
+        # timeout do driver = espera pelo lock no connect/BEGIN; busy_timeout cobre o resto
+        parametros = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if not memoria:  # :memory: usa SingletonThreadPool (sem pool_size)
+            parametros.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+        parametros.update(opcoes)
+        engine = create_engine(url, **parametros)
+        _configurar_sqlite(engine, memoria)
+        return engine
+
+    parametros = {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+    parametros.update(opcoes)
+    return create_engine(url, **parametros)
+
+
+engine = criar_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
@@ -0,0 +1,358 @@
+# src/database/migracoes.py
+# Migrações de schema/dados para bancos já existentes (SQLite local e PostgreSQL no Render).
+# Todas são idempotentes: rodar de novo não altera nada. Uso (em src/):
+#   python -m database.migracoes
+# NOTAS_PARTICOES=N (só PostgreSQL, opcional): notas_fiscais particionada por HASH(owner_cnpj).
+
+import os
+import time
+import logging
+from sqlalchemy import inspect, select, text, bindparam, MetaData, String, Numeric, Date
+from sqlalchemy.schema import CreateIndex
+from database.connection import engine, Base
+from models.nota_fiscal import para_decimal, para_data
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 5000
+PARTICOES_NOTAS = int(os.environ.get("NOTAS_PARTICOES", "0"))
+
+# tabela -> [(coluna, tipo novo, conversor Python)] (mesmos tipos de models/nota_fiscal.py)
+_COLUNAS_TIPADAS = {
+    "notas_fiscais": [
+        ("data_emissao", Date(), para_data),
+        ("valor_total_nota", Numeric(15, 2), para_decimal),
+    ],
+    "itens_nota": [
+        ("quantidade", Numeric(15, 4), para_decimal),
+        ("valor_unitario", Numeric(21, 10), para_decimal),
+        ("valor_total", Numeric(15, 2), para_decimal),
+    ],
+}
+
+
+def _converter_coluna(conn, tabela, coluna, tipo, conversor):
+    """
+    Troca o tipo de uma coluna texto convertendo os valores em Python (formatos BR,
+    vazios, 'None'): cria coluna nova, copia em lotes, remove a antiga e renomeia.
+    Funciona em PostgreSQL e SQLite >= 3.35 (DROP COLUMN).
+    """
+    temporaria = f"{coluna}__novo"
+    tipo_sql = tipo.compile(dialect=conn.dialect)
+    colunas = {c["name"] for c in inspect(conn).get_columns(tabela)}
+    if temporaria in colunas:  # Sobra de uma execução interrompida
+        conn.execute(text(f"ALTER TABLE {tabela} DROP COLUMN {temporaria}"))
+    conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {temporaria} {tipo_sql}"))
+
+    ultimo_id = 0
+    convertidas = invalidas = 0
+    while True:
+        linhas = conn.execute(
+            text(f"SELECT id, {coluna} FROM {tabela} WHERE id > :ultimo ORDER BY id LIMIT :lote"),
+            {"ultimo": ultimo_id, "lote": TAMANHO_LOTE},
+        ).fetchall()
+        if not linhas:
+            break
+        valores = []
+        for id_, bruto in linhas:
+            valor = conversor(bruto)
+            if valor is None and bruto not in (None, "", "None"):
+                invalidas += 1
+            valores.append({"id": id_, "valor": valor})
+        conn.execute(
+            text(f"UPDATE {tabela} SET {temporaria} = :valor WHERE id = :id").bindparams(bindparam("valor", type_=tipo)),
+            valores,
+        )
+        convertidas += len(valores)
+        ultimo_id = linhas[-1][0]
+
+    conn.execute(text(f"ALTER TABLE {tabela} DROP COLUMN {coluna}"))
+    conn.execute(text(f"ALTER TABLE {tabela} RENAME COLUMN {temporaria} TO {coluna}"))
+    logger.info("MIGRACAO: %s.%s -> %s (%s linhas, %s valores inválidos viraram NULL)", tabela, coluna, tipo_sql, convertidas, invalidas)
+
+
+def migrar_tipos_numericos():
+    """
+    Valores e quantidades de String para NUMERIC e data_emissao para DATE.
+    """
+    with engine.begin() as conn:
+        inspetor = inspect(conn)
+        tabelas = set(inspetor.get_table_names())
+        for tabela, colunas in _COLUNAS_TIPADAS.items():
+            if tabela not in tabelas:
+                continue
+            tipos = {c["name"]: c["type"] for c in inspetor.get_columns(tabela)}
+            for coluna, tipo, conversor in colunas:
+                if isinstance(tipos.get(coluna), String):
+                    _converter_coluna(conn, tabela, coluna, tipo, conversor)
+
+
+# Índices do schema antigo (tenant por emitente OR destinatário), trocados pelos de owner_cnpj
+_INDICES_OBSOLETOS = ("ix_notas_emitente_data", "ix_notas_destinatario_data", "ix_notas_dedup")
+
+# Dono de nota antiga: tipo_operacao foi calculado pelo CNPJ de quem enviou; sem ele, o lado
+# que é usuário cadastrado; senão o emitente ('' se nem isso)
+_DONO_NOTA_ANTIGA = """COALESCE(CASE
+    WHEN tipo_operacao = :saida THEN cnpj_emitente
+    WHEN tipo_operacao = :entrada THEN cnpj_destinatario
+    WHEN cnpj_emitente IN (SELECT cnpj FROM usuarios) THEN cnpj_emitente
+    WHEN cnpj_destinatario IN (SELECT cnpj FROM usuarios) THEN cnpj_destinatario
+    ELSE cnpj_emitente END, '')"""
+
+
+def _preencher_donos():
+    """
+    owner_cnpj das notas que ainda não têm, em faixas de id com um commit por faixa
+    (retomável: só mexe em owner_cnpj NULL). Retorna quantas notas preencheu.
+    """
+    with engine.connect() as conn:
+        maior_id = conn.execute(text("SELECT MAX(id) FROM notas_fiscais WHERE owner_cnpj IS NULL")).scalar()
+        menor_id = conn.execute(text("SELECT MIN(id) FROM notas_fiscais WHERE owner_cnpj IS NULL")).scalar()
+    if maior_id is None:
+        return 0
+    preenchidas = 0
+    for inicio in range(menor_id - 1, maior_id, TAMANHO_LOTE):
+        with engine.begin() as conn:
+            preenchidas += conn.execute(
+                text(f"UPDATE notas_fiscais SET owner_cnpj = {_DONO_NOTA_ANTIGA} "
+                     "WHERE owner_cnpj IS NULL AND id > :inicio AND id <= :fim"),
+                {"saida": "Saída", "entrada": "Entrada", "inicio": inicio, "fim": inicio + TAMANHO_LOTE},
+            ).rowcount
+    return preenchidas
+
+
+def _recriar_tabela_sqlite(conn, tabela):
+    """
+    SQLite não remove constraint de tabela existente: cria a tabela nova pelo model,
+    copia as linhas (mesmos ids), apaga a antiga e renomeia. Os índices antigos saem
+    antes (nomes são globais no SQLite) e os do model vêm com a tabela nova. A FK de
+    itens_nota continua apontando pro nome notas_fiscais (foreign_keys fica desligado,
+    padrão do SQLite).
+    """
+    modelo = Base.metadata.tables[tabela]
+    inspetor = inspect(conn)
+    existentes = {c["name"] for c in inspetor.get_columns(tabela)}
+    colunas = ", ".join(c.name for c in modelo.columns if c.name in existentes)
+    for indice in inspetor.get_indexes(tabela):
+        conn.execute(text(f'DROP INDEX IF EXISTS "{indice["name"]}"'))
+    temporaria = f"{tabela}__novo"
+    conn.execute(text(f"DROP TABLE IF EXISTS {temporaria}"))  # Sobra de uma execução interrompida
+    modelo.to_metadata(MetaData(), name=temporaria).create(conn)
+    conn.execute(text(f"INSERT INTO {temporaria} ({colunas}) SELECT {colunas} FROM {tabela}"))
+    conn.execute(text(f"DROP TABLE {tabela}"))
+    conn.execute(text(f"ALTER TABLE {temporaria} RENAME TO {tabela}"))
+
+
+def adicionar_dono_notas():
+    """
+    owner_cnpj em bancos existentes: cria a coluna, preenche as notas antigas, troca
+    chave_nfe vazia por NULL e a unique de chave_nfe pela de (owner_cnpj, chave_nfe).
+    Se preencheu alguma nota, recalcula o resumo mensal (agora só pro lado do dono).
+    """
+    import models.nota_fiscal  # noqa: F401
+    with engine.begin() as conn:
+        inspetor = inspect(conn)
+        if "notas_fiscais" not in inspetor.get_table_names():
+            return
+        if "owner_cnpj" not in {c["name"] for c in inspetor.get_columns("notas_fiscais")}:
+            conn.execute(text("ALTER TABLE notas_fiscais ADD COLUMN owner_cnpj VARCHAR"))
+            logger.info("MIGRACAO: coluna notas_fiscais.owner_cnpj criada")
+
+    preenchidas = _preencher_donos()
+    if preenchidas:
+        logger.info("MIGRACAO: owner_cnpj preenchido em %s notas", preenchidas)
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE notas_fiscais SET chave_nfe = NULL WHERE chave_nfe = ''"))
+        inspetor = inspect(conn)
+        unicas = inspetor.get_unique_constraints("notas_fiscais")
+        antiga = next((u for u in unicas if u["column_names"] == ["chave_nfe"]), None)
+        if antiga is not None:
+            if conn.dialect.name == "sqlite":
+                _recriar_tabela_sqlite(conn, "notas_fiscais")
+            else:
+                conn.execute(text(f'ALTER TABLE notas_fiscais DROP CONSTRAINT "{antiga["name"]}"'))
+                conn.execute(text("ALTER TABLE notas_fiscais ADD CONSTRAINT uq_notas_owner_chave UNIQUE (owner_cnpj, chave_nfe)"))
+            logger.info("MIGRACAO: unique de chave_nfe trocada por (owner_cnpj, chave_nfe)")
+        for nome in _INDICES_OBSOLETOS:
+            conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+
+    if preenchidas:
+        from services.resumo_service import reconstruir_resumo
+        reconstruir_resumo()
+
+
+def reconstruir_indice_busca():
+    """
+    Índice de busca do chat (busca_notas.db) criado antes do owner_cnpj: as linhas têm
+    "emitente destinatário" em cnpjs e casam com notas de outras empresas, ocupando o
+    LIMIT da busca. Reconstrói com o dono de cada nota. Sem arquivo de índice, nada a fazer.
+    """
+    from services.busca_notas import CAMINHO_INDICE, indice_antigo, reconstruir_indice
+    if not os.path.exists(CAMINHO_INDICE) or not indice_antigo():
+        return
+    from database.connection import SessionLocal
+    session = SessionLocal()
+    try:
+        logger.info("MIGRACAO: índice de busca reconstruído com owner_cnpj (%s notas)", reconstruir_indice(session))
+    finally:
+        session.close()
+
+
+# Colunas acrescentadas à fila de ingestão depois da criação das tabelas (tipos vêm do model)
+_COLUNAS_FILA = {
+    "jobs_ingestao": ("com_chave_api", "processo_chave"),
+    "arquivos_job": ("reivindicado_por",),
+}
+
+
+def adicionar_colunas_fila():
+    """
+    Cria nas tabelas da fila de ingestão as colunas que o model tem e o banco ainda não.
+    """
+    import models.job_ingestao  # noqa: F401
+    with engine.begin() as conn:
+        inspetor = inspect(conn)
+        tabelas = set(inspetor.get_table_names())
+        for tabela, colunas in _COLUNAS_FILA.items():
+            if tabela not in tabelas:
+                continue
+            existentes = {c["name"] for c in inspetor.get_columns(tabela)}
+            for coluna in colunas:
+                if coluna in existentes:
+                    continue
+                tipo_sql = Base.metadata.tables[tabela].c[coluna].type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo_sql}"))
+                logger.info("MIGRACAO: coluna %s.%s criada", tabela, coluna)
+
+
+def _particionada(conn, tabela):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :tabela"
+    ), {"tabela": tabela}).first() is not None
+
+
+def particionar_notas_postgres():
+    """
+    Opcional (NOTAS_PARTICOES >= 2, só PostgreSQL): recria notas_fiscais particionada por
+    HASH(owner_cnpj), numa transação (a tabela fica travada durante a cópia). A PK vira
+    (id, owner_cnpj), como o particionamento exige, e a FK itens_nota -> notas_fiscais
+    sai (não há unique só de id pra ela apontar); o índice de itens_nota.nota_id fica.
+    Consultas filtradas por owner_cnpj leem uma partição só.
+    """
+    if PARTICOES_NOTAS < 2 or engine.dialect.name != "postgresql":
+        return
+    import models.nota_fiscal  # noqa: F401
+    with engine.begin() as conn:
+        if _particionada(conn, "notas_fiscais"):
+            return
+        sequencia = conn.execute(text("SELECT pg_get_serial_sequence('notas_fiscais', 'id')")).scalar()
+        if sequencia is None:
+            logger.warning("MIGRACAO: notas_fiscais.id sem sequence (identity?); particionamento não aplicado")
+            return
+        inicio = time.perf_counter()
+        inspetor = inspect(conn)
+        constraints = [u["name"] for u in inspetor.get_unique_constraints("notas_fiscais")]
+        constraints.append(inspetor.get_pk_constraint("notas_fiscais").get("name"))
+        indices = [indice["name"] for indice in inspetor.get_indexes("notas_fiscais")]
+        for fk in inspetor.get_foreign_keys("itens_nota"):
+            if fk["referred_table"] == "notas_fiscais" and fk.get("name"):
+                conn.execute(text(f'ALTER TABLE itens_nota DROP CONSTRAINT "{fk["name"]}"'))
+        conn.execute(text("UPDATE notas_fiscais SET owner_cnpj = '' WHERE owner_cnpj IS NULL"))  # Chave de partição na PK
+        conn.execute(text("ALTER TABLE notas_fiscais RENAME TO notas_fiscais_antiga"))
+        # Constraints/índices da antiga liberam os nomes pra tabela nova
+        for nome in filter(None, constraints):
+            conn.execute(text(f'ALTER TABLE notas_fiscais_antiga DROP CONSTRAINT "{nome}"'))
+        for nome in indices:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{nome}"'))
+
+        conn.execute(text(
+            "CREATE TABLE notas_fiscais (LIKE notas_fiscais_antiga INCLUDING DEFAULTS) PARTITION BY HASH (owner_cnpj)"
+        ))
+        conn.execute(text("ALTER TABLE notas_fiscais ALTER COLUMN owner_cnpj SET NOT NULL"))
+        conn.execute(text("ALTER TABLE notas_fiscais ADD PRIMARY KEY (id, owner_cnpj)"))
+        conn.execute(text("ALTER TABLE notas_fiscais ADD CONSTRAINT uq_notas_owner_chave UNIQUE (owner_cnpj, chave_nfe)"))
+        for resto in range(PARTICOES_NOTAS):
+            conn.execute(text(
+                f"CREATE TABLE notas_fiscais_p{resto} PARTITION OF notas_fiscais "
+                f"FOR VALUES WITH (MODULUS {PARTICOES_NOTAS}, REMAINDER {resto})"
+            ))
+        conn.execute(text("INSERT INTO notas_fiscais SELECT * FROM notas_fiscais_antiga"))
+        conn.execute(text(f"ALTER SEQUENCE {sequencia} OWNED BY notas_fiscais.id"))  # Senão o DROP leva a sequence
+        conn.execute(text("DROP TABLE notas_fiscais_antiga"))
+        for indice in Base.metadata.tables["notas_fiscais"].indexes:
+            indice.create(conn, checkfirst=False)  # Índice particionado: um por partição, sem CONCURRENTLY
+        logger.info("MIGRACAO: notas_fiscais particionada em %s (HASH owner_cnpj) em %.1fs", PARTICOES_NOTAS, time.perf_counter() - inicio)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE notas_fiscais"))
+
+
+def criar_indices():
+    """
+    Cria em bancos existentes os índices declarados nos models (create_all não mexe
+    em tabela que já existe). No PostgreSQL usa CREATE INDEX CONCURRENTLY pra não
+    travar escrita durante o build; no fim roda ANALYZE pro planner enxergar os índices.
+    """
+    import models.nota_fiscal  # noqa: F401
+    postgres = engine.dialect.name == "postgresql"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        inspetor = inspect(conn)
+        tabelas = set(inspetor.get_table_names())
+        criados = []
+        for tabela in ("notas_fiscais", "itens_nota"):
+            if tabela not in tabelas:
+                continue
+            existentes = {i["name"] for i in inspetor.get_indexes(tabela)}
+            for indice in Base.metadata.tables[tabela].indexes:
+                if indice.name in existentes:
+                    continue
+                ddl = str(CreateIndex(indice, if_not_exists=True).compile(dialect=conn.dialect))
+                if postgres and not _particionada(conn, tabela):  # CONCURRENTLY não vale em tabela particionada
+                    ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                inicio = time.perf_counter()
+                conn.execute(text(ddl))
+                logger.info("MIGRACAO: índice %s criado em %.1fs", indice.name, time.perf_counter() - inicio)
+                criados.append(tabela)
+        for tabela in sorted(set(criados)):
+            conn.execute(text(f"ANALYZE {tabela}"))
+
+
+def popular_resumo_mensal():
+    """
+    Backfill do resumo mensal em bancos que já tinham notas antes da tabela existir.
+    """
+    from models.resumo_mensal import ResumoMensal
+    from services.resumo_service import reconstruir_resumo
+    with engine.connect() as conn:
+        vazio = conn.execute(select(ResumoMensal.id).limit(1)).first() is None
+        tem_notas = conn.execute(text("SELECT 1 FROM notas_fiscais LIMIT 1")).first() is not None
+    if vazio and tem_notas:
+        reconstruir_resumo()
+
+
+MIGRACOES = [
+    migrar_tipos_numericos,
+    adicionar_dono_notas,
+    reconstruir_indice_busca,
+    adicionar_colunas_fila,
+    particionar_notas_postgres,
+    criar_indices,
+    popular_resumo_mensal,
+]
+
+
+def executar_migracoes():
+    # Importa todos os models pra create_all conhecer as tabelas novas. create_all só
+    # cria o que falta (não altera tabela existente), então roda antes das migrações
+    import models.nota_fiscal, models.usuario, models.job_ingestao, models.resumo_mensal, models.versao_dados, models.extracao_pdf  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+    for migracao in MIGRACOES:
+        logger.info("MIGRACAO: %s", migracao.__name__)
+        migracao()
+
+
+if __name__ == "__main__":
+    from services.logs import configurar_logs
+    configurar_logs()
+    executar_migracoes()
+    print("✅ Migrações aplicadas.")
@@ -0,0 +1,27 @@
+# src/database/sessao_request.py
+# Sessão do banco com escopo de request Flask: obter_db() abre uma na primeira chamada
+# (guardada em flask.g) e o teardown registrado por registrar_sessao_request(app) faz
+# rollback do que não foi commitado e fecha no fim do request, inclusive quando a rota
+# levanta exceção ou retorna cedo. A conexão volta ao pool sempre.
+from flask import g
+from database.connection import SessionLocal
+
+
+def obter_db():
+    """
+    Sessão do request atual (a mesma em todas as chamadas dentro dele).
+    """
+    db = g.get("_db")
+    if db is None:
+        db = g._db = SessionLocal()
+    return db
+
+
+def _fechar_db(_erro=None):
+    db = g.pop("_db", None)
+    if db is not None:
+        db.close()  # close() já descarta transação pendente (rollback)
+
+
+def registrar_sessao_request(app):
+    app.teardown_appcontext(_fechar_db)
@@ -1,12 +1,22 @@
 # src/main.py
+from services.logs import configurar_logs
+configurar_logs()  # Antes dos outros imports: nenhum log de import escapa da fila
 from models.nota_fiscal import NotaFiscal, ItemNota
 from flask import Flask, render_template, redirect, session
 from flask_cors import CORS
 from routes.auth import auth_bp
 from routes.documents import document_bp
 from routes.chat import chat_bp
+from routes.metricas import metricas_bp
 from models.usuario import Usuario
-from database.connection import engine, Base
+from models.job_ingestao import JobIngestao, ArquivoJob
+from models.resumo_mensal import ResumoMensal
+from models.versao_dados import VersaoDados
+from models.extracao_pdf import ExtracaoPdf
+from services.fila_ingestao import iniciar_worker
+from services.busca_notas import indexar_em_segundo_plano
+from database.migracoes import executar_migracoes
+from database.sessao_request import registrar_sessao_request
 import os
 import secrets  # Para gerar chave secreta segura
 
@@ -19,6 +29,27 @@ CORS(app)
 app.register_blueprint(auth_bp)
 app.register_blueprint(document_bp, url_prefix="/api")
 app.register_blueprint(chat_bp, url_prefix="/api")
+app.register_blueprint(metricas_bp)  # /metrics na raiz, onde o Prometheus procura
+registrar_sessao_request(app)  # Fecha a sessão de obter_db() no fim de cada request
+
+# Threads de fundo sobem depois do schema existir (nunca no import) e no processo que
+# atende: no __main__ após as migrações, e no primeiro request de cada worker do Gunicorn
+# (pós-fork, então funciona com --preload). O upload também sobe o worker ao enfileirar.
+_fundo_iniciado = False
+
+
+def iniciar_threads_de_fundo():
+    global _fundo_iniciado
+    if _fundo_iniciado:
+        return
+    _fundo_iniciado = True
+    # Worker da fila de ingestão assíncrona (FILA_WORKER_EMBUTIDO=0 desliga, se rodar standalone)
+    iniciar_worker()
+    # Índice de busca do chat: o que faltar (primeiro boot, índice apagado) é indexado fora dos requests
+    indexar_em_segundo_plano()
+
+
+app.before_request(iniciar_threads_de_fundo)
 
 # Página inicial -> redireciona para login.html
 @app.route("/")
@@ -47,10 +78,10 @@ if __name__ == "__main__":
     # Cria diretório temporário para uploads
     os.makedirs("src/temp", exist_ok=True)
 
-    # Inicializa banco de dados
-    with engine.connect() as connection:
-        Base.metadata.create_all(bind=engine)
-    print("Banco de dados inicializado! Tabelas criadas com sucesso.")
+    # Inicializa banco de dados: cria as tabelas que faltam e aplica as migrações (idempotentes)
+    executar_migracoes()
+    print("Banco de dados inicializado! Tabelas criadas e migrações aplicadas.")
+    iniciar_threads_de_fundo()
 
     # Para desenvolvimento local apenas; em produção, Render usa Gunicorn
     port = int(os.environ.get("PORT", 5000))
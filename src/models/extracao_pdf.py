@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from database.connection import Base
+
+
+class ExtracaoPdf(Base):
+    """
+    Resultado da extração PDF->IA (JSON da nota), endereçado pelo conteúdo: sha256 dos
+    bytes do arquivo e do texto extraído. Re-upload do mesmo DANFE não paga IA de novo.
+    """
+    __tablename__ = "extracoes_pdf"
+
+    id = Column(Integer, primary_key=True)
+    hash_arquivo = Column(String(64), unique=True, nullable=False)
+    hash_texto = Column(String(64), index=True, nullable=False)
+    chave_nfe = Column(String(44), index=True)
+    dados = Column(Text, nullable=False)  # JSON como veio da IA (tipo_operacao recalculado no uso)
+    modelo = Column(String)
+    criado_em = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,37 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy.orm import relationship
+from database.connection import Base
+
+
+class JobIngestao(Base):
+    __tablename__ = "jobs_ingestao"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    status = Column(String, default="pendente")  # pendente, processando, concluido
+    user_cnpj = Column(String)
+    modelo = Column(String)
+    com_chave_api = Column(Boolean, default=False)  # Upload veio com chave (a chave mesmo não vai pro banco)
+    processo_chave = Column(String)  # Processo que tem a chave em memória: só os workers dele pegam o job
+    total_arquivos = Column(Integer, default=0)
+    arquivos_processados = Column(Integer, default=0)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+
+    arquivos = relationship("ArquivoJob", back_populates="job", cascade="all, delete-orphan", order_by="ArquivoJob.ordem")
+
+
+class ArquivoJob(Base):
+    __tablename__ = "arquivos_job"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("jobs_ingestao.id"), index=True)
+    ordem = Column(Integer)  # Posição no upload original
+    filename = Column(String)
+    caminho = Column(String)  # Temp em disco até o worker processar
+    status = Column(String, default="pendente", index=True)  # pendente, processando, concluido
+    reivindicado_por = Column(String)  # Token do worker dono do processamento atual
+    resultados = Column(Text)  # JSON: lista de resultados do arquivo (mesmo formato do modo síncrono)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)  # Batimento do worker enquanto processa
+
+    job = relationship("JobIngestao", back_populates="arquivos")
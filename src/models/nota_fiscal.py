@@ -1,14 +1,62 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import Column, Integer, String, Float, Numeric, Date, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database.connection import Base
 
 
+def para_decimal(valor):
+    """
+    Normaliza valores monetários/quantidades vindos de XML, CSV ou IA:
+    aceita número, "1234.56", "1.234,56", "R$ 10,00"; vazio ou inválido vira None.
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, (int, float)):
+        return Decimal(str(valor))
+    texto = re.sub(r'[R$\s]', '', str(valor))
+    if not texto or texto.lower() in ('none', 'null', 'nan'):
+        return None
+    if ',' in texto:  # Formato BR: ponto de milhar, vírgula decimal
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return None
+
+
+_FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+
+def para_data(valor):
+    """
+    Normaliza data_emissao: date/datetime, ISO (com ou sem hora), DD/MM/AAAA ou DD-MM-AAAA.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()[:10]
+    for formato in _FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
 class NotaFiscal(Base):
     __tablename__ = "notas_fiscais"
 
     id = Column(Integer, primary_key=True)
+    owner_cnpj = Column(String)  # Empresa dona (CNPJ do usuário que enviou): toda leitura filtra por ele
     numero = Column(String)
-    data_emissao = Column(String)
+    data_emissao = Column(Date)
     cnpj_emitente = Column(String)
     nome_emitente = Column(String)
     ie_emitente = Column(String)
@@ -17,29 +65,39 @@ class NotaFiscal(Base):
     nome_destinatario = Column(String)
     ie_destinatario = Column(String)
     endereco_destinatario = Column(String)
-    chave_nfe = Column(String, unique=True)
+    chave_nfe = Column(String)  # NULL quando a nota não tem chave (CSV/PDF sem chave)
     natureza_operacao = Column(String)
-    valor_total_nota = Column(String)
+    valor_total_nota = Column(Numeric(15, 2))
     tipo_operacao = Column(String)
     versao = Column(String)
 
     itens = relationship("ItemNota", back_populates="nota", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # A mesma NF-e pode estar no banco uma vez por empresa (emitente e destinatário
+        # enviando a mesma nota); owner_cnpj na frente também serve de chave de partição
+        UniqueConstraint("owner_cnpj", "chave_nfe", name="uq_notas_owner_chave"),
+        # Notas do usuário por data: um range scan só, já ordenado por data_emissao
+        Index("ix_notas_owner_data", "owner_cnpj", "data_emissao"),
+        # Duplicidade de notas sem chave_nfe (CSV/PDF): numero + emitente + data, por empresa
+        Index("ix_notas_owner_dedup", "owner_cnpj", "numero", "cnpj_emitente", "data_emissao"),
+    )
+
 
 class ItemNota(Base):
     __tablename__ = "itens_nota"
 
     id = Column(Integer, primary_key=True)
-    nota_id = Column(Integer, ForeignKey("notas_fiscais.id"))
+    nota_id = Column(Integer, ForeignKey("notas_fiscais.id"), index=True)  # Itens por nota (FK sem índice = full scan)
     codigo_produto = Column(String)
     descricao_produto = Column(String)
     ncm = Column(String)
     cst_ipi = Column(String)
     cfop = Column(String)
     unidade = Column(String)
-    quantidade = Column(String)
-    valor_unitario = Column(String)
-    valor_total = Column(String)
+    quantidade = Column(Numeric(15, 4))
+    valor_unitario = Column(Numeric(21, 10))  # vUnCom da NF-e tem até 10 casas
+    valor_total = Column(Numeric(15, 2))
     cst_icms = Column(String)
     cst_pis = Column(String)
     cst_cofins = Column(String)
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Numeric, UniqueConstraint
+from database.connection import Base
+
+
+class ResumoMensal(Base):
+    """
+    Totais por empresa/mês/tipo/CFOP/NCM, mantidos junto com a gravação das notas
+    (services/resumo_service.py). Cada nota conta como Saída pro emitente e Entrada
+    pro destinatário; cfop/ncm vazios ('') quando a nota não tem itens.
+    """
+    __tablename__ = "resumo_mensal"
+
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String, nullable=False)
+    ano_mes = Column(String(7), nullable=False)  # AAAA-MM
+    tipo_operacao = Column(String, nullable=False)  # Entrada / Saída
+    cfop = Column(String, nullable=False, default="")
+    ncm = Column(String, nullable=False, default="")
+    quantidade_itens = Column(Integer, nullable=False, default=0)
+    valor_total = Column(Numeric(15, 2), nullable=False, default=0)
+    icms_valor = Column(Numeric(15, 2), nullable=False, default=0)
+    ipi_valor = Column(Numeric(15, 2), nullable=False, default=0)
+    pis_valor = Column(Numeric(15, 2), nullable=False, default=0)
+    cofins_valor = Column(Numeric(15, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        # Chave do upsert; o prefixo (cnpj, ano_mes) atende as consultas por empresa/período
+        UniqueConstraint("cnpj", "ano_mes", "tipo_operacao", "cfop", "ncm", name="uq_resumo_mensal_chave"),
+    )
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String
+from database.connection import Base
+
+
+class VersaoDados(Base):
+    """
+    Contador por CNPJ incrementado a cada gravação de notas em que ele é emitente ou
+    destinatário; entra na chave do cache do chat, então upload novo invalida as respostas.
+    """
+    __tablename__ = "versoes_dados"
+
+    cnpj = Column(String, primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,34 @@
+# src/processors/chave_acesso.py
+# Chave de acesso da NF-e (44 dígitos): validação do DV e busca em texto livre (PDF).
+# Layout: cUF(2) AAMM(4) CNPJ emitente(14) modelo(2) série(3) número(9) tpEmis(1) código(8) DV(1).
+
+import re
+
+# 44 dígitos, inteiros ou em blocos de 4 separados por espaço/ponto (como no DANFE)
+_RE_CHAVE = re.compile(r"(?<!\d)\d{4}(?:[ .]?\d{4}){10}(?!\d)")
+
+
+def chave_valida(chave):
+    # Dígito verificador: módulo 11, pesos 2..9 da direita pra esquerda
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave[:43])))
+    dv = 11 - soma % 11
+    return int(chave[43]) == (0 if dv >= 10 else dv)
+
+
+def chaves_no_texto(texto):
+    """
+    Chaves de acesso (com DV válido) encontradas no texto, na ordem em que aparecem.
+    """
+    chaves = []
+    for bruto in _RE_CHAVE.findall(texto):
+        chave = re.sub(r"\D", "", bruto)
+        if chave_valida(chave) and chave not in chaves:
+            chaves.append(chave)
+    return chaves
+
+
+def partes_chave(chave):
+    """
+    Campos da chave usados pra conferir o DANFE: CNPJ do emitente, AAMM e número da nota.
+    """
+    return {"cnpj_emitente": chave[6:20], "aamm": chave[2:6], "numero": str(int(chave[25:34]))}
@@ -0,0 +1,115 @@
+# src/processors/csv_processor.py
+# Leitura em streaming do CSV de notas (layout ';' com uma linha por item + linha TOTAL).
+
+import io
+import re
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _float(valor):
+    """
+    Impostos do CSV: aceita vazio (0) e vírgula decimal (export BR).
+    """
+    if valor is None:
+        return 0.0
+    valor = str(valor).strip()
+    if not valor:
+        return 0.0
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    return float(valor)
+
+
+def _nova_nota(row, numero, chave):
+    return {
+        "numero": numero,
+        "data_emissao": row.get('data_emissao', ''),
+        "cnpj_emitente": re.sub(r'[^\d]', '', row.get('emitente_cnpj', '')),
+        "nome_emitente": row.get('emitente_razao_social', ''),
+        "ie_emitente": row.get('emitente_ie', ''),
+        "endereco_emitente": row.get('emitente_endereco', ''),
+        "cnpj_destinatario": re.sub(r'[^\d]', '', row.get('destinatario_cnpj', '')),
+        "nome_destinatario": row.get('destinatario_razao_social', ''),
+        "ie_destinatario": row.get('destinatario_ie', ''),
+        "endereco_destinatario": row.get('destinatario_endereco', ''),
+        "chave_nfe": chave,
+        "natureza_operacao": row.get('natureza_operacao', '') or row.get('tipo_operacao', ''),  # Coluna correta, fallback
+        "valor_total_nota": '',  # Setado na TOTAL
+        "tipo_operacao": '',  # Calculado pós-parse (user_cnpj)
+        "versao": row.get('serie', ''),  # Serie como versao approx
+        "itens": []
+    }
+
+
+def _novo_item(row):
+    return {
+        "codigo_produto": row.get('produto_codigo', ''),
+        "descricao_produto": row.get('produto_descricao', ''),
+        "ncm": row.get('produto_ncm', ''),
+        "cfop": row.get('produto_cfop', ''),
+        "unidade": row.get('produto_unidade', ''),
+        "quantidade": row.get('produto_quantidade', ''),
+        "valor_unitario": row.get('produto_valor_unitario', ''),
+        "valor_total": row.get('produto_valor_total', ''),
+        "cst_icms": row.get('icms_cst', ''),
+        "cst_ipi": row.get('ipi_cst', ''),
+        "cst_pis": row.get('pis_cst', ''),
+        "cst_cofins": row.get('cofins_cst', ''),
+        "cest": row.get('cest', ''),
+        "icms_valor": _float(row.get('icms_valor')),
+        "ipi_valor": _float(row.get('ipi_valor')),
+        "pis_valor": _float(row.get('pis_valor')),
+        "cofins_valor": _float(row.get('cofins_valor'))
+    }
+
+
+def iterar_notas_csv(fonte):
+    """
+    Gerador: lê o CSV linha a linha e produz cada nota completa (dict + 'itens')
+    assim que chega a linha TOTAL dela, ou quando muda a chave numero_nota/chave_acesso.
+    Só a nota corrente fica em memória, então o consumo não depende do tamanho do arquivo.
+    Assume as linhas de uma mesma nota contíguas (como no export); uma chave que
+    reaparece depois vira outra nota (e cai na checagem de duplicidade ao salvar).
+    fonte: caminho ou arquivo binário já aberto. tipo_operacao fica vazio (o chamador calcula).
+    """
+    if isinstance(fonte, str):
+        with open(fonte, 'rb') as arquivo:
+            yield from iterar_notas_csv(arquivo)
+        return
+
+    texto = io.TextIOWrapper(fonte, encoding='utf-8-sig', newline='')  # -sig: tolera BOM do Excel
+    reader = csv.DictReader(texto, delimiter=';')  # delimiter=';' pra CSV BR
+
+    atual = None
+    chave_atual = None
+    for row in reader:
+        numero = (row.get('numero_nota') or '').strip()
+        chave = (row.get('chave_acesso') or '').strip()
+        item_num = (row.get('item') or '').strip()
+        if not numero:
+            continue  # Linhas vazias
+
+        if item_num == 'TOTAL':
+            # Linha TOTAL: fecha a nota corrente (mesmo numero) com valor_total_nota
+            if atual is not None and atual["numero"] == numero and (not chave or chave == atual["chave_nfe"]):
+                atual['valor_total_nota'] = row.get('valor_total_nota', '')
+                yield atual
+                atual = chave_atual = None
+            continue
+
+        key = f"{numero}_{chave}" if chave else numero  # Unique key
+        if key != chave_atual:
+            if atual is not None:
+                yield atual  # Chave mudou sem TOTAL: a nota anterior terminou
+            atual = _nova_nota(row, numero, chave)
+            chave_atual = key
+
+        # Adiciona item se tem produto_codigo
+        if row.get('produto_codigo', ''):
+            atual["itens"].append(_novo_item(row))
+
+    if atual is not None:
+        yield atual
@@ -0,0 +1,327 @@
+# src/processors/danfe_parser.py
+# Leitura local (sem IA) do DANFE: o layout é padronizado (caixas com o rótulo em cima e o
+# valor embaixo, tabela de produtos com cabeçalho fixo), então as posições das palavras do
+# pdfplumber bastam pra achar chave, CNPJs, datas, totais e itens. A chave de acesso (DV
+# validado) carrega CNPJ do emitente, AAMM e número da nota, o que permite conferir o
+# resto e dar uma nota de confiança; abaixo do mínimo, quem chama usa a IA.
+
+import re
+import unicodedata
+import logging
+from processors.chave_acesso import chaves_no_texto, partes_chave
+from processors.pdf_extractor import extrair_pdf
+
+logger = logging.getLogger(__name__)
+
+_RE_VALOR = re.compile(r"^-?[\d.]*\d,\d+$|^-?\d+(?:\.\d+)?$")
+_RE_DATA = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+
+# Fim da tabela de produtos
+_SECOES_FIM_TABELA = ("DADOS ADICIONAIS", "CALCULO DO ISSQN", "INFORMACOES COMPLEMENTARES")
+
+# Pesos da confiança (somam 1.0)
+_PESOS = {
+    "chave": 0.25,
+    "cnpj_emitente": 0.15,
+    "data_emissao": 0.10,
+    "numero": 0.10,
+    "valor_total_nota": 0.10,
+    "cnpj_destinatario": 0.10,
+    "itens": 0.20,
+}
+
+
+def _norm(texto):
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return sem_acento.upper()
+
+
+def _numero(texto):
+    """
+    '1.234,56' / '1234.56' -> float; None se não for número.
+    """
+    texto = (texto or "").replace("R$", "").strip()
+    if not texto or not _RE_VALOR.match(texto):
+        return None
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    return float(texto)
+
+
+def _digitos(texto):
+    return re.sub(r"\D", "", texto or "")
+
+
+# 🔹 Palavras e linhas
+
+def _linhas(palavras, tolerancia=2.5):
+    """
+    Agrupa as palavras (dicts do pdfplumber) em linhas pela coordenada top, cada linha
+    ordenada da esquerda pra direita.
+    """
+    linhas = []
+    for palavra in sorted(palavras, key=lambda p: (p["top"], p["x0"])):
+        if linhas and abs(palavra["top"] - linhas[-1][0]["top"]) <= tolerancia:
+            linhas[-1].append(palavra)
+        else:
+            linhas.append([palavra])
+    return [sorted(linha, key=lambda p: p["x0"]) for linha in linhas]
+
+
+def _achar_rotulo(linhas, rotulo, abaixo_de=None, acima_de=None):
+    """
+    Primeira ocorrência do rótulo (sequência de palavras numa linha, sem acento/caixa)
+    entre as alturas dadas. Retorna (linha, índice da primeira palavra, índice da última).
+    """
+    alvo = _norm(rotulo).split()
+    for linha in linhas:
+        top = linha[0]["top"]
+        if (abaixo_de is not None and top <= abaixo_de) or (acima_de is not None and top >= acima_de):
+            continue
+        textos = [_norm(p["text"]) for p in linha]
+        for i in range(len(textos) - len(alvo) + 1):
+            if textos[i:i + len(alvo)] == alvo:
+                return linha, i, i + len(alvo) - 1
+    return None
+
+
+def _valor_abaixo(linhas, rotulo, abaixo_de=None, acima_de=None):
+    """
+    Texto da caixa do rótulo: palavras da primeira linha logo abaixo dele, da borda esquerda
+    do rótulo até o começo do próximo rótulo da mesma linha (a caixa vizinha).
+    """
+    achado = _achar_rotulo(linhas, rotulo, abaixo_de, acima_de)
+    if not achado:
+        return None
+    linha, inicio, fim = achado
+    esquerda = linha[inicio]["x0"] - 2
+    direita = linha[fim + 1]["x0"] - 2 if fim + 1 < len(linha) else float("inf")
+    base = max(p["bottom"] for p in linha)
+    altura = linha[inicio]["bottom"] - linha[inicio]["top"]
+    for seguinte in linhas:
+        if seguinte[0]["top"] <= base:
+            continue
+        if seguinte[0]["top"] > base + altura * 4:  # Caixa vazia
+            return None
+        palavras = [p["text"] for p in seguinte if esquerda <= p["x0"] < direita]
+        if palavras:
+            return " ".join(palavras)
+    return None
+
+
+# 🔹 Tabela de produtos
+
+def _campo_coluna(cabecalho):
+    """
+    Campo do item pra um título de coluna do DANFE (None = coluna ignorada: BC, alíquotas).
+    """
+    t = _norm(cabecalho)
+    if "DESCRICAO" in t:
+        return "descricao_produto"
+    if t.startswith("COD"):
+        return "codigo_produto"
+    if "NCM" in t:
+        return "ncm"
+    if "CFOP" in t:
+        return "cfop"
+    if "CST" in t or "CSOSN" in t:
+        return "cst_icms"
+    if "ALIQ" in t or "BC" in t.split() or "BASE" in t or "B.CALC" in t:
+        return None
+    if "QUANT" in t or "QTD" in t:
+        return "quantidade"
+    if "UNIT" in t:
+        return "valor_unitario"
+    if "ICMS" in t:
+        return "icms_valor"
+    if "IPI" in t:
+        return "ipi_valor"
+    if t in ("UN", "UNID", "UNID.", "UNIDADE"):
+        return "unidade"
+    if "TOTAL" in t or "LIQUIDO" in t:
+        return "valor_total"
+    return None
+
+
+def _colunas(linhas_cabecalho):
+    """
+    Títulos das colunas a partir das palavras do cabeçalho (pode ocupar duas linhas):
+    palavras sobrepostas na horizontal ou quase encostadas formam o mesmo título.
+    Retorna [(campo, x0, x1)] da esquerda pra direita.
+    """
+    palavras = sorted((p for linha in linhas_cabecalho for p in linha), key=lambda p: p["x0"])
+    grupos = []
+    for palavra in palavras:
+        if grupos and palavra["x0"] <= grupos[-1]["x1"] + 3:
+            grupos[-1]["x1"] = max(grupos[-1]["x1"], palavra["x1"])
+            grupos[-1]["palavras"].append(palavra)
+        else:
+            grupos.append({"x0": palavra["x0"], "x1": palavra["x1"], "palavras": [palavra]})
+    colunas = []
+    for grupo in grupos:
+        texto = " ".join(p["text"] for p in sorted(grupo["palavras"], key=lambda p: (p["top"], p["x0"])))
+        colunas.append((_campo_coluna(texto), grupo["x0"], grupo["x1"]))
+    return colunas
+
+
+def _coluna_da_palavra(palavra, colunas):
+    centro = (palavra["x0"] + palavra["x1"]) / 2
+
+    def distancia(coluna):
+        _, x0, x1 = coluna
+        return 0 if x0 <= centro <= x1 else min(abs(centro - x0), abs(centro - x1))
+    return min(colunas, key=distancia)[0]
+
+
+def _itens_da_pagina(linhas):
+    achado = _achar_rotulo(linhas, "DESCRICAO")
+    if not achado:
+        return []
+    linha_titulo = achado[0]
+    i = linhas.index(linha_titulo)
+    cabecalho = [linha_titulo]
+    # Títulos quebrados em duas linhas ("VALOR" / "UNIT"): a linha seguinte colada também é cabeçalho
+    if i + 1 < len(linhas) and linhas[i + 1][0]["top"] - linha_titulo[0]["bottom"] < 2 and \
+            not any(_numero(p["text"]) is not None for p in linhas[i + 1]):
+        cabecalho.append(linhas[i + 1])
+    colunas = _colunas(cabecalho)
+    campos = {campo for campo, _, _ in colunas}
+    if not {"descricao_produto", "valor_total"} <= campos:
+        return []
+
+    itens = []
+    for linha in linhas[i + len(cabecalho):]:
+        texto_linha = _norm(" ".join(p["text"] for p in linha))
+        if any(secao in texto_linha for secao in _SECOES_FIM_TABELA):
+            break
+        celulas = {}
+        for palavra in linha:
+            campo = _coluna_da_palavra(palavra, colunas)
+            if campo:
+                celulas.setdefault(campo, []).append(palavra["text"])
+        celulas = {campo: " ".join(textos) for campo, textos in celulas.items()}
+        valor_total = _numero(celulas.get("valor_total"))
+        if valor_total is None:
+            # Descrição quebrada em várias linhas: continua o item anterior
+            if itens and set(celulas) <= {"descricao_produto", "codigo_produto"} and celulas.get("descricao_produto"):
+                itens[-1]["descricao_produto"] += " " + celulas["descricao_produto"]
+            continue
+        itens.append({
+            "codigo_produto": celulas.get("codigo_produto", ""),
+            "descricao_produto": celulas.get("descricao_produto", ""),
+            "ncm": _digitos(celulas.get("ncm")),
+            "cst_ipi": "",
+            "cfop": _digitos(celulas.get("cfop")),
+            "unidade": celulas.get("unidade", ""),
+            "quantidade": _numero(celulas.get("quantidade")),
+            "valor_unitario": _numero(celulas.get("valor_unitario")),
+            "valor_total": valor_total,
+            "cst_icms": _digitos(celulas.get("cst_icms")),
+            "icms_valor": _numero(celulas.get("icms_valor")) or 0.0,
+            "ipi_valor": _numero(celulas.get("ipi_valor")) or 0.0,
+            "pis_valor": 0.0,
+            "cofins_valor": 0.0,
+        })
+    return itens
+
+
+def _ratear(itens, campo, total):
+    """
+    PIS/COFINS só aparecem no total da nota no DANFE: distribui pelo valor dos itens,
+    com o resto do arredondamento no último, pra soma bater com o total.
+    """
+    base = sum(item["valor_total"] for item in itens)
+    if not total or not base:
+        return
+    acumulado = 0.0
+    for item in itens[:-1]:
+        item[campo] = round(total * item["valor_total"] / base, 2)
+        acumulado += item[campo]
+    itens[-1][campo] = round(total - acumulado, 2)
+
+
+# 🔹 Nota
+
+def _data_iso(texto):
+    m = _RE_DATA.search(texto or "")
+    return f"{m.group(3)}-{m.group(2)}-{m.group(1)}" if m else None
+
+
+def _confianca(dados, chave, total_produtos):
+    """
+    Soma dos pesos das conferências que passaram (0.0 a 1.0) e a lista das que falharam.
+    """
+    conferencias = {"chave": bool(chave)}
+    if chave:
+        partes = partes_chave(chave)
+        conferencias["cnpj_emitente"] = dados["cnpj_emitente"] == partes["cnpj_emitente"]
+        conferencias["data_emissao"] = bool(dados["data_emissao"]) and dados["data_emissao"][2:7].replace("-", "") == partes["aamm"]
+        conferencias["numero"] = dados["numero"] == partes["numero"]
+    else:
+        conferencias["cnpj_emitente"] = len(dados["cnpj_emitente"]) == 14
+        conferencias["data_emissao"] = bool(dados["data_emissao"])
+        conferencias["numero"] = bool(dados["numero"])
+    conferencias["valor_total_nota"] = dados["valor_total_nota"] is not None
+    conferencias["cnpj_destinatario"] = len(dados["cnpj_destinatario"]) in (11, 14)
+    soma_itens = sum(item["valor_total"] for item in dados["itens"])
+    referencia = total_produtos if total_produtos is not None else dados["valor_total_nota"]
+    conferencias["itens"] = bool(dados["itens"]) and referencia is not None and abs(soma_itens - referencia) <= 0.05
+    confianca = round(sum(_PESOS[nome] for nome, ok in conferencias.items() if ok), 2)
+    return confianca, [nome for nome, ok in conferencias.items() if not ok]
+
+
+def analisar_paginas(paginas_palavras):
+    """
+    Lê o DANFE a partir das palavras com posição de cada página (extrair_pdf com
+    com_palavras=True) e devolve {"dados", "confianca", "falhas"}: dados no mesmo formato
+    do JSON pedido à IA (sem tipo_operacao), confianca de 0 a 1 e as conferências que
+    falharam. None se o PDF não tiver texto.
+    """
+    paginas = [_linhas(palavras) for palavras in paginas_palavras or []]
+    if not paginas or not paginas[0]:
+        return None
+
+    linhas = paginas[0]
+    texto = "\n".join(" ".join(p["text"] for p in linha) for linha in linhas)
+    chaves = chaves_no_texto(texto)
+    chave = chaves[0] if chaves else ""
+
+    destinatario = _achar_rotulo(linhas, "DESTINATARIO / REMETENTE") or _achar_rotulo(linhas, "DESTINATARIO/REMETENTE")
+    topo_destinatario = destinatario[0][0]["top"] if destinatario else None
+
+    m = re.search(r"N[º°o]\.?\s*:?\s*([\d.]+)", texto)
+    numero = _digitos(m.group(1)).lstrip("0") if m else ""
+    if not numero and chave:
+        numero = partes_chave(chave)["numero"]
+    m = re.search(r"RECEBEMOS DE (.+?) OS PRODUTOS", _norm(texto))
+    nome_emitente = _valor_abaixo(linhas, "IDENTIFICACAO DO EMITENTE", acima_de=topo_destinatario) or (m.group(1).strip() if m else "")
+
+    dados = {
+        "numero": numero,
+        "data_emissao": _data_iso(_valor_abaixo(linhas, "DATA DA EMISSAO")),
+        "cnpj_emitente": _digitos(_valor_abaixo(linhas, "CNPJ", acima_de=topo_destinatario)),
+        "nome_emitente": nome_emitente,
+        "ie_emitente": _valor_abaixo(linhas, "INSCRICAO ESTADUAL", acima_de=topo_destinatario) or "",
+        "endereco_emitente": "",
+        "cnpj_destinatario": _digitos(_valor_abaixo(linhas, "CNPJ / CPF", abaixo_de=topo_destinatario)),
+        "nome_destinatario": _valor_abaixo(linhas, "NOME / RAZAO SOCIAL", abaixo_de=topo_destinatario) or "",
+        "ie_destinatario": _valor_abaixo(linhas, "INSCRICAO ESTADUAL", abaixo_de=topo_destinatario) or "",
+        "endereco_destinatario": _valor_abaixo(linhas, "ENDERECO", abaixo_de=topo_destinatario) or "",
+        "chave_nfe": chave,
+        "natureza_operacao": _valor_abaixo(linhas, "NATUREZA DA OPERACAO") or "",
+        "valor_total_nota": _numero(_valor_abaixo(linhas, "VALOR TOTAL DA NOTA")),
+        "versao": "",
+        "itens": [item for linhas_pagina in paginas for item in _itens_da_pagina(linhas_pagina)],
+    }
+    _ratear(dados["itens"], "pis_valor", _numero(_valor_abaixo(linhas, "VALOR DO PIS")))
+    _ratear(dados["itens"], "cofins_valor", _numero(_valor_abaixo(linhas, "VALOR DA COFINS")))
+
+    confianca, falhas = _confianca(dados, chave, _numero(_valor_abaixo(linhas, "VALOR TOTAL DOS PRODUTOS")))
+    return {"dados": dados, "confianca": confianca, "falhas": falhas}
+
+
+def analisar_danfe(fonte):
+    """
+    Atalho: extrai as palavras do PDF (caminho ou arquivo binário) e chama analisar_paginas.
+    """
+    return analisar_paginas(extrair_pdf(fonte, com_palavras=True)["palavras"])
@@ -1,17 +1,177 @@
 # Extrai texto bruto de PDFs (usando pdfplumber), útil para enviar ao Gemini.
+# Página a página: cada página é lida uma vez (texto e palavras saem do mesmo cache de
+# layout do pdfplumber) e liberada em seguida; para no limite de páginas ou quando o
+# DANFE acaba ("FOLHA n/N"), então um relatório de 300 páginas enviado por engano não
+# é lido inteiro. Opcionalmente roda em processos separados com timeout por documento.
+# Config: PDF_MAX_PAGINAS, PDF_ISOLADO (1 = processo separado), PDF_TIMEOUT (segundos),
+# PDF_PROCESSOS (extrações isoladas simultâneas).
+
+import io
+import os
+import re
+import logging
+import threading
+import multiprocessing
+from services.carregamento import modulo_tardio
+
+pdfplumber = modulo_tardio("pdfplumber")  # pdfplumber/pdfminer só no primeiro PDF, não no boot do worker
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGINAS = int(os.environ.get("PDF_MAX_PAGINAS", "20"))
+ISOLADO = os.environ.get("PDF_ISOLADO", "0") == "1"
+TIMEOUT_SEGUNDOS = float(os.environ.get("PDF_TIMEOUT", "30"))
+PROCESSOS_ISOLADOS = int(os.environ.get("PDF_PROCESSOS", "2"))
+
+_RE_FOLHA = re.compile(r"\b(?:FOLHA|FL\.?)\s*(\d+)\s*/\s*(\d+)", re.IGNORECASE)
+_CAMPOS_PALAVRA = ("text", "x0", "x1", "top", "bottom")
+
+
+def iterar_paginas(fonte, max_paginas=None, com_palavras=False):
+    """
+    Gerador de (texto, palavras) por página, na ordem. Página sem texto (escaneada)
+    vem como "". palavras só com com_palavras=True (senão None). Termina no limite de
+    páginas ou na última folha do DANFE indicada na primeira página.
+    """
+    max_paginas = max_paginas or MAX_PAGINAS
+    with pdfplumber.open(fonte) as pdf:
+        ultima = min(len(pdf.pages), max_paginas)
+        for numero in range(ultima):
+            pagina = pdf.pages[numero]
+            texto = pagina.extract_text() or ""
+            palavras = None
+            if com_palavras:
+                palavras = [{campo: p[campo] for campo in _CAMPOS_PALAVRA} for p in pagina.extract_words()]
+            pagina.flush_cache()  # Libera chars/layout da página antes da próxima
+            if numero == 0:
+                folha = _RE_FOLHA.search(texto)
+                if folha and int(folha.group(1)) == 1:
+                    ultima = min(ultima, max(1, int(folha.group(2))))
+            yield texto, palavras
+            if numero + 1 >= ultima:
+                break
+
+
+def _extrair(fonte, max_paginas, com_palavras):
+    textos, paginas_palavras = [], []
+    for texto, palavras in iterar_paginas(fonte, max_paginas, com_palavras):
+        textos.append(texto)
+        if com_palavras:
+            paginas_palavras.append(palavras)
+    return {"texto": "\n".join(textos).strip(), "palavras": paginas_palavras if com_palavras else None}
+
+
+def _extrair_bytes(conteudo, max_paginas, com_palavras):
+    # Alvo do extrator isolado (função de módulo: precisa ser importável no processo filho)
+    return _extrair(io.BytesIO(conteudo), max_paginas, com_palavras)
+
+
+# 🔹 Extratores isolados: um PDF patológico é morto no timeout sem travar o worker
+# Cada extrator é um processo (spawn) com um Pipe próprio e atende um PDF por vez; no
+# timeout só o processo daquele PDF morre, e os outros PDFs em andamento seguem. O tempo
+# conta a partir do envio ao extrator (espera por um extrator livre não entra).
+
+TAREFAS_POR_PROCESSO = 100  # Recicla o processo (memória do pdfminer) depois de tantos PDFs
+
+_vagas = threading.BoundedSemaphore(PROCESSOS_ISOLADOS)
+_ociosos = []
+_ociosos_lock = threading.Lock()
+
+
+def _laco_extrator(conexao):
+    # Roda no processo filho: recebe (conteudo, max_paginas, com_palavras) até receber None
+    while True:
+        tarefa = conexao.recv()
+        if tarefa is None:
+            return
+        try:
+            conexao.send(("ok", _extrair_bytes(*tarefa)))
+        except Exception as e:
+            try:
+                conexao.send(("erro", e))
+            except Exception:  # Exceção que não serializa
+                conexao.send(("erro", RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Extrator:
+    def __init__(self):
+        contexto = multiprocessing.get_context("spawn")  # Mesma escolha do ingestao_service
+        self.conexao, filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_laco_extrator, args=(filho,), name="extrator-pdf", daemon=True)
+        self.processo.start()
+        filho.close()
+        self.tarefas = 0
+
+    def matar(self):
+        self.processo.kill()
+        self.processo.join()
+        self.conexao.close()
+
+    def encerrar(self):
+        try:
+            self.conexao.send(None)
+            self.processo.join(5)
+        except OSError:
+            pass
+        if self.processo.is_alive():
+            self.processo.kill()
+        self.conexao.close()
+
+
+def _extrair_isolado(conteudo, max_paginas, com_palavras, timeout):
+    with _vagas:  # No máximo PDF_PROCESSOS extrações simultâneas
+        with _ociosos_lock:
+            extrator = _ociosos.pop() if _ociosos else None
+        if extrator is None or not extrator.processo.is_alive():
+            extrator = _Extrator()
+        try:
+            extrator.conexao.send((conteudo, max_paginas, com_palavras))
+            terminou = extrator.conexao.poll(timeout)
+            status, valor = extrator.conexao.recv() if terminou else (None, None)
+        except (EOFError, OSError) as e:  # Processo morreu no meio (memória, crash do parser)
+            extrator.matar()
+            raise RuntimeError(f"processo de extração do PDF terminou: {e}")
+        if not terminou:
+            extrator.matar()  # Só este PDF; os outros extratores continuam
+            raise TimeoutError(f"extração do PDF passou de {timeout:g}s")
+        extrator.tarefas += 1
+        if extrator.tarefas >= TAREFAS_POR_PROCESSO:
+            extrator.encerrar()
+        else:
+            with _ociosos_lock:
+                _ociosos.append(extrator)
+    if status == "erro":
+        raise valor
+    return valor
+
+
+def extrair_pdf(fonte, max_paginas=None, com_palavras=False, isolado=None, timeout=None):
+    """
+    Lê o PDF (caminho, bytes ou arquivo binário) uma vez e devolve {"texto", "palavras"}:
+    texto das páginas lidas e, com com_palavras=True, as palavras com posição por página
+    (entrada do danfe_parser). isolado/timeout: padrão PDF_ISOLADO/PDF_TIMEOUT.
+    Erros (PDF corrompido, timeout) sobem como exceção.
+    """
+    isolado = ISOLADO if isolado is None else isolado
+    if not isolado:
+        return _extrair(io.BytesIO(fonte) if isinstance(fonte, (bytes, bytearray)) else fonte, max_paginas, com_palavras)
+    if isinstance(fonte, str):
+        with open(fonte, "rb") as f:
+            conteudo = f.read()
+    elif isinstance(fonte, (bytes, bytearray)):
+        conteudo = bytes(fonte)
+    else:
+        conteudo = fonte.read()
+    return _extrair_isolado(conteudo, max_paginas or MAX_PAGINAS, com_palavras, timeout or TIMEOUT_SEGUNDOS)
 
-import pdfplumber
 
 def extrair_texto_pdf(caminho_pdf):
     """
     Extrai o texto de um arquivo PDF.
-    Retorna uma string com o texto completo.
+    Retorna uma string com o texto (vazia se o PDF não puder ser lido).
     """
     try:
-        texto = ""
-        with pdfplumber.open(caminho_pdf) as pdf:
-            for pagina in pdf.pages:
-                texto += pagina.extract_text() + "\n"
-        return texto.strip()
+        return extrair_pdf(caminho_pdf)["texto"]
     except Exception as e:
-        return f"Erro ao ler PDF: {str(e)}"
+        logger.error("Erro ao ler PDF: %s", e)
+        return ""
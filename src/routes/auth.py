@@ -1,20 +1,23 @@
+import logging
 from flask import Blueprint, request, jsonify, session
-from database.connection import SessionLocal
+from sqlalchemy.exc import IntegrityError
+from database.sessao_request import obter_db
 from models.usuario import Usuario
-import requests
+from services.llm_clients import sessao_http, TIMEOUT_HTTP
 import bcrypt
 
 auth_bp = Blueprint("auth_bp", __name__)
+logger = logging.getLogger(__name__)
 
 # 🔹 Função auxiliar: consulta dados da empresa pelo CNPJ
 def consultar_dados_cnpj(cnpj: str):
     try:
-        response = requests.get(f"https://publica.cnpj.ws/cnpj/{cnpj}")
+        response = sessao_http().get(f"https://publica.cnpj.ws/cnpj/{cnpj}", timeout=TIMEOUT_HTTP)
         if response.status_code != 200:
             return None
         return response.json()
     except Exception as e:
-        print(f"Erro ao consultar CNPJ: {e}")
+        logger.error("Erro ao consultar CNPJ: %s", e)
         return None
 
 
@@ -30,16 +33,15 @@ def register_user():
     if not senha:
         return jsonify({"erro": "Senha obrigatória"}), 400
 
-    db = SessionLocal()
+    db = obter_db()
 
     # Evita duplicidade
     if db.query(Usuario).filter_by(cnpj=cnpj).first():
-        db.close()
         return jsonify({"erro": "CNPJ já cadastrado"}), 409
+    db.close()  # Não segura conexão do pool durante a consulta externa
 
     dados = consultar_dados_cnpj(cnpj)
     if not dados:
-        db.close()
         return jsonify({"erro": "Erro ao consultar API de CNPJ"}), 500
 
     # Extrai os dados principais
@@ -65,8 +67,11 @@ def register_user():
     )
 
     db.add(novo_usuario)
-    db.commit()
-    db.close()
+    try:
+        db.commit()
+    except IntegrityError:  # Outro cadastro do mesmo CNPJ commitou durante a consulta externa
+        db.rollback()
+        return jsonify({"erro": "CNPJ já cadastrado"}), 409
 
     return jsonify({"mensagem": "Usuário cadastrado com sucesso!"}), 201
 
@@ -78,21 +83,17 @@ def login_user():
     cnpj = data.get("cnpj", "").replace(".", "").replace("/", "").replace("-", "")
     senha = data.get("senha", "")
 
-    db = SessionLocal()
-    usuario = db.query(Usuario).filter_by(cnpj=cnpj).first()
+    usuario = obter_db().query(Usuario).filter_by(cnpj=cnpj).first()
 
     if not usuario:
-        db.close()
         return jsonify({"erro": "Usuário não encontrado"}), 404
 
     if not bcrypt.checkpw(senha.encode("utf-8"), usuario.senha.encode("utf-8")):
-        db.close()
         return jsonify({"erro": "Senha incorreta"}), 401
 
     # Guarda o CNPJ logado na sessão
     session["cnpj"] = usuario.cnpj
 
-    db.close()
     return jsonify({
         "mensagem": "Login realizado com sucesso!",
         "usuario": {
@@ -109,14 +110,11 @@ def get_usuario_dados():
         return jsonify({"erro": "Não autorizado"}), 401
     
     cnpj = session["cnpj"]
-    db = SessionLocal()
-    usuario = db.query(Usuario).filter_by(cnpj=cnpj).first()
+    usuario = obter_db().query(Usuario).filter_by(cnpj=cnpj).first()
     
     if not usuario:
-        db.close()
         return jsonify({"erro": "Usuário não encontrado"}), 404
     
-    db.close()
     return jsonify({
     "nome": usuario.nome,
     "regime": usuario.regime_tributario,
@@ -135,7 +133,7 @@ def atualizar_rbt12():
     if rbt12 < 0:
         return jsonify({"erro": "RBT12 deve ser positivo"}), 400
     
-    db = SessionLocal()
+    db = obter_db()
     try:
         usuario = db.query(Usuario).filter_by(cnpj=session["cnpj"]).first()
         if not usuario:
@@ -143,11 +141,9 @@ def atualizar_rbt12():
         
         usuario.rbt12 = float(rbt12)
         db.commit()
-        db.close()
         return jsonify({"mensagem": "RBT12 atualizado com sucesso!", "rbt12": rbt12}), 200
     except Exception as e:
         db.rollback()
-        db.close()
         return jsonify({"erro": str(e)}), 500
 
 # 🔹 Rota: LOGOUT
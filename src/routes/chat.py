@@ -1,13 +1,65 @@
 # src/routes/chat.py
-from flask import Blueprint, request, jsonify, session
-import requests
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+import json
+import logging
 import time  # Para retry
-from database.connection import SessionLocal
-from models.nota_fiscal import NotaFiscal, ItemNota  # ItemNota pra detalhes
-from models.usuario import Usuario  # Pra regime
-from services.gemini_service import chamar_gemini  # Mantenha para Grok se necessário, mas use processar_pergunta_chat para Gemini
+from database.sessao_request import obter_db
+from services.contexto_service import construir_contexto_chat, tipo_operacao_pergunta, estimar_tokens
+from services.roteador_perguntas import responder_com_sql
+from services.cache_respostas import chave_cache, versao_dados, obter_resposta, guardar_resposta, estatisticas_cache
+from services.llm_clients import sessao_http, TIMEOUT_HTTP
+from services.metricas import cronometrar, contar_llm, ETAPAS
+from services.gemini_service import chamar_gemini, stream_gemini  # Mantenha para Grok se necessário, mas use processar_pergunta_chat para Gemini
 
 chat_bp = Blueprint("chat_bp", __name__)
+logger = logging.getLogger(__name__)
+
+MODELO_GEMINI = "gemini-2.5-flash"
+MODELO_GROK = "grok-beta"
+URL_GROK = "https://api.x.ai/v1/chat/completions"
+# Textos de erro que chamar_gemini / chamar_grok_with_retry devolvem no lugar da resposta
+_PREFIXOS_ERRO = ("⚠️ Erro", "❌", "Erro Grok", "Erro ao")
+
+def _preparar_chat(pergunta, api_key, cnpj):
+    """
+    Passos comuns a /chat e /chat/stream antes da IA: roteador SQL, provedor pela chave,
+    cache e contexto. Retorna (corpo, status): status None = falta chamar a IA e o corpo
+    traz origem, chave do cache e contexto.
+    """
+    db = obter_db()
+    try:
+        # Perguntas numéricas conhecidas (totais, impostos, rankings) saem direto do banco
+        with cronometrar("chat_sql"):
+            resposta_sql = responder_com_sql(db, pergunta, cnpj)
+        if resposta_sql:
+            return {"resposta": resposta_sql["resposta"], "origem": "sql", "intencao": resposta_sql["intencao"]}, 200
+
+        if not api_key:
+            return {"erro": "Chave da API não fornecida."}, 400
+
+        # Detectar tipo de modelo pela chave
+        if api_key.startswith("AIza"):  # Gemini
+            origem, modelo = "gemini", MODELO_GEMINI
+        elif api_key.startswith("gsk_"):  # Grok
+            origem, modelo = "grok", MODELO_GROK
+        else:
+            return {"erro": "Chave de API inválida."}, 400
+
+        # Mesma pergunta do mesmo CNPJ sem notas novas desde a última resposta: sai do cache
+        with cronometrar("chat_cache"):
+            chave = chave_cache(cnpj, pergunta, origem, modelo, versao_dados(db, cnpj))
+            resposta = obter_resposta(chave)
+        if resposta is not None:
+            return {"resposta": resposta, "origem": origem, "cache": True}, 200
+
+        # Notas mais relevantes pra pergunta (filtra por saída/entrada se for só sobre um dos dois)
+        with cronometrar("chat_contexto"):
+            contexto = construir_contexto_chat(db, cnpj, tipo_operacao_pergunta(pergunta), pergunta=pergunta)
+        logger.debug("CONTEXTO CHAT: %.500s...", contexto)
+        return {"origem": origem, "chave": chave, "contexto": contexto}, None
+    finally:
+        db.close()  # Devolve a conexão ao pool antes da IA (o teardown fecharia só no fim do stream)
+
 
 @chat_bp.route("/chat", methods=["POST"])
 def chat_ia():
@@ -20,98 +72,139 @@ def chat_ia():
 
     if not pergunta:
         return jsonify({"erro": "Pergunta não fornecida."}), 400
-    if not api_key:
-        return jsonify({"erro": "Chave da API não fornecida."}), 400
 
     # Verifica autenticação via sessão
     cnpj = session.get("cnpj")
     if not cnpj:
         return jsonify({"erro": "Não autorizado. Faça login."}), 401
 
-    db = SessionLocal()
     try:
-        # Detectar se pergunta é sobre saída/entrada para filtrar query
-        is_saida = "saida" in pergunta.lower() or "saída" in pergunta.lower()
-        is_entrada = "entrada" in pergunta.lower()
-
-        filter_tipo = None
-        if is_saida and not is_entrada:
-            filter_tipo = 'Saída'
-        elif is_entrada and not is_saida:
-            filter_tipo = 'Entrada'
-
-        # Query: Últimas 5 notas do usuário (emitente ou destinatário), filtrado se aplicável
-        query = db.query(NotaFiscal).filter(
-            (NotaFiscal.cnpj_emitente == cnpj) | (NotaFiscal.cnpj_destinatario == cnpj)
-        )
-        if filter_tipo:
-            query = query.filter(NotaFiscal.tipo_operacao == filter_tipo)
-        notas = query.order_by(NotaFiscal.data_emissao.desc()).limit(5).all()
-
-        # Query: Dados do usuário (regime tributário + natureza_juridica)
-        usuario = db.query(Usuario).filter_by(cnpj=cnpj).first()
-        regime = usuario.regime_tributario if usuario else "desconhecido"
-        natureza = usuario.natureza_juridica if usuario else "desconhecida"
-
-        # Constrói contexto resumido com itens detalhados + impostos (mais conciso)
-        contexto = f"Regime: {regime}, Natureza: {natureza}.\n"
-        if not notas:
-            contexto += "Nenhuma nota encontrada."
-        else:
-            contexto += "Notas:\n"
-            for nota in notas:
-                itens_resumo = []
-                itens = db.query(ItemNota).filter_by(nota_id=nota.id).all()  # Removido limit para completude, mas mantém conciso
-                print(f"DEBUG CHAT: Nota {nota.id} tem {len(itens)} itens encontrados.")  # Debug
-                if itens:
-                    for item in itens:
-                        val_unit = float(getattr(item, 'valor_unitario', 0) or 0)
-                        val_total = float(getattr(item, 'valor_total', 0) or 0)
-                        qtd = float(getattr(item, 'quantidade', 0) or 0)
-                        icms_item = float(getattr(item, 'icms_valor', 0) or 0)
-                        ipi_item = float(getattr(item, 'ipi_valor', 0) or 0)
-                        pis_item = float(getattr(item, 'pis_valor', 0) or 0)
-                        cofins_item = float(getattr(item, 'cofins_valor', 0) or 0)
-                        itens_resumo.append(
-                            f"{item.descricao_produto or 'N/A'} (qtd:{qtd}, unit:R${val_unit:.2f}, total:R${val_total:.2f}, NCM:{item.ncm or 'N/A'}, CFOP:{item.cfop or 'N/A'}, CST IPI:{item.cst_ipi or 'N/A'}, ICMS:R${icms_item:.2f}, IPI:R${ipi_item:.2f}, PIS:R${pis_item:.2f}, COFINS:R${cofins_item:.2f})"
-                        )
-                    itens_str = "; ".join(itens_resumo)
-                else:
-                    itens_str = "Sem itens."
-                contexto += f"- Nota {nota.numero} ({nota.data_emissao}): Total R${nota.valor_total_nota or 0}, Natureza: {nota.natureza_operacao or 'N/A'}, Tipo: {nota.tipo_operacao or 'N/A'}. Itens: {itens_str}.\n"
-
-        db.close()
-        print(f"DEBUG CONTEXTO: {contexto[:500]}...")  # Debug
+        corpo, status = _preparar_chat(pergunta, api_key, cnpj)
+    except Exception as e:
+        logger.exception("ERRO CHAT (dados): %s", e)
+        return jsonify({"erro": f"Erro ao acessar dados: {str(e)}"}), 500
+    if status:
+        return jsonify(corpo), status
 
-        try:
-            # Detectar tipo de modelo pela chave
-            if api_key.startswith("AIza"):  # Gemini
-                resposta = chamar_gemini_with_retry(pergunta, api_key, contexto, cnpj)
-            elif api_key.startswith("gsk_"):  # Grok
-                resposta = chamar_grok_with_retry(pergunta, api_key, contexto, cnpj)
+    origem = corpo["origem"]
+    try:
+        with cronometrar("chat_llm"):
+            if origem == "gemini":
+                resposta = chamar_gemini_with_retry(pergunta, api_key, corpo["contexto"], cnpj)
             else:
-                return jsonify({"erro": "Chave de API inválida."}), 400
+                resposta = chamar_grok_with_retry(pergunta, api_key, corpo["contexto"], cnpj)
 
-            return jsonify({"resposta": resposta}), 200
+        if not resposta.startswith(_PREFIXOS_ERRO):  # Erros voltam como texto: não cachear
+            guardar_resposta(corpo["chave"], resposta)
+        return jsonify({"resposta": resposta, "origem": origem, "cache": False}), 200
 
-        except Exception as e:
-            print(f"DEBUG ERRO IA: {e}")
-            return jsonify({"erro": f"Erro ao processar IA: {str(e)}"}), 500
+    except Exception as e:
+        logger.error("ERRO CHAT (IA): %s", e)
+        return jsonify({"erro": f"Erro ao processar IA: {str(e)}"}), 500
 
+
+def _evento(dados):
+    return f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+@chat_bp.route("/chat/stream", methods=["POST"])
+def chat_ia_stream():
+    """
+    Mesmo fluxo do /chat, mas a resposta chega como Server-Sent Events, pedaço a pedaço.
+    Eventos (data: JSON): {"tipo": "inicio", "origem"}, {"tipo": "token", "texto"},
+    {"tipo": "fim", "cache"} ou {"tipo": "erro", "erro"}. Erros antes da IA voltam como JSON.
+    """
+    data = request.get_json()
+    pergunta = data.get("pergunta")
+    api_key = data.get("apiKey")
+
+    if not pergunta:
+        return jsonify({"erro": "Pergunta não fornecida."}), 400
+
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+
+    try:
+        corpo, status = _preparar_chat(pergunta, api_key, cnpj)
     except Exception as e:
-        print(f"DEBUG ERRO GERAL: {e}")
-        if 'db' in locals():
-            db.close()
+        logger.exception("ERRO CHAT (dados): %s", e)
         return jsonify({"erro": f"Erro ao acessar dados: {str(e)}"}), 500
+    if status and status != 200:
+        return jsonify(corpo), status
+
+    def eventos():
+        yield _evento({"tipo": "inicio", "origem": corpo["origem"]})
+        if status == 200:  # SQL ou cache: resposta inteira num evento só
+            yield _evento({"tipo": "token", "texto": corpo["resposta"]})
+            yield _evento({"tipo": "fim", "cache": corpo.get("cache", False)})
+            return
+
+        partes = []
+        inicio = time.perf_counter()
+        try:
+            with cronometrar("chat_llm_stream"):
+                if corpo["origem"] == "gemini":
+                    pedacos = stream_gemini_with_retry(pergunta, api_key, corpo["contexto"], cnpj)
+                else:
+                    pedacos = stream_grok_with_retry(pergunta, api_key, corpo["contexto"], cnpj)
+                for texto in pedacos:
+                    if not partes:
+                        ETAPAS.observar(time.perf_counter() - inicio, etapa="chat_llm_primeiro_token")
+                    partes.append(texto)
+                    yield _evento({"tipo": "token", "texto": texto})
+        except Exception as e:
+            logger.error("ERRO CHAT (IA): %s", e)
+            yield _evento({"tipo": "erro", "erro": f"Erro ao processar IA: {str(e)}"})
+            return
+
+        guardar_resposta(corpo["chave"], "".join(partes))
+        yield _evento({"tipo": "fim", "cache": False})
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # Sem buffer no proxy (nginx/Render)
+    )
+
+
+# 🔹 Hits/misses do cache de respostas (deste processo)
+@chat_bp.route("/chat/cache", methods=["GET"])
+def chat_cache_stats():
+    if not session.get("cnpj"):
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    return jsonify(estatisticas_cache()), 200
+
+
+# 🔹 Prompts (iguais no /chat e no /chat/stream)
+def _instrucoes(contexto, user_cnpj):
+    return f"Assistente fiscal. Responda concisa e diretamente, sem texto extra ou sugestões a menos que pedidas. Use tabela só para breakdown se necessário. Foque na pergunta.\n\nClassifique saída/entrada por tipo_operacao ('Saída' se emitente={user_cnpj}, 'Entrada' se destinatário={user_cnpj}). Ignore natureza_operacao para classificação.\n\nAnalise itens por nota para impostos por produto (ex: icms_valor individual). Some impostos cross-itens/notas.\n\nContexto: {contexto}"
+
+
+def _prompt_gemini(pergunta, contexto, user_cnpj):
+    return f"{_instrucoes(contexto, user_cnpj)}\n\nPergunta: {pergunta}\nResposta:"
+
+
+def _corpo_grok(pergunta, contexto, user_cnpj, stream=False):
+    corpo = {
+        "model": MODELO_GROK,
+        "messages": [
+            {"role": "system", "content": _instrucoes(contexto, user_cnpj)},
+            {"role": "user", "content": pergunta}
+        ]
+    }
+    if stream:
+        corpo["stream"] = True
+    return corpo
 
 
 # 🔹 Função auxiliar - Gemini com retry
 def chamar_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
     for attempt in range(max_retries):
         try:
-            prompt = f"Assistente fiscal. Responda concisa e diretamente, sem texto extra ou sugestões a menos que pedidas. Use tabela só para breakdown se necessário. Foque na pergunta.\n\nClassifique saída/entrada por tipo_operacao ('Saída' se emitente={user_cnpj}, 'Entrada' se destinatário={user_cnpj}). Ignore natureza_operacao para classificação.\n\nAnalise itens por nota para impostos por produto (ex: icms_valor individual). Some impostos cross-itens/notas.\n\nContexto: {contexto}\n\nPergunta: {pergunta}\nResposta:"
+            prompt = _prompt_gemini(pergunta, contexto, user_cnpj)
             from services.gemini_service import chamar_gemini as gemini_call
-            return gemini_call(prompt, api_key)
+            return gemini_call(prompt, api_key, MODELO_GEMINI)
         except Exception as e:
             if "503" in str(e) and attempt < max_retries - 1:
                 time.sleep(2 ** attempt)  # Exponential backoff
@@ -121,25 +214,19 @@ def chamar_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries
 
 # 🔹 Função auxiliar - Grok com retry
 def chamar_grok_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
-    url = "https://api.x.ai/v1/chat/completions"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
-    system_prompt = f"Assistente fiscal. Responda concisa e diretamente, sem texto extra ou sugestões a menos que pedidas. Use tabela só para breakdown se necessário. Foque na pergunta.\n\nClassifique saída/entrada por tipo_operacao ('Saída' se emitente={user_cnpj}, 'Entrada' se destinatário={user_cnpj}). Ignore natureza_operacao para classificação.\n\nAnalise itens por nota para impostos por produto (ex: icms_valor individual). Some impostos cross-itens/notas.\n\nContexto: {contexto}"
-    body = {
-        "model": "grok-beta",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": pergunta}
-        ]
-    }
+    body = _corpo_grok(pergunta, contexto, user_cnpj)
 
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, headers=headers, json=body)
+            response = sessao_http().post(URL_GROK, headers=headers, json=body, timeout=TIMEOUT_HTTP)
             if response.status_code == 200:
                 data = response.json()
+                uso = data.get("usage") or {}
+                contar_llm("grok", "chat", "ok", uso.get("prompt_tokens"), uso.get("completion_tokens"))
                 try:
                     return data["choices"][0]["message"]["content"]
                 except Exception:
@@ -148,9 +235,61 @@ def chamar_grok_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3
                 if response.status_code == 503 and attempt < max_retries - 1:
                     time.sleep(2 ** attempt)
                     continue
+                contar_llm("grok", "chat", "erro")
                 return f"Erro Grok: {response.status_code} → {response.text}"
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(2 ** attempt)
                 continue
-            return f"Erro ao chamar Grok: {str(e)}"
\ No newline at end of file
+            contar_llm("grok", "chat", "erro")
+            return f"Erro ao chamar Grok: {str(e)}"
+
+
+# 🔹 Streaming: só dá pra repetir antes do primeiro pedaço (depois o cliente já recebeu texto)
+def _stream_com_retry(abrir, max_retries=3):
+    for attempt in range(max_retries):
+        emitiu = False
+        try:
+            for texto in abrir():
+                emitiu = True
+                yield texto
+            return
+        except Exception as e:
+            if emitiu or attempt == max_retries - 1 or "503" not in str(e):
+                raise
+            time.sleep(2 ** attempt)  # Exponential backoff
+
+
+def stream_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
+    prompt = _prompt_gemini(pergunta, contexto, user_cnpj)
+    return _stream_com_retry(lambda: stream_gemini(prompt, api_key, MODELO_GEMINI), max_retries)
+
+
+def _stream_grok(pergunta, api_key, contexto, user_cnpj):
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    body = _corpo_grok(pergunta, contexto, user_cnpj, stream=True)
+    partes = []
+    with sessao_http().post(URL_GROK, headers=headers, json=body, timeout=TIMEOUT_HTTP, stream=True) as response:
+        if response.status_code != 200:
+            contar_llm("grok", "chat", "erro")
+            raise RuntimeError(f"Erro Grok: {response.status_code} → {response.text}")
+        # Formato OpenAI: linhas "data: {json}" com choices[0].delta.content, fim em "data: [DONE]"
+        for linha in response.iter_lines():
+            if not linha.startswith(b"data:"):
+                continue
+            dado = linha[5:].strip()
+            if dado == b"[DONE]":
+                break
+            texto = json.loads(dado)["choices"][0].get("delta", {}).get("content")
+            if texto:
+                partes.append(texto)
+                yield texto
+    # Stream não traz usage: tokens estimados pelo tamanho do texto
+    contar_llm("grok", "chat", "ok", estimar_tokens(_instrucoes(contexto, user_cnpj) + pergunta), estimar_tokens("".join(partes)))
+
+
+def stream_grok_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
+    return _stream_com_retry(lambda: _stream_grok(pergunta, api_key, contexto, user_cnpj), max_retries)
@@ -0,0 +1,20 @@
+# src/routes/metricas.py
+import os
+import hmac
+from flask import Blueprint, Response, request
+from services.metricas import texto_prometheus
+
+metricas_bp = Blueprint("metricas_bp", __name__)
+
+# Se definido, o scraper manda "Authorization: Bearer <token>" (não tem sessão de login)
+TOKEN_METRICAS = os.environ.get("METRICAS_TOKEN", "")
+
+
+@metricas_bp.route("/metrics", methods=["GET"])
+def metricas():
+    """
+    Latências por etapa e contadores deste processo, no formato texto do Prometheus.
+    """
+    if TOKEN_METRICAS and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {TOKEN_METRICAS}"):
+        return Response("Não autorizado.\n", status=401, mimetype="text/plain")
+    return Response(texto_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,340 @@
+# src/services/busca_notas.py
+# Busca textual das notas pro contexto do chat: índice FTS5 num arquivo SQLite local
+# (funciona igual com o banco principal em SQLite ou PostgreSQL) com a empresa dona
+# (owner_cnpj), nomes dos parceiros, natureza, descrições/códigos dos produtos, NCM,
+# CFOP e datas de cada nota. Índices criados antes do owner_cnpj (com os CNPJs de emitente
+# e destinatário) são reconstruídos pela migração (database/migracoes.py).
+# Notas nunca são apagadas e os ids só crescem, então o índice avança indexando as notas
+# com id maior que o último indexado. Ids pulados no caminho (transação concorrente que
+# ainda não commitou, ou rollback) ficam anotados em lacunas_indice e são conferidos de
+# novo a cada sincronização até LACUNA_EXPIRA_SEGUNDOS. Atraso pequeno (uploads recentes)
+# é indexado antes da busca; atraso grande (primeiro boot, índice apagado) é indexado numa
+# thread em segundo plano, e enquanto isso o chat usa as notas mais recentes.
+# Config: CHAT_BUSCA_SQLITE (caminho do arquivo do índice; padrão busca_notas.db na pasta
+# do database.db quando o banco é SQLite em arquivo, senão em src/), CHAT_BUSCA_INLINE_MAX.
+# Uso (pré-indexar tudo, rodando de src/): python -m services.busca_notas
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import logging
+from sqlalchemy import select, func, or_
+from sqlalchemy.engine import make_url
+from database.connection import DATABASE_URL
+from models.nota_fiscal import NotaFiscal, ItemNota
+from services.roteador_perguntas import normalizar
+
+logger = logging.getLogger(__name__)
+
+
+def _caminho_padrao_indice():
+    # Ao lado do banco principal (não do cwd de quem importou o app)
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        pasta = os.path.dirname(os.path.abspath(url.database))
+    else:
+        pasta = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(pasta, "busca_notas.db")
+
+
+CAMINHO_INDICE = os.environ.get("CHAT_BUSCA_SQLITE") or _caminho_padrao_indice()
+TAMANHO_LOTE_INDICE = 2000
+# Até quantas notas atrasadas o request indexa na hora; acima disso vai pra thread
+INLINE_MAX = int(os.environ.get("CHAT_BUSCA_INLINE_MAX", str(TAMANHO_LOTE_INDICE)))
+# Tempo que um id pulado continua sendo procurado (transação nenhuma dura tanto)
+LACUNA_EXPIRA_SEGUNDOS = int(os.environ.get("CHAT_BUSCA_LACUNA_EXPIRA", "3600"))
+FAIXAS_POR_CONSULTA = 500
+
+_NOMES_MES = ("janeiro", "fevereiro", "marco", "abril", "maio", "junho",
+              "julho", "agosto", "setembro", "outubro", "novembro", "dezembro")
+
+# Palavras que aparecem em qualquer pergunta e não ajudam a escolher notas
+_STOPWORDS = set("""
+a o as os um uma uns umas de da do das dos e em no na nos nas por para pra pro com sem sobre
+que qual quais quanto quanta quantos quantas quando onde como foi foram ser sao esta estao
+meu minha meus minhas me eu voce seu sua ao aos se mais menos muito ja tem ter teve houve
+nota notas fiscal fiscais nf nfe valor valores total totais soma item itens produto produtos
+entrada entradas saida saidas compra compras comprei comprou venda vendas vendi vendeu
+mes ano dia periodo liste mostre
+""".split())
+
+_COLUNAS = "cnpjs, parceiros, produtos, codigos, datas"
+_PESOS_BM25 = "0.0, 2.0, 3.0, 2.0, 1.0"  # Mesma ordem das colunas; cnpjs só filtra
+
+
+def termos_busca(pergunta):
+    """
+    Termos relevantes da pergunta (normalizada, sem stopwords). Palavras com mais de
+    4 letras perdem o plural e viram prefixo ("parafusos" casa com "parafuso sextavado").
+    """
+    termos = []
+    for palavra in re.findall(r"\w+", normalizar(pergunta)):
+        if palavra in _STOPWORDS or len(palavra) < 2:
+            continue
+        if palavra.isalpha() and len(palavra) > 4:
+            palavra = re.sub(r"(es|s)$", "", palavra) + "*"
+        if palavra not in termos:
+            termos.append(palavra)
+    return termos
+
+
+def _consulta_fts(cnpj, termos):
+    alternativas = " OR ".join(
+        f'"{t[:-1]}"*' if t.endswith("*") else f'"{t}"' for t in termos
+    )
+    return f'cnpjs:"{cnpj}" AND ({alternativas})'
+
+
+def _documentos(db, filtro, limite=None):
+    """
+    Notas que passam no `filtro` (até `limite`, em ordem de id), com itens, como linhas do índice.
+    """
+    notas = (
+        select(
+            NotaFiscal.id, NotaFiscal.numero, NotaFiscal.data_emissao, NotaFiscal.owner_cnpj,
+            NotaFiscal.cnpj_emitente, NotaFiscal.cnpj_destinatario, NotaFiscal.nome_emitente,
+            NotaFiscal.nome_destinatario, NotaFiscal.natureza_operacao,
+        )
+        .where(filtro).order_by(NotaFiscal.id).limit(limite).subquery()
+    )
+    linhas = db.execute(
+        select(notas, ItemNota.descricao_produto, ItemNota.codigo_produto, ItemNota.ncm, ItemNota.cfop)
+        .outerjoin(ItemNota, ItemNota.nota_id == notas.c.id)
+        .order_by(notas.c.id, ItemNota.id)
+    )
+    documentos = {}
+    for linha in linhas:
+        doc = documentos.get(linha.id)
+        if doc is None:
+            data = linha.data_emissao
+            doc = documentos[linha.id] = {
+                "cnpjs": linha.owner_cnpj or f"{linha.cnpj_emitente or ''} {linha.cnpj_destinatario or ''}",
+                "parceiros": " ".join(filter(None, (linha.nome_emitente, linha.nome_destinatario, linha.natureza_operacao))),
+                "produtos": [],
+                "codigos": [str(linha.numero or "")],
+                "datas": f"{data.isoformat()} {_NOMES_MES[data.month - 1]} {data.year}" if data else "",
+            }
+        if linha.descricao_produto or linha.codigo_produto:
+            doc["produtos"].append(f"{linha.descricao_produto or ''} {linha.codigo_produto or ''}")
+        doc["codigos"].extend(filter(None, (linha.ncm, linha.cfop)))
+    return [
+        (nota_id, doc["cnpjs"], doc["parceiros"], " ".join(doc["produtos"]), " ".join(doc["codigos"]), doc["datas"])
+        for nota_id, doc in documentos.items()
+    ]
+
+
+class IndiceNotas:
+    """
+    Tabela FTS5 notas_fts (rowid = id da nota) e lacunas_indice (faixas de ids puladas).
+    Uma conexão por thread; a escrita é serializada por BEGIN IMMEDIATE (um lote por
+    transação), então vários workers podem dividir o arquivo.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._local = threading.local()
+        conn = self._conexao()
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS notas_fts USING fts5({_COLUNAS}, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS lacunas_indice (inicio INTEGER, fim INTEGER, criada_em REAL)")
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)  # Transações explícitas
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _ultimo_id(self, conn):
+        return conn.execute("SELECT coalesce(max(rowid), 0) FROM notas_fts").fetchone()[0]
+
+    def _inserir(self, conn, documentos):
+        conn.executemany(
+            f"INSERT OR REPLACE INTO notas_fts (rowid, {_COLUNAS}) VALUES (?, ?, ?, ?, ?, ?)", documentos
+        )
+
+    def antigo(self):
+        """
+        True se há linhas do schema anterior ao owner_cnpj ("emitente destinatário" em cnpjs).
+        """
+        return self._conexao().execute("SELECT 1 FROM notas_fts WHERE cnpjs LIKE '% %' LIMIT 1").fetchone() is not None
+
+    def limpar(self):
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM notas_fts")
+            conn.execute("DELETE FROM lacunas_indice")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def atraso(self, db):
+        """
+        Quantos ids o índice está atrás do banco principal (0 = em dia).
+        """
+        maior = db.execute(select(func.max(NotaFiscal.id))).scalar() or 0
+        return max(0, maior - self._ultimo_id(self._conexao()))
+
+    def _conferir_lacunas(self, db, conn):
+        """
+        Indexa as notas que apareceram dentro das faixas puladas; faixas vencidas saem.
+        """
+        conn.execute("DELETE FROM lacunas_indice WHERE criada_em < ?", (time.time() - LACUNA_EXPIRA_SEGUNDOS,))
+        faixas = conn.execute("SELECT inicio, fim FROM lacunas_indice").fetchall()
+        total = 0
+        for i in range(0, len(faixas), FAIXAS_POR_CONSULTA):
+            lote = faixas[i:i + FAIXAS_POR_CONSULTA]
+            ids = db.execute(
+                select(NotaFiscal.id).where(or_(*(NotaFiscal.id.between(inicio, fim) for inicio, fim in lote)))
+            ).scalars().all()
+            if not ids:
+                continue
+            marcas = ",".join("?" * len(ids))
+            indexados = {linha[0] for linha in conn.execute(f"SELECT rowid FROM notas_fts WHERE rowid IN ({marcas})", ids)}
+            faltando = [nota_id for nota_id in ids if nota_id not in indexados]
+            if faltando:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._inserir(conn, _documentos(db, NotaFiscal.id.in_(faltando)))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                total += len(faltando)
+        return total
+
+    def sincronizar(self, db):
+        """
+        Indexa as notas novas do banco principal (e as que surgiram em lacunas);
+        retorna quantas entraram.
+        """
+        maior = db.execute(select(func.max(NotaFiscal.id))).scalar() or 0
+        conn = self._conexao()
+        total = self._conferir_lacunas(db, conn)
+        while self._ultimo_id(conn) != maior:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ultimo = self._ultimo_id(conn)  # Outro worker pode ter indexado enquanto esperávamos
+                if ultimo > maior:  # Outro worker pode ter visto notas mais novas que as nossas
+                    maior = db.execute(select(func.max(NotaFiscal.id))).scalar() or 0
+                if ultimo > maior:  # Banco principal recriado: o índice antigo não vale mais
+                    conn.execute("DELETE FROM notas_fts")
+                    conn.execute("DELETE FROM lacunas_indice")
+                    ultimo = 0
+                documentos = _documentos(db, NotaFiscal.id > ultimo, TAMANHO_LOTE_INDICE) if ultimo < maior else []
+                agora, anterior, lacunas = time.time(), ultimo, []
+                for documento in documentos:
+                    if documento[0] > anterior + 1:  # Ids ainda não visíveis (ou descartados)
+                        lacunas.append((anterior + 1, documento[0] - 1, agora))
+                    anterior = documento[0]
+                self._inserir(conn, documentos)
+                conn.executemany("INSERT INTO lacunas_indice (inicio, fim, criada_em) VALUES (?, ?, ?)", lacunas)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if not documentos:
+                break
+            total += len(documentos)
+        if total:
+            logger.debug("ÍNDICE DE BUSCA: %s notas indexadas", total)
+        return total
+
+    def buscar(self, cnpj, termos, limite):
+        """
+        Ids das notas da empresa que casam com algum termo,
+        da mais pra menos relevante (bm25).
+        """
+        if not termos:
+            return []
+        return [linha[0] for linha in self._conexao().execute(
+            f"SELECT rowid FROM notas_fts WHERE notas_fts MATCH ? ORDER BY bm25(notas_fts, {_PESOS_BM25}) LIMIT ?",
+            (_consulta_fts(cnpj, termos), limite),
+        )]
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def _obter_indice():
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None:
+                _indice = IndiceNotas(CAMINHO_INDICE)
+    return _indice
+
+
+def indice_antigo():
+    return _obter_indice().antigo()
+
+
+def reconstruir_indice(db):
+    """
+    Esvazia o índice e indexa todas as notas de novo; retorna quantas entraram.
+    """
+    indice = _obter_indice()
+    indice.limpar()
+    return indice.sincronizar(db)
+
+
+_thread_indexacao = None
+_thread_lock = threading.Lock()
+
+
+def _indexar():
+    from database.connection import SessionLocal
+    session = SessionLocal()
+    try:
+        inicio = time.perf_counter()
+        total = _obter_indice().sincronizar(session)
+        if total:
+            logger.info("ÍNDICE DE BUSCA: %s notas indexadas em segundo plano em %.1fs", total, time.perf_counter() - inicio)
+    except Exception as e:
+        logger.error("ERRO ÍNDICE DE BUSCA: %s", e)
+    finally:
+        session.close()
+
+
+def indexar_em_segundo_plano():
+    """
+    Sincroniza o índice numa thread daemon (uma por processo por vez). Chamado no boot
+    do app e quando a busca encontra o índice muito atrasado.
+    """
+    global _thread_indexacao
+    with _thread_lock:
+        if _thread_indexacao is not None and _thread_indexacao.is_alive():
+            return
+        _thread_indexacao = threading.Thread(target=_indexar, name="indice-busca", daemon=True)
+        _thread_indexacao.start()
+
+
+def buscar_notas(db, cnpj, termos, limite):
+    """
+    Ids das notas mais relevantes pros termos. Atraso pequeno é indexado antes da busca;
+    atraso grande vai pra thread e a busca devolve [] (o contexto usa as mais recentes).
+    """
+    indice = _obter_indice()
+    if indice.atraso(db) > INLINE_MAX:
+        indexar_em_segundo_plano()
+        return []
+    indice.sincronizar(db)
+    return indice.buscar(cnpj, termos, limite)
+
+
+if __name__ == "__main__":
+    from database.connection import SessionLocal
+    from services.logs import configurar_logs
+    configurar_logs()
+    session = SessionLocal()
+    try:
+        print(f"{_obter_indice().sincronizar(session)} notas indexadas em {CAMINHO_INDICE}")
+    finally:
+        session.close()
@@ -0,0 +1,94 @@
+# src/services/cache_pdf.py
+# Cache persistente da extração PDF->IA (tabela extracoes_pdf), por hash do arquivo e
+# por hash do texto extraído, mais a checagem prévia da chave de acesso achada no texto.
+# Leituras rodam na etapa de parsing (inclusive em outro processo); a gravação fica
+# na etapa de gravação (gravar_entradas), junto com as notas.
+
+import json
+import hashlib
+import logging
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database.connection import SessionLocal
+from models.extracao_pdf import ExtracaoPdf
+from models.nota_fiscal import NotaFiscal
+from processors.chave_acesso import chaves_no_texto  # noqa: F401 (reexportado pro ingestao_service)
+
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def hash_texto(texto):
+    # Espaços normalizados: a mesma nota reimpressa/reexportada costuma variar só nisso
+    return hashlib.sha256(" ".join(texto.split()).encode("utf-8")).hexdigest()
+
+
+def buscar_extracao(hash_arquivo=None, hash_texto=None, chaves=()):
+    """
+    JSON da nota já extraído (dict) pelo hash do arquivo, do texto ou por uma das chaves; senão None.
+    """
+    filtros = []
+    if hash_arquivo:
+        filtros.append(ExtracaoPdf.hash_arquivo == hash_arquivo)
+    if hash_texto:
+        filtros.append(ExtracaoPdf.hash_texto == hash_texto)
+    if chaves:
+        filtros.append(ExtracaoPdf.chave_nfe.in_(list(chaves)))
+    if not filtros:
+        return None
+    session = SessionLocal()
+    try:
+        for filtro in filtros:  # Do mais específico pro mais amplo
+            dados = session.execute(select(ExtracaoPdf.dados).where(filtro).limit(1)).scalar()
+            if dados:
+                return json.loads(dados)
+        return None
+    finally:
+        session.close()
+
+
+def chave_ja_gravada(chaves, owner_cnpj=""):
+    """
+    Primeira chave da lista que a empresa já tem em notas_fiscais (unique owner_cnpj+chave_nfe), ou None.
+    """
+    if not chaves:
+        return None
+    session = SessionLocal()
+    try:
+        existentes = set(session.execute(
+            select(NotaFiscal.chave_nfe).where(NotaFiscal.owner_cnpj == owner_cnpj, NotaFiscal.chave_nfe.in_(list(chaves)))
+        ).scalars())
+    finally:
+        session.close()
+    return next((chave for chave in chaves if chave in existentes), None)
+
+
+def guardar_extracao(hash_arquivo, hash_texto, chave_nfe, dados, modelo):
+    """
+    Registra a extração; se outro upload já gravou o mesmo arquivo, mantém a existente.
+    """
+    linha = {
+        "hash_arquivo": hash_arquivo,
+        "hash_texto": hash_texto,
+        "chave_nfe": (chave_nfe or None) and str(chave_nfe)[:44],
+        "dados": json.dumps(dados, ensure_ascii=False, default=str),
+        "modelo": modelo,
+    }
+    session = SessionLocal()
+    try:
+        dialeto = session.get_bind().dialect.name
+        if dialeto in ("sqlite", "postgresql"):
+            stmt = (sqlite_insert if dialeto == "sqlite" else pg_insert)(ExtracaoPdf.__table__)
+            session.execute(stmt.on_conflict_do_nothing(index_elements=["hash_arquivo"]), [linha])
+        else:
+            session.add(ExtracaoPdf(**linha))
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+    finally:
+        session.close()
@@ -0,0 +1,220 @@
+# src/services/cache_respostas.py
+# Cache de respostas do chat (IA). Chave = CNPJ + pergunta normalizada + provedor/modelo
+# + versão dos dados do CNPJ (versoes_dados, incrementada na gravação das notas), então
+# um upload novo torna as respostas antigas inalcançáveis sem precisar apagar nada.
+# Backends: "memoria" (LRU por processo, padrão), "sqlite" (arquivo compartilhado entre
+# workers do gunicorn) ou "desligado". Config: CHAT_CACHE, CHAT_CACHE_TTL (segundos),
+# CHAT_CACHE_MAX (entradas), CHAT_CACHE_SQLITE (caminho do arquivo).
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models.versao_dados import VersaoDados
+from services.roteador_perguntas import normalizar
+from services.metricas import CACHE
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.environ.get("CHAT_CACHE", "memoria")
+TTL_SEGUNDOS = int(os.environ.get("CHAT_CACHE_TTL", "3600"))
+MAX_ENTRADAS = int(os.environ.get("CHAT_CACHE_MAX", "1000"))
+CAMINHO_SQLITE = os.environ.get("CHAT_CACHE_SQLITE", "chat_cache.db")
+
+
+# 🔹 Versão dos dados por CNPJ
+
+def incrementar_versao_dados(session, cnpjs):
+    """
+    +1 na versão de cada CNPJ (na transação de quem chama, junto com as notas).
+    """
+    linhas = [{"cnpj": cnpj, "versao": 1} for cnpj in sorted({c for c in cnpjs if c})]
+    if not linhas:
+        return
+    dialeto = session.get_bind().dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        stmt = (sqlite_insert if dialeto == "sqlite" else pg_insert)(VersaoDados.__table__)
+        stmt = stmt.on_conflict_do_update(index_elements=["cnpj"], set_={"versao": VersaoDados.__table__.c.versao + 1})
+        session.execute(stmt, linhas)
+        return
+    for linha in linhas:
+        existente = session.get(VersaoDados, linha["cnpj"])
+        if existente is None:
+            session.add(VersaoDados(**linha))
+        else:
+            existente.versao += 1
+
+
+def versao_dados(db, cnpj):
+    return db.execute(select(VersaoDados.versao).where(VersaoDados.cnpj == cnpj)).scalar() or 0
+
+
+def chave_cache(cnpj, pergunta, provedor, modelo, versao):
+    pergunta = re.sub(r"[^\w\s/]", "", normalizar(pergunta)).strip()  # Pontuação não muda a pergunta
+    bruto = json.dumps([cnpj, pergunta, provedor, modelo, versao], ensure_ascii=False)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+# 🔹 Backends
+
+class CacheMemoria:
+    """
+    LRU com TTL em memória (por processo), protegido por lock.
+    """
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._dados = OrderedDict()  # chave -> (expira_em, resposta)
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            registro = self._dados.get(chave)
+            if registro is None:
+                return None
+            if registro[0] < time.monotonic():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return registro[1]
+
+    def guardar(self, chave, resposta):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + self.ttl, resposta)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entradas:
+                self._dados.popitem(last=False)
+
+    def tamanho(self):
+        return len(self._dados)
+
+
+class CacheSQLite:
+    """
+    Cache num arquivo SQLite compartilhado pelos workers (WAL: leituras não bloqueiam).
+    LRU aproximado: guarda o último uso e, ao passar de max_entradas, apaga os menos usados.
+    """
+    def __init__(self, caminho, max_entradas, ttl):
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conexao() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS respostas ("
+                "chave TEXT PRIMARY KEY, resposta TEXT NOT NULL, expira_em REAL NOT NULL, usado_em REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_respostas_usado_em ON respostas (usado_em)")
+
+    def _conexao(self):
+        # Uma conexão por thread (sqlite3 não compartilha conexão entre threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._conexao() as conn:
+            linha = conn.execute("SELECT resposta, expira_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+            if linha is None:
+                return None
+            if linha[1] < agora:
+                conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                return None
+            conn.execute("UPDATE respostas SET usado_em = ? WHERE chave = ?", (agora, chave))
+            return linha[0]
+
+    def guardar(self, chave, resposta):
+        agora = time.time()
+        with self._conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, expira_em, usado_em) VALUES (?, ?, ?, ?)",
+                (chave, resposta, agora + self.ttl, agora),
+            )
+            excesso = self.tamanho(conn) - self.max_entradas
+            if excesso > 0:
+                conn.execute(
+                    "DELETE FROM respostas WHERE chave IN (SELECT chave FROM respostas ORDER BY usado_em LIMIT ?)",
+                    (excesso,),
+                )
+
+    def tamanho(self, conn=None):
+        return (conn or self._conexao()).execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+
+
+class CacheDesligado:
+    def obter(self, chave):
+        return None
+
+    def guardar(self, chave, resposta):
+        pass
+
+    def tamanho(self):
+        return 0
+
+
+def _criar_cache():
+    if BACKEND == "sqlite":
+        return CacheSQLite(CAMINHO_SQLITE, MAX_ENTRADAS, TTL_SEGUNDOS)
+    if BACKEND == "desligado":
+        return CacheDesligado()
+    return CacheMemoria(MAX_ENTRADAS, TTL_SEGUNDOS)
+
+
+_cache = None  # Criado no primeiro uso (nota_service importa este módulo só pela versão)
+_contadores = {"hits": 0, "misses": 0, "gravacoes": 0}
+_contadores_lock = threading.Lock()
+
+
+def _obter_cache():
+    global _cache
+    if _cache is None:
+        with _contadores_lock:
+            if _cache is None:
+                _cache = _criar_cache()
+    return _cache
+
+
+def _contar(nome):
+    with _contadores_lock:
+        _contadores[nome] += 1
+
+
+def obter_resposta(chave):
+    resposta = _obter_cache().obter(chave)
+    _contar("hits" if resposta is not None else "misses")
+    CACHE.incrementar(cache="respostas", resultado="hit" if resposta is not None else "miss")
+    return resposta
+
+
+def guardar_resposta(chave, resposta):
+    _obter_cache().guardar(chave, resposta)
+    _contar("gravacoes")
+
+
+def estatisticas_cache():
+    """
+    Contadores deste processo (cada worker do gunicorn tem os seus) + tamanho do backend.
+    """
+    with _contadores_lock:
+        dados = dict(_contadores)
+    consultas = dados["hits"] + dados["misses"]
+    dados.update({
+        "backend": BACKEND,
+        "entradas": _obter_cache().tamanho(),
+        "taxa_acerto": round(dados["hits"] / consultas, 3) if consultas else 0.0,
+        "ttl_segundos": TTL_SEGUNDOS,
+        "max_entradas": MAX_ENTRADAS,
+    })
+    return dados
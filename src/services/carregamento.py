@@ -0,0 +1,41 @@
+# src/services/carregamento.py
+# Import tardio de bibliotecas pesadas (pdfplumber/pdfminer, requests, SDKs de IA): o
+# módulo só é importado no primeiro acesso a um atributo, não no boot do worker. Um worker
+# que nunca recebe PDF nem chama API externa não paga o import nem a memória delas.
+# Uso: pdfplumber = modulo_tardio("pdfplumber") no topo do módulo, e o resto do código
+# continua chamando pdfplumber.open(...) normalmente.
+
+import importlib
+import threading
+
+
+class ModuloTardio:
+    """
+    Procurador de um módulo importado no primeiro acesso. Depois do primeiro uso o
+    atributo é lido direto do módulo real (um getattr a mais por acesso).
+    """
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def _carregar(self):
+        with self._lock:  # importlib já serializa o import; o lock evita trabalho repetido
+            if self._modulo is None:
+                self._modulo = importlib.import_module(self._nome)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._modulo or self._carregar(), atributo)
+
+    @property
+    def carregado(self):
+        return self._modulo is not None
+
+    def __repr__(self):
+        estado = "carregado" if self._modulo is not None else "não carregado"
+        return f"<módulo tardio {self._nome} ({estado})>"
+
+
+def modulo_tardio(nome):
+    return ModuloTardio(nome)
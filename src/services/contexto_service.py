@@ -0,0 +1,215 @@
+# src/services/contexto_service.py
+# Contexto do chat fiscal: totais mensais prontos (resumo_mensal) + as notas mais relevantes
+# pra pergunta (busca FTS em busca_notas; sem termos úteis, as mais recentes), com itens,
+# numa consulta só e num formato compacto, até um orçamento de tokens (CHAT_ORCAMENTO_TOKENS).
+# O tamanho do prompt não cresce com o histórico do CNPJ.
+
+import os
+import logging
+from sqlalchemy import select, and_
+from models.nota_fiscal import NotaFiscal, ItemNota
+from models.usuario import Usuario
+from services.resumo_service import totais_mensais
+from services.busca_notas import termos_busca, buscar_notas
+from services.roteador_perguntas import normalizar, periodo_pergunta
+
+logger = logging.getLogger(__name__)
+
+LIMITE_NOTAS_PADRAO = int(os.environ.get("CHAT_LIMITE_NOTAS", "50"))  # Candidatas; o orçamento decide quantas entram
+MESES_RESUMO = int(os.environ.get("CHAT_MESES_RESUMO", "12"))
+ORCAMENTO_TOKENS = int(os.environ.get("CHAT_ORCAMENTO_TOKENS", "3000"))
+
+_LEGENDA_NOTAS = (
+    "Notas (nº | data | tipo | total | natureza | parceiro), itens abaixo de cada uma "
+    "(descrição | qtd | unit | total | NCM | CFOP | CST IPI | impostos; imposto ausente = 0):\n"
+)
+_FORMATO_NOTA = "N{numero} | {data} | {tipo} | R${total:.2f} | {natureza} | {parceiro}\n"
+_FORMATO_ITEM = " - {descricao} | {qtd:g} | {unit:.2f} | {total:.2f} | {ncm} | {cfop} | {cst_ipi}{impostos}\n"
+_FORMATO_MES = (
+    "- {ano_mes} {tipo_operacao}: valor R${valor_total:.2f}, ICMS R${icms_valor:.2f}, IPI R${ipi_valor:.2f}, "
+    "PIS R${pis_valor:.2f}, COFINS R${cofins_valor:.2f} ({quantidade_itens} itens)\n"
+)
+
+
+def estimar_tokens(texto):
+    # ~4 caracteres por token (aproximação suficiente pra orçamento, sem tokenizer do provedor)
+    return len(texto) // 4 + 1
+
+
+def tipo_operacao_pergunta(pergunta):
+    """
+    'Saída' / 'Entrada' quando a pergunta fala só de um dos dois; senão None (sem filtro).
+    """
+    texto = pergunta.lower()
+    is_saida = "saida" in texto or "saída" in texto
+    is_entrada = "entrada" in texto
+    if is_saida and not is_entrada:
+        return "Saída"
+    if is_entrada and not is_saida:
+        return "Entrada"
+    return None
+
+
+def _filtros_notas(cnpj, tipo_operacao, periodo):
+    filtros = [NotaFiscal.owner_cnpj == cnpj]
+    if tipo_operacao:
+        filtros.append(NotaFiscal.tipo_operacao == tipo_operacao)
+    if periodo:
+        filtros.append(and_(NotaFiscal.data_emissao >= periodo[0], NotaFiscal.data_emissao < periodo[1]))
+    return filtros
+
+
+def _consulta_notas_com_itens(cnpj, tipo_operacao, limite_notas, periodo=None, ids=None):
+    """
+    Notas da empresa (owner_cnpj) numa subconsulta com LIMIT, e LEFT JOIN
+    com os itens: uma linha por item (ou uma por nota sem itens), agrupadas por nota.
+    Sem ids: as `limite_notas` mais recentes. Com ids: só essas (ordem fica com quem chama).
+    """
+    notas = select(
+        NotaFiscal.id, NotaFiscal.numero, NotaFiscal.data_emissao, NotaFiscal.valor_total_nota,
+        NotaFiscal.natureza_operacao, NotaFiscal.tipo_operacao, NotaFiscal.cnpj_emitente,
+        NotaFiscal.nome_emitente, NotaFiscal.nome_destinatario,
+    ).where(*_filtros_notas(cnpj, tipo_operacao, periodo))
+    if ids is not None:
+        notas = notas.where(NotaFiscal.id.in_(ids))
+    notas = notas.order_by(NotaFiscal.data_emissao.desc(), NotaFiscal.id.desc()).limit(limite_notas).subquery()
+
+    return (
+        select(
+            notas,
+            ItemNota.id.label("item_id"), ItemNota.descricao_produto, ItemNota.quantidade,
+            ItemNota.valor_unitario, ItemNota.valor_total, ItemNota.ncm, ItemNota.cfop, ItemNota.cst_ipi,
+            ItemNota.icms_valor, ItemNota.ipi_valor, ItemNota.pis_valor, ItemNota.cofins_valor,
+        )
+        .outerjoin(ItemNota, ItemNota.nota_id == notas.c.id)
+        .order_by(notas.c.data_emissao.desc(), notas.c.id.desc(), ItemNota.id)
+    )
+
+
+def _agrupar_por_nota(linhas):
+    """
+    [(linha_da_nota, [linhas_dos_itens])] na ordem em que as notas aparecem.
+    """
+    notas = []
+    for linha in linhas:
+        if not notas or linha.id != notas[-1][0].id:
+            notas.append((linha, []))
+        if linha.item_id is not None:
+            notas[-1][1].append(linha)
+    return notas
+
+
+def _formatar_nota(nota, cnpj):
+    return _FORMATO_NOTA.format(
+        numero=nota.numero,
+        data=nota.data_emissao,
+        tipo=nota.tipo_operacao or 'N/A',
+        total=nota.valor_total_nota or 0,
+        natureza=nota.natureza_operacao or 'N/A',
+        # Parceiro = a outra ponta da nota em relação ao usuário
+        parceiro=(nota.nome_destinatario if nota.cnpj_emitente == cnpj else nota.nome_emitente) or 'N/A',
+    )
+
+
+def _formatar_item(linha):
+    impostos = "".join(
+        f" | {nome} {valor:.2f}"
+        for nome, valor in (("ICMS", linha.icms_valor), ("IPI", linha.ipi_valor), ("PIS", linha.pis_valor), ("COFINS", linha.cofins_valor))
+        if valor
+    )
+    return _FORMATO_ITEM.format(
+        descricao=linha.descricao_produto or 'N/A',
+        qtd=float(linha.quantidade or 0),
+        unit=linha.valor_unitario or 0,
+        total=linha.valor_total or 0,
+        ncm=linha.ncm or 'N/A',
+        cfop=linha.cfop or 'N/A',
+        cst_ipi=linha.cst_ipi or 'N/A',
+        impostos=impostos,
+    )
+
+
+def _casa_termos(linha, termos):
+    texto = normalizar(f"{linha.descricao_produto or ''} {linha.ncm or ''} {linha.cfop or ''}")
+    return any((t[:-1] in texto) if t.endswith("*") else (t in texto.split()) for t in termos)
+
+
+def _notas_candidatas(db, cnpj, tipo_operacao, limite_notas, pergunta):
+    """
+    Notas com itens na ordem de relevância: busca FTS pelos termos da pergunta e, se nada
+    casar (ou o índice falhar), as mais recentes. O período citado na pergunta filtra as duas.
+    """
+    termos, periodo = [], None
+    if pergunta:
+        termos = termos_busca(pergunta)
+        periodo = periodo_pergunta(normalizar(pergunta))
+    ids = []
+    if termos:
+        try:
+            ids = buscar_notas(db, cnpj, termos, limite_notas)
+        except Exception as e:  # Ex.: SQLite sem FTS5, arquivo do índice travado
+            logger.error("ERRO BUSCA NOTAS: %s", e)
+    if ids:
+        posicao = {nota_id: i for i, nota_id in enumerate(ids)}
+        notas = _agrupar_por_nota(db.execute(_consulta_notas_com_itens(cnpj, tipo_operacao, limite_notas, periodo, ids)))
+        if notas:
+            return sorted(notas, key=lambda nota: posicao[nota[0].id]), termos
+    linhas = db.execute(_consulta_notas_com_itens(cnpj, tipo_operacao, limite_notas, periodo).execution_options(yield_per=500))
+    return _agrupar_por_nota(linhas), termos
+
+
+def _empacotar_notas(notas, cnpj, termos, orcamento):
+    """
+    Notas e itens que cabem no orçamento (em tokens), na ordem recebida. Itens que casam
+    com a pergunta vêm primeiro; os que não couberem viram "(+N itens omitidos)".
+    """
+    partes = []
+    for nota, itens in notas:
+        cabecalho = _formatar_nota(nota, cnpj)
+        custo = estimar_tokens(cabecalho)
+        if custo > orcamento:
+            break
+        orcamento -= custo
+        partes.append(cabecalho)
+        if termos:
+            itens = sorted(itens, key=lambda item: not _casa_termos(item, termos))  # Estável: mantém a ordem
+        for n, item in enumerate(itens):
+            linha = _formatar_item(item)
+            custo = estimar_tokens(linha)
+            if custo > orcamento:
+                partes.append(f" - (+{len(itens) - n} itens omitidos)\n")
+                orcamento = 0
+                break
+            orcamento -= custo
+            partes.append(linha)
+        if not itens:
+            partes.append(" - Sem itens.\n")
+    return partes
+
+
+def construir_contexto_chat(db, cnpj, tipo_operacao=None, limite_notas=None, pergunta=None, orcamento_tokens=None):
+    """
+    Texto de contexto do chat: regime/natureza do usuário, totais mensais já somados
+    (resumo_mensal) e as notas mais relevantes pra pergunta com itens e impostos, até
+    orcamento_tokens (padrão CHAT_ORCAMENTO_TOKENS). limite_notas = máximo de candidatas.
+    """
+    limite_notas = limite_notas or LIMITE_NOTAS_PADRAO
+    orcamento = orcamento_tokens or ORCAMENTO_TOKENS
+    usuario = db.query(Usuario.regime_tributario, Usuario.natureza_juridica).filter_by(cnpj=cnpj).first()
+    regime = usuario.regime_tributario if usuario else "desconhecido"
+    natureza = usuario.natureza_juridica if usuario else "desconhecida"
+
+    partes = [f"Regime: {regime}, Natureza: {natureza}.\n"]
+    meses = totais_mensais(db, cnpj, MESES_RESUMO, tipo_operacao)
+    if meses:
+        partes.append("Totais mensais (já somados, use para perguntas de período):\n")
+        partes.extend(_FORMATO_MES.format(**mes) for mes in meses)
+
+    notas, termos = _notas_candidatas(db, cnpj, tipo_operacao, limite_notas, pergunta)
+    if not notas:
+        partes.append("Nenhuma nota encontrada.")
+        return "".join(partes)
+    restante = orcamento - sum(estimar_tokens(parte) for parte in partes) - estimar_tokens(_LEGENDA_NOTAS)
+    partes.append(_LEGENDA_NOTAS)
+    partes.extend(_empacotar_notas(notas, cnpj, termos, restante))
+    return "".join(partes)
@@ -0,0 +1,284 @@
+# src/services/fila_ingestao.py
+# Fila de ingestão assíncrona guardada no próprio banco (sem broker externo).
+# O upload vira um job com um registro por arquivo; um worker local reivindica
+# os arquivos pendentes, processa com o mesmo pipeline do modo síncrono e grava
+# os resultados no job. Uso standalone: `python -m services.fila_ingestao` (em src/).
+
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from database.connection import SessionLocal
+from models.job_ingestao import JobIngestao, ArquivoJob
+from services.ingestao_service import processar_arquivo
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_POLL = float(os.environ.get("FILA_INTERVALO_POLL", "2"))  # Segundos ocioso entre buscas
+WORKERS_FILA = int(os.environ.get("FILA_WORKERS", "1"))  # Threads de worker por processo
+# Arquivo "processando" sem atualização há mais que isso volta pra fila (worker morreu no meio)
+TIMEOUT_ARQUIVO = timedelta(minutes=int(os.environ.get("FILA_TIMEOUT_MINUTOS", "30")))
+# Enquanto processa, o worker renova atualizado_em nesse intervalo (bem abaixo do timeout)
+INTERVALO_BATIMENTO = min(60.0, TIMEOUT_ARQUIVO.total_seconds() / 3)
+# Threads de worker dentro do processo web; 0 = só o worker standalone processa a fila
+WORKER_EMBUTIDO = os.environ.get("FILA_WORKER_EMBUTIDO", "1") == "1"
+
+# Chaves de API ficam só em memória (nunca no banco). Job com chave fica preso ao processo
+# que recebeu o upload (processo_chave); outro processo só o pega se ficar órfão (processo
+# reiniciado, sem worker embutido) e aí processa sem IA, avisando no resultado.
+_PROCESSO = uuid.uuid4().hex
+_chaves_api = {}
+AVISO_SEM_CHAVE = "chave de API indisponível neste worker: PDF lido sem IA"
+_acordar = threading.Event()
+_threads = []
+_threads_lock = threading.Lock()
+
+
+def enfileirar_job(arquivos, api_key="", user_cnpj="", modelo="gemini-2.5-flash"):
+    """
+    arquivos: lista de (caminho, filename) já salvos em disco (o worker apaga depois).
+    Cria o job e os registros de arquivo; retorna o id do job.
+    """
+    job_id = uuid.uuid4().hex
+    session = SessionLocal()
+    try:
+        job = JobIngestao(id=job_id, user_cnpj=user_cnpj, modelo=modelo, total_arquivos=len(arquivos),
+                          com_chave_api=bool(api_key))
+        if api_key and WORKER_EMBUTIDO:
+            job.processo_chave = _PROCESSO
+        job.arquivos = [
+            ArquivoJob(ordem=ordem, filename=filename, caminho=caminho)
+            for ordem, (caminho, filename) in enumerate(arquivos)
+        ]
+        if not arquivos:
+            job.status = "concluido"
+        session.add(job)
+        session.commit()
+    finally:
+        session.close()
+
+    if api_key and WORKER_EMBUTIDO:
+        _chaves_api[job_id] = api_key
+    _acordar.set()
+    return job_id
+
+
+def consultar_job(job_id, user_cnpj=None):
+    """
+    Progresso e resultados (por arquivo, na ordem do upload) de um job; None se não existir
+    (ou, com user_cnpj, se for de outra empresa).
+    """
+    session = SessionLocal()
+    try:
+        job = session.get(JobIngestao, job_id)
+        if job is None or (user_cnpj is not None and job.user_cnpj != user_cnpj):
+            return None
+        resultados = []
+        for arquivo in job.arquivos:
+            if arquivo.resultados:
+                resultados.extend(json.loads(arquivo.resultados))
+        total = job.total_arquivos or 0
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "total_arquivos": total,
+            "arquivos_processados": job.arquivos_processados,
+            "progresso": round(100.0 * job.arquivos_processados / total, 1) if total else 100.0,
+            "criado_em": job.criado_em.isoformat() if job.criado_em else None,
+            "atualizado_em": job.atualizado_em.isoformat() if job.atualizado_em else None,
+            "resultados": resultados,
+        }
+    finally:
+        session.close()
+
+
+def _reivindicar_arquivo(session):
+    """
+    Pega o arquivo pendente mais antigo que este processo pode tratar (job sem chave, com
+    a chave aqui, ou órfão há mais de FILA_TIMEOUT_MINUTOS). O UPDATE condicional garante
+    que dois workers (threads ou processos) nunca processem o mesmo arquivo; o token em
+    reivindicado_por identifica esta reivindicação até o fim do processamento.
+    """
+    orfao = datetime.utcnow() - TIMEOUT_ARQUIVO
+    candidatos = (
+        session.query(ArquivoJob.id)
+        .join(JobIngestao, JobIngestao.id == ArquivoJob.job_id)
+        .filter(ArquivoJob.status == "pendente")
+        .filter(or_(
+            JobIngestao.processo_chave.is_(None),
+            JobIngestao.processo_chave == _PROCESSO,
+            ArquivoJob.atualizado_em < orfao,
+        ))
+        .order_by(ArquivoJob.id)
+        .limit(5)
+        .all()
+    )
+    for (arquivo_id,) in candidatos:
+        res = session.execute(
+            update(ArquivoJob)
+            .where(ArquivoJob.id == arquivo_id, ArquivoJob.status == "pendente")
+            .values(status="processando", reivindicado_por=uuid.uuid4().hex, atualizado_em=datetime.utcnow())
+        )
+        session.commit()
+        if res.rowcount == 1:
+            return session.get(ArquivoJob, arquivo_id)
+    return None
+
+
+def _devolver_travados(session):
+    limite = datetime.utcnow() - TIMEOUT_ARQUIVO
+    res = session.execute(
+        update(ArquivoJob)
+        .where(ArquivoJob.status == "processando", ArquivoJob.atualizado_em < limite)
+        .values(status="pendente", atualizado_em=datetime.utcnow())
+    )
+    session.commit()
+    if res.rowcount:
+        logger.warning("FILA: %s arquivo(s) travado(s) devolvido(s) pra fila", res.rowcount)
+
+
+def _dono_do_arquivo(arquivo_id, dono):
+    return (ArquivoJob.id == arquivo_id, ArquivoJob.status == "processando", ArquivoJob.reivindicado_por == dono)
+
+
+@contextmanager
+def _batimento(arquivo_id, dono):
+    """
+    Renova atualizado_em do arquivo numa thread enquanto o bloco roda: arquivo grande ou
+    com muita chamada de IA não passa por travado (_devolver_travados) nem é reprocessado.
+    """
+    parar = threading.Event()
+
+    def _bater():
+        while not parar.wait(INTERVALO_BATIMENTO):
+            session = SessionLocal()
+            try:
+                res = session.execute(
+                    update(ArquivoJob).where(*_dono_do_arquivo(arquivo_id, dono)).values(atualizado_em=datetime.utcnow())
+                )
+                session.commit()
+                if res.rowcount == 0:
+                    return  # Outro worker assumiu o arquivo
+            except Exception as e:
+                session.rollback()
+                logger.warning("FILA: batimento do arquivo %s falhou: %s", arquivo_id, e)
+            finally:
+                session.close()
+
+    thread = threading.Thread(target=_bater, name=f"fila-batimento-{arquivo_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        thread.join()
+
+
+def _processar_arquivo(session, arquivo):
+    job = arquivo.job
+    if job.status == "pendente":
+        job.status = "processando"
+        session.commit()
+
+    api_key = _chaves_api.get(job.id, "")
+    sem_chave = bool(job.com_chave_api) and not api_key
+    if sem_chave:
+        logger.warning("FILA: job %s enviado com chave de API, mas a chave não está neste processo", job.id)
+
+    arquivo_id, dono, caminho, filename = arquivo.id, arquivo.reivindicado_por, arquivo.caminho, arquivo.filename
+    job_id, user_cnpj, modelo = job.id, job.user_cnpj or "", job.modelo or "gemini-2.5-flash"
+    session.commit()  # Devolve a conexão ao pool durante o processamento (pode levar minutos)
+    try:
+        with _batimento(arquivo_id, dono):
+            resultados = processar_arquivo(caminho, filename, api_key, user_cnpj, modelo)
+    except Exception as e:
+        logger.exception("ERRO FILA (%s)", filename)
+        resultados = [{"arquivo": filename, "status": f"erro inesperado: {str(e)}"}]
+
+    if sem_chave:
+        for resultado in resultados:
+            if str(resultado.get("arquivo", "")).lower().endswith(".pdf"):
+                resultado["aviso"] = AVISO_SEM_CHAVE
+    # Só grava se o arquivo ainda é deste worker; resultado e contador na mesma transação
+    # (contador atômico no banco mesmo com vários workers no mesmo job)
+    res = session.execute(
+        update(ArquivoJob)
+        .where(*_dono_do_arquivo(arquivo_id, dono))
+        .values(resultados=json.dumps(resultados, ensure_ascii=False), status="concluido", atualizado_em=datetime.utcnow())
+    )
+    if res.rowcount != 1:
+        session.rollback()
+        logger.warning("FILA: arquivo %s (%s) foi assumido por outro worker; resultado descartado", arquivo_id, filename)
+        return
+    session.execute(
+        update(JobIngestao)
+        .where(JobIngestao.id == job_id)
+        .values(arquivos_processados=JobIngestao.arquivos_processados + 1, atualizado_em=datetime.utcnow())
+    )
+    session.commit()
+    # O temp só sai depois da gravação: se outro worker assumiu, o arquivo é dele
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+    session.refresh(job)
+    if job.arquivos_processados >= job.total_arquivos:
+        job.status = "concluido"
+        session.commit()
+        _chaves_api.pop(job.id, None)
+        logger.debug("FILA: job %s concluído (%s arquivos)", job.id, job.total_arquivos)
+
+
+def executar_worker(parar=None):
+    """
+    Loop do worker: processa arquivos pendentes até `parar` (threading.Event) ser setado.
+    """
+    parar = parar or threading.Event()
+    ultima_checagem = 0.0
+    while not parar.is_set():
+        session = SessionLocal()
+        try:
+            if time.monotonic() - ultima_checagem > 60:
+                _devolver_travados(session)
+                ultima_checagem = time.monotonic()
+            arquivo = _reivindicar_arquivo(session)
+            if arquivo is not None:
+                _processar_arquivo(session, arquivo)
+                continue
+        except Exception as e:
+            session.rollback()
+            logger.error("ERRO WORKER FILA: %s", e)
+        finally:
+            session.close()
+        # Ocioso: espera novo job (ou o intervalo de poll, pra pegar jobs de outros processos)
+        _acordar.wait(INTERVALO_POLL)
+        _acordar.clear()
+
+
+def iniciar_worker():
+    """
+    Sobe as threads de worker embutidas neste processo (uma vez só). Não faz nada com
+    FILA_WORKER_EMBUTIDO=0: quem processa é o `python -m services.fila_ingestao`.
+    """
+    if not WORKER_EMBUTIDO:
+        return
+    with _threads_lock:
+        if _threads:
+            return
+        for i in range(WORKERS_FILA):
+            thread = threading.Thread(target=executar_worker, name=f"fila-ingestao-{i}", daemon=True)
+            thread.start()
+            _threads.append(thread)
+
+
+if __name__ == "__main__":
+    from database.migracoes import executar_migracoes
+    from services.logs import configurar_logs
+    configurar_logs()
+    executar_migracoes()  # Colunas da fila (com_chave_api, reivindicado_por...) em banco antigo
+    print("Worker da fila de ingestão rodando (Ctrl+C para sair)...")
+    executar_worker()
@@ -1,28 +1,34 @@
 # src/services/gemini_service.py
 
-import os
-from google import genai
 from database.connection import SessionLocal
-from models.nota_fiscal import NotaFiscal
-import json
+from services.llm_clients import cliente_gemini
+from services.contexto_service import construir_contexto_chat, tipo_operacao_pergunta, estimar_tokens
+from services.metricas import contar_llm
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-def chamar_gemini(prompt, api_key=None, modelo="gemini-2.5-flash"):
+def _contar_uso(uso, prompt, texto, resposta=None, resultado="ok"):
+    # Tokens do usage_metadata quando o SDK informa; senão estimativa pelo tamanho do texto
+    metadados = getattr(resposta, "usage_metadata", None)
+    contar_llm(
+        "gemini", uso, resultado,
+        getattr(metadados, "prompt_token_count", None) or estimar_tokens(prompt),
+        getattr(metadados, "candidates_token_count", None) or estimar_tokens(texto),
+    )
+
+
+def chamar_gemini(prompt, api_key=None, modelo="gemini-2.5-flash", uso="chat"):
     """
     Usa o SDK oficial do Gemini (v2.5).
-    Recebe o prompt e retorna o texto gerado.
+    Recebe o prompt e retorna o texto gerado. uso ("chat", "pdf") só rotula as métricas.
     """
     try:
         if not api_key:
             return "❌ Nenhuma chave de API fornecida."
 
-        # Configura a chave via ambiente
-        os.environ["GEMINI_API_KEY"] = api_key
-
-        # Cria cliente com a chave informada
-        client = genai.Client(api_key=api_key)
+        # Cliente reaproveitado por chave (conexão já aberta, sem mexer em os.environ)
+        client = cliente_gemini(api_key)
 
         # Chamada para gerar conteúdo
         response = client.models.generate_content(
@@ -31,35 +37,40 @@ def chamar_gemini(prompt, api_key=None, modelo="gemini-2.5-flash"):
         )
 
         # Retorna o texto da resposta
-        return response.text.strip()
+        texto = response.text.strip()
+        _contar_uso(uso, prompt, texto, response)
+        return texto
 
     except Exception as e:
+        contar_llm("gemini", uso, "erro")
         return f"⚠️ Erro ao chamar Gemini: {e}"
 
+def stream_gemini(prompt, api_key, modelo="gemini-2.5-flash"):
+    """
+    Versão em streaming de chamar_gemini: gera os pedaços de texto conforme chegam.
+    Erros sobem como exceção (o chamador decide como avisar o cliente).
+    """
+    client = cliente_gemini(api_key)
+    partes, ultimo = [], None
+    try:
+        for chunk in client.models.generate_content_stream(model=modelo, contents=prompt):
+            ultimo = chunk  # O último pedaço traz o usage_metadata da resposta inteira
+            if chunk.text:
+                partes.append(chunk.text)
+                yield chunk.text
+    except Exception:
+        contar_llm("gemini", "chat", "erro")
+        raise
+    _contar_uso("chat", prompt, "".join(partes), ultimo)
+
 def processar_pergunta_chat(pergunta, api_key, user_cnpj=""):
     """
-    Constrói prompt para o chat, consultando DB e instruindo IA a usar tipo_operacao.
-    Filtra notas relevantes se pergunta for sobre saída/entrada.
+    Constrói prompt para o chat com as notas do usuário mais relevantes pra pergunta
+    (contexto com orçamento de tokens) e instrui a IA a usar tipo_operacao.
     """
     session = SessionLocal()
     try:
-        # Consulta todas notas do usuário (assumindo filtro por user_cnpj se necessário; ajuste se tiver tabela Usuario)
-        notas = session.query(NotaFiscal).all()  # Ajuste para filtro por usuário se implementado
-        notas_json = [
-            {
-                "numero": nota.numero,
-                "data_emissao": nota.data_emissao,
-                "cnpj_emitente": nota.cnpj_emitente,
-                "nome_emitente": nota.nome_emitente,
-                "cnpj_destinatario": nota.cnpj_destinatario,
-                "nome_destinatario": nota.nome_destinatario,
-                "chave_nfe": nota.chave_nfe,
-                "natureza_operacao": nota.natureza_operacao,
-                "valor_total_nota": nota.valor_total_nota,
-                "tipo_operacao": nota.tipo_operacao
-            }
-            for nota in notas
-        ]
+        contexto = construir_contexto_chat(session, user_cnpj, tipo_operacao_pergunta(pergunta), pergunta=pergunta)
 
         # Prompt corrigido: Instrui IA a usar tipo_operacao
         prompt = f"""
@@ -70,7 +81,7 @@ def processar_pergunta_chat(pergunta, api_key, user_cnpj=""):
         Use natureza_operacao apenas para descrever a transação.
 
         Dados das notas:
-        {json.dumps(notas_json, indent=2, ensure_ascii=False)}
+        {contexto}
 
         Pergunta do usuário: {pergunta}
 
@@ -78,11 +89,11 @@ def processar_pergunta_chat(pergunta, api_key, user_cnpj=""):
         """
         
         resposta = chamar_gemini(prompt, api_key)
-        logging.debug(f"RESPOSTA GEMINI CHAT: {resposta[:500]}...")
+        logger.debug("RESPOSTA GEMINI CHAT: %.500s...", resposta)
         return resposta
 
     except Exception as e:
-        logging.error(f"ERRO AO PROCESSAR PERGUNTA CHAT: {e}")
+        logger.error("ERRO AO PROCESSAR PERGUNTA CHAT: %s", e)
         return f"Erro ao processar pergunta: {str(e)}"
     finally:
         session.close()
\ No newline at end of file
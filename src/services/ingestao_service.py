@@ -0,0 +1,716 @@
+# src/services/ingestao_service.py
+# Pipeline de ingestão de arquivos (XML/PDF/CSV): parsing em pool de processos,
+# gravação no banco com concorrência limitada.
+
+import os
+import io
+import json
+import re  # Pra regex stripping e clean CNPJ
+import threading
+import multiprocessing
+import uuid
+import tarfile
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from services.nota_service import salvar_notas_no_db, TAMANHO_LOTE_PADRAO
+from services.cache_pdf import hash_bytes, hash_texto, chaves_no_texto, buscar_extracao, chave_ja_gravada, guardar_extracao
+from services.metricas import cronometrar, cronometrado, coletar, registrar, CACHE, PDFS
+from services.logs import configurar_logs
+
+logger = logging.getLogger(__name__)
+
+# Importadores opcionais (se os módulos existirem)
+try:
+    from processors.xml_processor import iterar_notas_xml
+except Exception:
+    iterar_notas_xml = None
+
+try:
+    from processors.csv_processor import iterar_notas_csv
+except Exception:
+    iterar_notas_csv = None
+
+try:
+    from processors.pdf_extractor import extrair_pdf
+except Exception:
+    extrair_pdf = None
+
+try:
+    from processors.danfe_parser import analisar_paginas
+except Exception:
+    analisar_paginas = None
+
+# serviço que chama Gemini/Grok (implementar em services/gemini_service.py)
+try:
+    from services.gemini_service import chamar_gemini
+except Exception:
+    chamar_gemini = None
+
+# "processos" (padrão), "threads" ou "serial"
+EXECUTOR_PARSING = os.environ.get("INGESTAO_EXECUTOR", "processos")
+WORKERS_PARSING = int(os.environ.get("INGESTAO_WORKERS", "0")) or (os.cpu_count() or 1)
+# Gravações simultâneas no banco (SQLite só aceita um escritor por vez)
+CONCORRENCIA_DB = int(os.environ.get("INGESTAO_DB_CONCORRENCIA", "2"))
+
+# Abaixo desta confiança (0 a 1) a leitura local do DANFE é descartada e o PDF vai pra IA
+CONFIANCA_MINIMA_DANFE = float(os.environ.get("DANFE_CONFIANCA_MINIMA", "0.8"))
+
+# Notas por commit no importador de CSV em streaming
+LOTE_COMMIT_CSV = int(os.environ.get("CSV_LOTE_COMMIT", str(TAMANHO_LOTE_PADRAO)))
+
+# Limites para arquivos compactados (.zip/.tar/.tar.gz), lidos membro a membro em memória
+EXTENSOES_COMPACTADAS = ('.zip', '.tar', '.tar.gz', '.tgz')
+MAX_MEMBROS = int(os.environ.get("COMPACTADO_MAX_MEMBROS", "10000"))
+MAX_DESCOMPACTADO = int(os.environ.get("COMPACTADO_MAX_TOTAL_MB", "1024")) * 1024 * 1024
+MAX_MEMBRO = int(os.environ.get("COMPACTADO_MAX_MEMBRO_MB", "50")) * 1024 * 1024
+
+
+def calcular_tipo_operacao(dados, user_cnpj):
+    """
+    Calcula tipo_operacao baseado em user_cnpj vs cnpj_emitente/destinatario.
+    Usado para consistência em todos formatos.
+    """
+    if user_cnpj:
+        if user_cnpj == dados.get("cnpj_emitente"):
+            return "Saída"
+        elif user_cnpj == dados.get("cnpj_destinatario"):
+            return "Entrada"
+        else:
+            return "Desconhecida"
+    return dados.get("tipo_operacao", "")  # Fallback se já setado ou desconhecido
+
+
+# 🔹 Etapa 1: parsing (sem acesso ao banco; roda em outro processo)
+#
+# Cada função devolve uma lista de entradas. Uma entrada é um resultado final
+# ({"arquivo", "status"}) ou uma nota a gravar ({"arquivo", "dados", "origem"},
+# opcionalmente "nota"); a origem define o texto do status após a gravação.
+
+def _analisar_xml(fonte, filename, user_cnpj):
+    if not iterar_notas_xml:
+        return [{"arquivo": filename, "status": "processador XML não implementado"}]
+
+    entradas = []
+    try:
+        # Um arquivo pode trazer várias NF-e (lote enviNFe, nfeProc em sequência)
+        with cronometrar("xml_parse"):
+            for dados in iterar_notas_xml(fonte, user_cnpj=user_cnpj):  # Já calcula tipo_operacao
+                if dados:
+                    entradas.append({"arquivo": filename, "nota": dados.get("numero"), "dados": dados, "origem": "xml"})
+                else:
+                    entradas.append({"arquivo": filename, "status": "erro parsing XML"})
+        if not entradas:
+            entradas.append({"arquivo": filename, "status": "erro parsing XML"})
+    except ET.ParseError as e:
+        logger.error("ERRO PARSE XML (%s): %s", filename, e)
+        entradas.append({"arquivo": filename, "status": "erro parsing XML"})
+    return entradas
+
+
+def _entrada_pdf_cache(filename, dados, user_cnpj, cache=None):
+    dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)  # Depende de quem envia
+    entrada = {"arquivo": filename, "dados": dados, "origem": "pdf_cache"}
+    if cache:
+        entrada["cache_pdf"] = cache  # Arquivo novo com texto conhecido: registra o hash dele também
+    return entrada
+
+
+def _analisar_pdf(fonte, filename, api_key, user_cnpj, modelo):
+    if not extrair_pdf:
+        return [{"arquivo": filename, "status": "extrator PDF não implementado"}]
+
+    # Cache por conteúdo: mesmo arquivo já extraído não passa nem pelo pdfplumber
+    if isinstance(fonte, str):
+        with open(fonte, 'rb') as f:
+            conteudo = f.read()
+    else:
+        conteudo = fonte.read()
+    hash_arquivo = hash_bytes(conteudo)
+    dados = buscar_extracao(hash_arquivo=hash_arquivo)
+    if dados is not None:
+        logger.debug("PDF EM CACHE (%s): hash do arquivo", filename)
+        CACHE.incrementar(cache="pdf", resultado="hit")
+        return [_entrada_pdf_cache(filename, dados, user_cnpj)]
+
+    # Uma leitura só do PDF: texto (cache/IA) e palavras com posição (leitura local do DANFE)
+    try:
+        with cronometrar("pdf_extracao"):
+            extraido = extrair_pdf(fonte if isinstance(fonte, str) else conteudo, com_palavras=analisar_paginas is not None)
+    except Exception as e:  # PDF corrompido ou passou do PDF_TIMEOUT
+        logger.error("ERRO EXTRAÇÃO PDF (%s): %s", filename, e)
+        return [{"arquivo": filename, "status": "PDF vazio ou erro extração"}]
+    texto = extraido["texto"]
+    logger.debug("TEXTO EXTRAÍDO PDF (%s): %.500s...", filename, texto)
+
+    if not texto:
+        return [{"arquivo": filename, "status": "PDF vazio ou erro extração"}]
+
+    # Mesmo texto (ou mesma chave de acesso) já extraído: reaproveita sem chamar a IA
+    hash_txt = hash_texto(texto)
+    chaves = chaves_no_texto(texto)
+    cache = {"hash_arquivo": hash_arquivo, "hash_texto": hash_txt, "chave_nfe": chaves[0] if chaves else None, "modelo": modelo}
+    dados = buscar_extracao(hash_texto=hash_txt, chaves=chaves)
+    if dados is not None:
+        logger.debug("PDF EM CACHE (%s): hash do texto/chave", filename)
+        CACHE.incrementar(cache="pdf", resultado="hit")
+        return [_entrada_pdf_cache(filename, dados, user_cnpj, cache)]
+    CACHE.incrementar(cache="pdf", resultado="miss")
+    chave_existente = chave_ja_gravada(chaves, user_cnpj or "")
+    if chave_existente:
+        # Nota já no banco desta empresa (outro upload/formato): duplicada antes de gastar IA
+        logger.debug("PDF DUPLICADO PELA CHAVE (%s): %s", filename, chave_existente)
+        return [{"arquivo": filename, "status": "ignorado: nota duplicada"}]
+
+    # DANFE padrão: leitura local pelas posições das palavras, sem custo de IA
+    confianca_local = None
+    if analisar_paginas:
+        try:
+            with cronometrar("pdf_leitura_local"):
+                local = analisar_paginas(extraido["palavras"])
+        except Exception as e:
+            logger.error("ERRO LEITURA LOCAL DANFE (%s): %s", filename, e)
+            local = None
+        if local:
+            confianca_local = local["confianca"]
+            logger.debug("DANFE LOCAL (%s): confiança %s, falhas %s", filename, confianca_local, local['falhas'])
+            if confianca_local >= CONFIANCA_MINIMA_DANFE:
+                dados = local["dados"]
+                dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
+                cache.update(modelo="danfe_local", chave_nfe=dados["chave_nfe"] or cache["chave_nfe"])
+                return [{"arquivo": filename, "dados": dados, "origem": "pdf_local", "confianca": confianca_local, "cache_pdf": cache}]
+
+    if not (api_key and chamar_gemini):
+        # Sem IA: salva .txt
+        try:
+            if isinstance(fonte, str):
+                txtpath = fonte + ".txt"
+            else:  # Membro de compactado (só em memória)
+                txtpath = os.path.join("src/temp", f"{uuid.uuid4().hex}_{os.path.basename(filename)}.txt")
+            with open(txtpath, "w", encoding="utf-8") as f:
+                f.write(texto)
+            return [{"arquivo": filename, "status": "texto extraído (sem IA) salvo para análise"}]
+        except Exception as e:
+            return [{"arquivo": filename, "status": f"erro salvando texto: {str(e)}"}]
+
+    # PROMPT MELHORADO (adicionando campos faltantes)
+    prompt = f"""
+    Extraia dados de Nota Fiscal Eletrônica de um PDF de texto. Retorne APENAS o JSON cru válido, SEM markdown, blocos de código (sem ```), texto extra ou explicações. Use estrutura exata:
+    {{
+        "numero": "número da NF",
+        "data_emissao": "YYYY-MM-DD",
+        "cnpj_emitente": "14 dígitos sem pontos",
+        "nome_emitente": "razão social",
+        "ie_emitente": "IE sem pontos",
+        "endereco_emitente": "endereço completo",
+        "cnpj_destinatario": "14 dígitos sem pontos",
+        "nome_destinatario": "nome",
+        "ie_destinatario": "IE sem pontos",
+        "endereco_destinatario": "endereço completo",
+        "chave_nfe": "44 dígitos",
+        "natureza_operacao": "descrição",
+        "valor_total_nota": número float sem R$,
+        "tipo_operacao": "Entrada/Saída",  # A IA infere, mas corrigiremos pós-parse
+        "versao": "versão SEFAZ",
+        "itens": [
+            {{
+                "codigo_produto": "código",
+                "descricao_produto": "nome produto",
+                "ncm": "8 dígitos",
+                "cst_ipi": "código",
+                "cfop": "código",
+                "unidade": "UN",
+                "quantidade": número float,
+                "valor_unitario": número float sem R$,
+                "valor_total": número float sem R$,
+                "cst_icms": "código",
+                "cst_pis": "código",
+                "cst_cofins": "código",
+                "cest": "código",
+                "icms_valor": número float,
+                "ipi_valor": número float,
+                "pis_valor": número float,
+                "cofins_valor": número float
+            }}
+        ]
+    }}
+    Se dados faltarem, use null. JSON Puro APENAS!
+    Texto do PDF: {texto}
+    """
+    with cronometrar("pdf_llm"):
+        resposta = chamar_gemini(prompt, api_key, modelo=modelo, uso="pdf")
+    logger.debug("RESPOSTA IA PDF (%s): %.500s...", filename, resposta)
+
+    resposta_texto = resposta if isinstance(resposta, str) else (resposta.get("text") if isinstance(resposta, dict) else str(resposta))
+
+    # Stripping robusto pra markdown e extras
+    with cronometrar("pdf_json_limpeza"):
+        resposta_texto = resposta_texto.strip()
+        resposta_texto = re.sub(r'^```json\s*', '', resposta_texto)  # Remove ```json no start
+        resposta_texto = re.sub(r'```\s*$', '', resposta_texto)  # Remove ``` no end
+        resposta_texto = re.sub(r'^\{|\}$', '', resposta_texto.strip())  # Extra safe para braces soltas
+        resposta_texto = '{' + resposta_texto + '}' if not resposta_texto.startswith('{') else resposta_texto
+
+    logger.debug("RESPOSTA APÓS STRIP PDF (%s): %.500s...", filename, resposta_texto)
+
+    # Try parse JSON
+    try:
+        dados = json.loads(resposta_texto)
+        # Calcular tipo_operacao baseado em user_cnpj
+        dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
+        if logger.isEnabledFor(logging.DEBUG):  # json.dumps do dict inteiro só se for aparecer
+            logger.debug("JSON PARSED PDF (%s): %.300s...", filename, json.dumps(dados, indent=2))
+        cache["chave_nfe"] = re.sub(r'[^\d]', '', str(dados.get("chave_nfe") or "")) or cache["chave_nfe"]
+        return [{"arquivo": filename, "dados": dados, "origem": "pdf", "confianca": confianca_local, "cache_pdf": cache}]
+    except json.JSONDecodeError as e:
+        logger.error("ERRO PARSE JSON PDF (%s): %s - Resposta após strip: %.200s...", filename, e, resposta_texto)
+
+        # FALLBACK: Parse manual simples do texto raw
+        dados_fallback = {}
+        match_num = re.search(r'Nº\s*(\d+)', texto)
+        dados_fallback["numero"] = match_num.group(1) if match_num else None
+        match_data = re.search(r'EMISSÃO:\s*(\d{2}/\d{2}/\d{4})', texto)
+        dados_fallback["data_emissao"] = match_data.group(1).replace('/', '-') if match_data else None
+        match_valor = re.search(r'VALOR TOTAL:\s*R\$\s*([\d.,]+)', texto)
+        dados_fallback["valor_total_nota"] = float(match_valor.group(1).replace('.', '').replace(',', '.')) if match_valor else None
+        match_cnpj_emit = re.search(r'CNPJ\s*([\d/.-]+)', texto)  # Ajuste se múltiplos
+        dados_fallback["cnpj_emitente"] = re.sub(r'[^\d]', '', match_cnpj_emit.group(1)) if match_cnpj_emit else None
+        dados_fallback["itens"] = []  # Sem itens no fallback
+        # Calcular tipo_operacao no fallback
+        dados_fallback["tipo_operacao"] = calcular_tipo_operacao(dados_fallback, user_cnpj)
+
+        logger.debug("FALLBACK DADOS PDF (%s): %s", filename, dados_fallback)
+        return [{"arquivo": filename, "dados": dados_fallback, "origem": "fallback"}]
+
+
+def _analisar_csv(fonte, filename, user_cnpj):
+    """
+    Parse completo em memória (usado só fora do importador em streaming).
+    """
+    logger.debug("CSV LIDO (%s): Iniciando parse...", filename)
+    try:
+        entradas = []
+        for dados in iterar_notas_csv(fonte):
+            dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
+            entradas.append({"arquivo": filename, "nota": dados['numero'], "dados": dados, "origem": "csv"})
+        logger.debug("DADOS PARSED CSV (%s): %s notas encontradas.", filename, len(entradas))
+        return entradas
+    except Exception as e:
+        logger.error("ERRO PARSE CSV (%s): %s", filename, e)
+        return [{"arquivo": filename, "status": f"erro parsing CSV: {str(e)}"}]
+
+
+@cronometrado("csv_importacao")
+def importar_csv(fonte, filename, user_cnpj=""):
+    """
+    Importador em streaming: cada nota sai do parser quando sua linha TOTAL chega
+    e é gravada em lotes de CSV_LOTE_COMMIT notas, um commit por lote. Se o
+    processo cair no meio, as notas já commitadas ficam; no re-upload elas são
+    reconhecidas como duplicadas e a importação segue de onde parou.
+    Memória: só o lote corrente (mais a lista de resultados).
+    """
+    logger.debug("CSV LIDO (%s): Iniciando import em streaming...", filename)
+    resultados = []
+    lote = []
+
+    def _commitar():
+        resultados.extend(gravar_entradas(lote))
+        lote.clear()
+
+    try:
+        for dados in iterar_notas_csv(fonte):
+            dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
+            dados["owner_cnpj"] = user_cnpj
+            lote.append({"arquivo": filename, "nota": dados['numero'], "dados": dados, "origem": "csv"})
+            if len(lote) >= LOTE_COMMIT_CSV:
+                _commitar()
+        _commitar()
+    except Exception as e:
+        _commitar()  # Notas completas lidas antes do erro ainda são gravadas
+        logger.error("ERRO PARSE CSV (%s): %s", filename, e)
+        resultados.append({"arquivo": filename, "status": f"erro parsing CSV: {str(e)}"})
+
+    logger.debug("DADOS PARSED CSV (%s): %s resultados.", filename, len(resultados))
+    return resultados
+
+
+def analisar_arquivo(fonte, filename, api_key="", user_cnpj="", modelo="gemini-2.5-flash"):
+    """
+    Etapa CPU-bound de um arquivo: parse do XML/CSV ou extração do PDF (+ IA).
+    fonte: caminho em disco, bytes (membro de compactado) ou arquivo binário aberto.
+    Só lê do banco (cache de PDF), então pode rodar em outro processo.
+    Retorna a lista de entradas (resultados finais ou notas a gravar); as métricas do
+    parsing vão na primeira ("metricas") e são registradas por gravar_entradas.
+    """
+    with coletar() as medidas:
+        entradas = _analisar_arquivo(fonte, filename, api_key, user_cnpj, modelo)
+    for entrada in entradas:
+        if "dados" in entrada:
+            entrada["dados"]["owner_cnpj"] = user_cnpj  # Empresa que enviou é a dona da nota
+    if medidas and entradas:
+        entradas[0]["metricas"] = medidas
+    return entradas
+
+
+def _analisar_arquivo(fonte, filename, api_key, user_cnpj, modelo):
+    try:
+        if isinstance(fonte, (bytes, bytearray)):
+            fonte = io.BytesIO(fonte)
+        nome = filename.lower()
+        if nome.endswith('.xml'):
+            return _analisar_xml(fonte, filename, user_cnpj)
+        elif nome.endswith('.pdf'):
+            return _analisar_pdf(fonte, filename, api_key, user_cnpj, modelo)
+        elif nome.endswith('.csv'):
+            return _analisar_csv(fonte, filename, user_cnpj)
+        return [{"arquivo": filename, "status": "formato não suportado"}]
+    except Exception as e:
+        logger.exception("ERRO INESPERADO (%s)", filename)
+        return [{"arquivo": filename, "status": f"erro inesperado: {str(e)}"}]
+
+
+# 🔹 Etapa 2: gravação no banco (concorrência limitada)
+
+def _status_gravacao(origem, save_res):
+    """
+    Texto do status por formato, igual ao que process_documents sempre devolveu.
+    """
+    ok = save_res.get("ok")
+    reason = save_res.get("reason")
+    if origem == "xml":
+        return "sucesso (XML->DB)" if ok else f"erro salvar no DB: {reason}"
+    if origem == "pdf":
+        if ok:
+            return "sucesso (PDF->IA->DB)"
+        return "ignorado: nota duplicada" if reason == "duplicado" else f"erro salvar no DB: {reason}"
+    if origem == "pdf_local":
+        if ok:
+            return "sucesso (PDF->leitura local->DB)"
+        return "ignorado: nota duplicada" if reason == "duplicado" else f"erro salvar no DB: {reason}"
+    if origem == "pdf_cache":
+        if ok:
+            return "sucesso (PDF->cache->DB)"
+        return "ignorado: nota duplicada" if reason == "duplicado" else f"erro salvar no DB: {reason}"
+    if origem == "fallback":
+        return "sucesso parcial (fallback sem itens)" if ok else f"erro fallback: {reason}"
+    return "sucesso (CSV->DB)" if ok else f"erro salvar: {reason}"
+
+
+_semaforo_db = threading.BoundedSemaphore(CONCORRENCIA_DB)
+
+# 🔹 Caminhos dos PDFs (contados aqui, na gravação: o parsing pode rodar em outro processo)
+_CAMINHOS_PDF = {"pdf_local": "local", "pdf": "ia", "pdf_cache": "cache", "fallback": "fallback_regex"}
+_contadores_pdf = {caminho: 0 for caminho in (*_CAMINHOS_PDF.values(), "duplicada_pela_chave", "sem_ia", "erro")}
+_confiancas_pdf = {"soma": 0.0, "leituras": 0}
+_contadores_pdf_lock = threading.Lock()
+
+
+def _contar_pdf(entrada):
+    if entrada.get("origem") in _CAMINHOS_PDF:
+        caminho = _CAMINHOS_PDF[entrada["origem"]]
+    elif entrada["arquivo"].lower().endswith(".pdf"):
+        status = entrada.get("status", "")
+        if status == "ignorado: nota duplicada":
+            caminho = "duplicada_pela_chave"
+        elif status.startswith("texto extraído"):
+            caminho = "sem_ia"
+        else:
+            caminho = "erro"
+    else:
+        return
+    PDFS.incrementar(caminho=caminho)
+    with _contadores_pdf_lock:
+        _contadores_pdf[caminho] += 1
+        if entrada.get("confianca") is not None:
+            _confiancas_pdf["soma"] += entrada["confianca"]
+            _confiancas_pdf["leituras"] += 1
+
+
+def estatisticas_pdf():
+    """
+    Quantos PDFs foram por cada caminho neste processo (leitura local, IA, cache...) e a
+    confiança média da leitura local, inclusive das que ficaram abaixo do mínimo.
+    """
+    with _contadores_pdf_lock:
+        dados = dict(_contadores_pdf)
+        leituras = _confiancas_pdf["leituras"]
+        media = _confiancas_pdf["soma"] / leituras if leituras else 0.0
+    total = sum(dados.values())
+    dados.update({
+        "total": total,
+        "taxa_local": round(dados["local"] / total, 3) if total else 0.0,
+        "confianca_media_local": round(media, 3),
+        "confianca_minima": CONFIANCA_MINIMA_DANFE,
+    })
+    return dados
+
+
+def _guardar_extracao_pdf(entrada):
+    # Cache é otimização: falha aqui não muda o resultado do upload
+    try:
+        cache = entrada["cache_pdf"]
+        guardar_extracao(cache["hash_arquivo"], cache["hash_texto"], cache["chave_nfe"], entrada["dados"], cache["modelo"])
+    except Exception as e:
+        logger.error("ERRO CACHE PDF (%s): %s", entrada['arquivo'], e)
+
+
+def gravar_entradas(entradas):
+    """
+    Grava num único lote as notas de um arquivo e devolve os resultados na ordem das entradas.
+    """
+    for entrada in entradas:
+        registrar(entrada.pop("metricas", None))  # Medidas do parsing (talvez de outro processo)
+    notas = [entrada["dados"] for entrada in entradas if "dados" in entrada]
+    saves = iter([])
+    if notas:
+        with _semaforo_db:
+            saves = iter(salvar_notas_no_db(notas))
+    resultados = []
+    for entrada in entradas:
+        _contar_pdf(entrada)
+        if "dados" not in entrada:
+            resultados.append(entrada)
+            continue
+        save_res = next(saves)
+        # Só extração que gravou (ou já estava gravada) vai pro cache: uma que falhou no
+        # banco voltaria do cache a cada reenvio, sem nova chamada à IA
+        if "cache_pdf" in entrada and (save_res.get("ok") or save_res.get("reason") == "duplicado"):
+            _guardar_extracao_pdf(entrada)
+        resultado = {"arquivo": entrada["arquivo"]}
+        if "nota" in entrada:
+            resultado["nota"] = entrada["nota"]
+        resultado["status"] = _status_gravacao(entrada["origem"], save_res)
+        resultados.append(resultado)
+    return resultados
+
+
+# 🔹 Executores plugáveis
+
+class ExecutorSerial(Executor):
+    """
+    Executa na hora, na thread chamadora (debug ou ambientes sem fork).
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        futuro = Future()
+        try:
+            futuro.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            futuro.set_exception(e)
+        return futuro
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor():
+    """
+    Executor de parsing compartilhado pelo processo (criado no primeiro uso),
+    conforme INGESTAO_EXECUTOR / INGESTAO_WORKERS.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if EXECUTOR_PARSING == "serial":
+                _executor = ExecutorSerial()
+            elif EXECUTOR_PARSING == "threads":
+                _executor = ThreadPoolExecutor(max_workers=WORKERS_PARSING)
+            else:
+                # spawn: não herda locks/conexões do worker web (fork em processo com threads é arriscado)
+                _executor = ProcessPoolExecutor(
+                    max_workers=WORKERS_PARSING,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=configurar_logs,  # Processo novo: mesma config de logs (fila própria)
+                )
+        return _executor
+
+
+def definir_executor(executor):
+    """
+    Troca o executor de parsing (ex: um pool próprio ou ExecutorSerial em testes).
+    """
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+# 🔹 Compactados: membros lidos direto do stream, sem extrair pra disco
+
+class LimiteCompactadoExcedido(Exception):
+    pass
+
+
+class MembroIlegivel(Exception):
+    pass
+
+
+# Falhas ao ler um membro só (ZIP com senha, compressão não suportada, CRC/dados
+# corrompidos): o membro é ignorado e os demais seguem
+_ERROS_MEMBRO = (RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+def eh_compactado(filename):
+    return filename.lower().endswith(EXTENSOES_COMPACTADAS)
+
+
+def _membros_brutos(fonte, filename):
+    """
+    Gera (nome, tamanho_declarado, abrir) para cada arquivo regular do compactado.
+    ZIP precisa de fonte com seek (caminho ou stream do upload); TAR é lido em
+    modo stream ("r|*"), inclusive .tar.gz.
+    """
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fonte) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: zf.open(info)
+    else:
+        if isinstance(fonte, str):
+            tar = tarfile.open(name=fonte, mode="r|*")
+        else:
+            tar = tarfile.open(fileobj=fonte, mode="r|*")
+        with tar:
+            for membro in tar:
+                if membro.isfile():
+                    yield membro.name, membro.size, lambda membro=membro: tar.extractfile(membro)
+
+
+def iterar_membros(fonte, filename):
+    """
+    Gera (nome, bytes) de cada membro, aplicando os limites de quantidade e de
+    tamanho descompactado (declarado e efetivamente lido). Um membro grande
+    demais vira (nome, LimiteCompactadoExcedido) e um que não abre (senha,
+    compressão não suportada, corrompido) vira (nome, MembroIlegivel); estourar
+    o total ou a quantidade de membros interrompe com LimiteCompactadoExcedido.
+    """
+    membros = 0
+    total = 0
+    for nome, tamanho, abrir in _membros_brutos(fonte, filename):
+        base = os.path.basename(nome)
+        if not base or base.startswith('.') or '__MACOSX' in nome:
+            continue  # Lixo de compactadores (pastas ocultas, resource forks do macOS)
+        membros += 1
+        if membros > MAX_MEMBROS:
+            raise LimiteCompactadoExcedido(f"mais de {MAX_MEMBROS} arquivos")
+        if tamanho > MAX_MEMBRO:
+            yield nome, LimiteCompactadoExcedido(f"membro maior que {MAX_MEMBRO // (1024 * 1024)} MB")
+            continue
+        try:
+            with abrir() as membro:
+                dados = membro.read(MAX_MEMBRO + 1)
+        except _ERROS_MEMBRO as e:
+            logger.warning("MEMBRO ILEGÍVEL (%s/%s): %s", filename, nome, e)
+            motivo = "protegido por senha" if "encrypted" in str(e) else str(e)
+            yield nome, MembroIlegivel(f"membro ilegível ({motivo})")
+            continue
+        if len(dados) > MAX_MEMBRO:
+            yield nome, LimiteCompactadoExcedido(f"membro maior que {MAX_MEMBRO // (1024 * 1024)} MB")
+            continue
+        total += len(dados)
+        if total > MAX_DESCOMPACTADO:
+            raise LimiteCompactadoExcedido(f"conteúdo descompactado maior que {MAX_DESCOMPACTADO // (1024 * 1024)} MB")
+        yield nome, dados
+
+
+def processar_compactado(fonte, filename, api_key="", user_cnpj="", modelo="gemini-2.5-flash", executor=None):
+    """
+    Processa cada membro do compactado com o mesmo pipeline dos arquivos avulsos.
+    No máximo 2x os workers de parsing ficam em voo (memória limitada) e as
+    notas são gravadas em lotes de TAMANHO_LOTE_PADRAO. Resultados na ordem dos membros.
+    """
+    executor = executor or obter_executor()
+    em_voo = deque()
+    max_em_voo = 2 * WORKERS_PARSING
+    pendentes = []
+    resultados = []
+
+    def _coletar(parse):
+        pendentes.extend(parse.result())
+        if sum(1 for entrada in pendentes if "dados" in entrada) >= TAMANHO_LOTE_PADRAO:
+            resultados.extend(gravar_entradas(pendentes))
+            pendentes.clear()
+
+    erro = None
+    try:
+        for nome, dados in iterar_membros(fonte, filename):
+            arquivo_membro = f"{filename}/{nome}"
+            if isinstance(dados, (LimiteCompactadoExcedido, MembroIlegivel)):
+                parse = Future()
+                parse.set_result([{"arquivo": arquivo_membro, "status": f"ignorado: {dados}"}])
+            elif nome.lower().endswith('.csv'):
+                # CSV grava em streaming: esvazia o que está em voo antes, pra manter a ordem
+                while em_voo:
+                    _coletar(em_voo.popleft())
+                resultados.extend(gravar_entradas(pendentes))
+                pendentes.clear()
+                resultados.extend(importar_csv(io.BytesIO(dados), arquivo_membro, user_cnpj))
+                continue
+            else:
+                parse = executor.submit(analisar_arquivo, dados, arquivo_membro, api_key, user_cnpj, modelo)
+            em_voo.append(parse)
+            if len(em_voo) >= max_em_voo:
+                _coletar(em_voo.popleft())
+    except LimiteCompactadoExcedido as e:
+        erro = f"erro arquivo compactado: limite excedido ({e})"
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+        erro = f"erro arquivo compactado: {str(e)}"
+
+    while em_voo:
+        _coletar(em_voo.popleft())
+    resultados.extend(gravar_entradas(pendentes))
+    if erro:
+        logger.error("ERRO COMPACTADO (%s): %s", filename, erro)
+        resultados.append({"arquivo": filename, "status": erro})
+    elif not resultados:
+        resultados.append({"arquivo": filename, "status": "compactado sem arquivos"})
+    return resultados
+
+
+def processar_arquivos(arquivos, api_key="", user_cnpj="", modelo="gemini-2.5-flash", executor=None):
+    """
+    arquivos: lista de (fonte, filename); fonte é o caminho em disco ou, para
+    compactados, também pode ser o stream do upload (lido sem ir pro disco).
+    Parsing em paralelo no executor; cada arquivo é gravado assim que seu parse
+    termina, com no máximo INGESTAO_DB_CONCORRENCIA gravações simultâneas.
+    Retorna uma lista de resultados por arquivo, na ordem original.
+    """
+    executor = executor or obter_executor()
+
+    def _gravar(parse, filename):
+        try:
+            return gravar_entradas(parse.result())
+        except Exception as e:
+            logger.exception("ERRO INESPERADO (%s)", filename)
+            return [{"arquivo": filename, "status": f"erro inesperado: {str(e)}"}]
+
+    def _compactado(fonte, filename):
+        # Erro fora do previsto num compactado não derruba o upload (os outros já gravaram)
+        try:
+            return processar_compactado(fonte, filename, api_key, user_cnpj, modelo, executor)
+        except Exception as e:
+            logger.exception("ERRO INESPERADO (%s)", filename)
+            return [{"arquivo": filename, "status": f"erro inesperado: {str(e)}"}]
+
+    with ThreadPoolExecutor(max_workers=CONCORRENCIA_DB) as gravacao:
+        tarefas = []
+        for fonte, filename in arquivos:
+            if eh_compactado(filename):
+                tarefas.append(gravacao.submit(_compactado, fonte, filename))
+            elif filename.lower().endswith('.csv'):
+                # CSV: parse e gravação intercalados (streaming), fora do pool de parsing
+                tarefas.append(gravacao.submit(importar_csv, fonte, filename, user_cnpj))
+            else:
+                parse = executor.submit(analisar_arquivo, fonte, filename, api_key, user_cnpj, modelo)
+                tarefas.append(gravacao.submit(_gravar, parse, filename))
+        return [tarefa.result() for tarefa in tarefas]
+
+
+def processar_arquivo(fonte, filename, api_key="", user_cnpj="", modelo="gemini-2.5-flash", executor=None):
+    """
+    Atalho para um arquivo só (usado pelo worker da fila assíncrona).
+    """
+    return processar_arquivos([(fonte, filename)], api_key, user_cnpj, modelo, executor)[0]
@@ -0,0 +1,103 @@
+# src/services/llm_clients.py
+# Clientes dos provedores de IA reaproveitados entre chamadas (sem refazer TLS/setup a cada
+# pergunta ou PDF). Gemini: um genai.Client por chave de API, num LRU limitado e protegido
+# por lock (a chave vai no cliente, nunca em os.environ, então usuários concorrentes não se
+# sobrescrevem). HTTP (Grok, consulta de CNPJ): requests.Session com keep-alive, uma por
+# thread, e timeouts de conexão/leitura em toda chamada.
+# Config: LLM_CLIENTES_MAX, LLM_TIMEOUT_CONEXAO e LLM_TIMEOUT_LEITURA (segundos).
+
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from services.carregamento import modulo_tardio
+
+requests = modulo_tardio("requests")  # Só na primeira chamada HTTP (Grok, consulta de CNPJ)
+
+logger = logging.getLogger(__name__)
+
+MAX_CLIENTES = int(os.environ.get("LLM_CLIENTES_MAX", "32"))
+TIMEOUT_CONEXAO = float(os.environ.get("LLM_TIMEOUT_CONEXAO", "5"))
+TIMEOUT_LEITURA = float(os.environ.get("LLM_TIMEOUT_LEITURA", "60"))
+TIMEOUT_HTTP = (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)  # Formato do requests: (conexão, leitura)
+
+
+class RegistroClientes:
+    """
+    LRU de clientes por chave de API (guardada só como sha256). Ao passar de max_clientes,
+    descarta o menos usado (conexões fecham quando a última referência sai).
+    """
+    def __init__(self, fabrica, max_clientes):
+        self.fabrica = fabrica
+        self.max_clientes = max_clientes
+        self._clientes = OrderedDict()  # sha256(chave) -> cliente
+        self._lock = threading.Lock()
+
+    def obter(self, api_key):
+        id_chave = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        with self._lock:
+            cliente = self._clientes.get(id_chave)
+            if cliente is not None:
+                self._clientes.move_to_end(id_chave)
+                return cliente
+        # Criação fora do lock: chaves diferentes não esperam umas pelas outras
+        novo = self.fabrica(api_key)
+        with self._lock:
+            cliente = self._clientes.setdefault(id_chave, novo)  # Outra thread pode ter criado antes
+            self._clientes.move_to_end(id_chave)
+            while len(self._clientes) > self.max_clientes:
+                # Sem close(): o descartado pode estar no meio de uma chamada em outra thread
+                self._clientes.popitem(last=False)
+        if cliente is not novo:
+            _fechar(novo)  # Esse nunca foi entregue a ninguém
+        return cliente
+
+    def tamanho(self):
+        return len(self._clientes)
+
+
+def _fechar(cliente):
+    # genai.Client só tem close() em versões recentes do SDK
+    try:
+        fechar = getattr(cliente, "close", None)
+        if fechar:
+            fechar()
+    except Exception as e:
+        logger.debug("ERRO AO FECHAR CLIENTE IA: %s", e)
+
+
+def _criar_cliente_gemini(api_key):
+    from google import genai  # Aqui dentro: auth/Grok usam este módulo sem precisar do SDK
+    from google.genai import types
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=int(TIMEOUT_LEITURA * 1000)),  # SDK usa milissegundos
+    )
+
+
+_gemini = RegistroClientes(_criar_cliente_gemini, MAX_CLIENTES)
+
+
+def cliente_gemini(api_key):
+    return _gemini.obter(api_key)
+
+
+# 🔹 HTTP genérico (requests)
+
+_local = threading.local()
+
+
+def sessao_http():
+    """
+    requests.Session da thread atual (Session não é garantidamente thread-safe).
+    Cabeçalhos de autenticação vão em cada chamada, nunca na sessão.
+    """
+    sessao = getattr(_local, "sessao", None)
+    if sessao is None:
+        sessao = requests.Session()
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        sessao.mount("https://", adaptador)
+        sessao.mount("http://", adaptador)
+        _local.sessao = sessao
+    return sessao
@@ -0,0 +1,136 @@
+# src/services/logs.py
+# Configuração central de logs (substitui o basicConfig(DEBUG) que cada módulo fazia).
+# Os módulos só pegam logging.getLogger(__name__) e passam argumentos no estilo %s, então
+# nada é formatado abaixo do nível configurado. Os registros que passam vão pra uma fila
+# (QueueHandler) e uma thread (QueueListener) escreve em stderr/arquivo, fora da thread
+# do request. Eventos por nota/item marcados com extra={"amostrar": True} saem 1 a cada
+# LOG_AMOSTRA por mensagem. Fila cheia descarta (log nunca trava upload nem chat).
+# Config: LOG_NIVEL (padrão INFO; DEBUG com FLASK_ENV=development), LOG_NIVEIS
+# ("processors.xml_processor=DEBUG,pdfminer=WARNING"), LOG_FORMATO (texto | json),
+# LOG_ARQUIVO, LOG_AMOSTRA (padrão 100; 1 = todos) e LOG_FILA_MAX.
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+
+NIVEL = os.environ.get("LOG_NIVEL") or ("DEBUG" if os.environ.get("FLASK_ENV") == "development" else "INFO")
+NIVEIS_MODULOS = os.environ.get("LOG_NIVEIS", "")
+FORMATO = os.environ.get("LOG_FORMATO", "texto")
+ARQUIVO = os.environ.get("LOG_ARQUIVO", "")
+AMOSTRA = max(1, int(os.environ.get("LOG_AMOSTRA", "100")))
+FILA_MAX = int(os.environ.get("LOG_FILA_MAX", "10000"))
+
+# Bibliotecas que em DEBUG escrevem por caractere/conexão (pdfminer: milhares de linhas por PDF)
+_NIVEIS_BIBLIOTECAS = {"pdfminer": "WARNING", "pdfplumber": "WARNING", "urllib3": "INFO", "PIL": "INFO"}
+
+_FORMATO_TEXTO = "%(asctime)s %(levelname)s [%(process)d %(threadName)s] %(name)s: %(message)s"
+
+
+class FiltroAmostragem(logging.Filter):
+    """
+    Deixa passar 1 a cada `a_cada` registros com amostrar=True, contando por mensagem
+    (o template, não o texto formatado). Registros sem a marca passam sempre.
+    """
+    def __init__(self, a_cada):
+        super().__init__()
+        self.a_cada = a_cada
+        self._contadores = {}
+
+    def filter(self, record):
+        if not getattr(record, "amostrar", False) or self.a_cada == 1:
+            return True
+        contador = self._contadores.get(record.msg)
+        if contador is None:
+            contador = self._contadores.setdefault(record.msg, itertools.count())
+        n = next(contador)  # itertools.count é atômico sob o GIL
+        if n % self.a_cada:
+            return False
+        record.amostra = self.a_cada
+        return True
+
+
+class FilaSemBloqueio(QueueHandler):
+    """
+    QueueHandler que descarta (e conta) quando a fila está cheia, em vez de bloquear
+    a thread do request ou imprimir traceback do logging.
+    """
+    descartados = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            FilaSemBloqueio.descartados += 1
+
+
+class FormatadorJson(logging.Formatter):
+    """
+    Uma linha JSON por registro (ingestão por Loki/CloudWatch/etc. sem regex).
+    """
+    def format(self, record):
+        dados = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+            "processo": record.process,
+            "thread": record.threadName,
+        }
+        if getattr(record, "amostra", None):
+            dados["amostra"] = record.amostra  # Cada linha representa ~N eventos iguais
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados["excecao"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+def _nivel(nome):
+    nome = str(nome).strip().upper()
+    return int(nome) if nome.isdigit() else logging.getLevelName(nome)
+
+
+def configurar_logs():
+    """
+    Instala fila + listener no logger raiz (uma vez por processo; chamadas seguintes
+    não fazem nada). Chamado no main.py, nos CLIs e no início dos processos de parsing.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        formatador = FormatadorJson() if FORMATO == "json" else logging.Formatter(_FORMATO_TEXTO)
+        destinos = [logging.StreamHandler(sys.stderr)]
+        if ARQUIVO:
+            destinos.append(logging.FileHandler(ARQUIVO, encoding="utf-8"))
+        for destino in destinos:
+            destino.setFormatter(formatador)
+
+        fila = FilaSemBloqueio(queue.Queue(FILA_MAX))
+        fila.addFilter(FiltroAmostragem(AMOSTRA))  # Antes do prepare(): amostra descartada nem é formatada
+        raiz = logging.getLogger()
+        for antigo in list(raiz.handlers):  # basicConfig de alguma biblioteca ou de quem importou antes
+            raiz.removeHandler(antigo)
+        raiz.addHandler(fila)
+        raiz.setLevel(_nivel(NIVEL))
+
+        niveis = dict(_NIVEIS_BIBLIOTECAS)
+        for par in filter(None, (p.strip() for p in NIVEIS_MODULOS.split(","))):
+            nome, _, nivel = par.partition("=")
+            niveis[nome.strip()] = nivel
+        for nome, nivel in niveis.items():
+            logging.getLogger(nome).setLevel(_nivel(nivel))
+
+        _listener = QueueListener(fila.queue, *destinos, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # Esvazia a fila antes do processo sair
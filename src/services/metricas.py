@@ -0,0 +1,223 @@
+# src/services/metricas.py
+# Métricas em memória do processo, expostas em /metrics no formato texto do Prometheus:
+# histogramas de duração por etapa (upload, parsing, pdfplumber, IA, limpeza do JSON,
+# gravação, etapas do chat) e contadores (chamadas/tokens de IA, caches, notas duplicadas).
+# Custo por medida: um perf_counter, um bisect e um lock curto, sem I/O.
+# O parsing pode rodar num pool de processos: lá as medidas são coletadas (coletar()),
+# voltam junto com as entradas do arquivo e são registradas no processo web (registrar()).
+# Cada worker do gunicorn tem os seus números (como estatisticas_cache/estatisticas_pdf).
+
+import time
+import bisect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Limites dos buckets em segundos (de parse de XML, ~1 ms, até chamada de IA, dezenas de s)
+LIMITES_PADRAO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_metricas = {}  # nome -> Contador/Histograma, na ordem de criação
+_local = threading.local()
+
+
+def _rotulos(metrica, rotulos):
+    return tuple(str(rotulos.get(nome, "")) for nome in metrica.rotulos)
+
+
+def _coleta_ativa():
+    return getattr(_local, "coleta", None)
+
+
+class Contador:
+    """
+    Contador monotônico com rótulos (ex: llm_chamadas_total{provedor="gemini"}).
+    """
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = _rotulos(self, rotulos)
+        coleta = _coleta_ativa()
+        if coleta is not None:
+            coleta.append((self.nome, chave, valor))
+        else:
+            self._aplicar(chave, valor)
+
+    def _aplicar(self, chave, valor):
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        return self._valores.get(_rotulos(self, rotulos), 0)
+
+    def _linhas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for chave, valor in valores:
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Histograma:
+    """
+    Histograma cumulativo (buckets le=...), com _sum e _count, por combinação de rótulos.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_PADRAO):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.limites = tuple(limites)
+        self._series = {}  # rótulos -> [contagens por bucket (+Inf no fim), soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **rotulos):
+        chave = _rotulos(self, rotulos)
+        coleta = _coleta_ativa()
+        if coleta is not None:
+            coleta.append((self.nome, chave, valor))
+        else:
+            self._aplicar(chave, valor)
+
+    def _aplicar(self, chave, valor):
+        posicao = bisect.bisect_left(self.limites, valor)  # le é inclusivo
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def resumo(self, **rotulos):
+        serie = self._series.get(_rotulos(self, rotulos))
+        return {"total": serie[2], "soma": serie[1]} if serie else {"total": 0, "soma": 0.0}
+
+    def _linhas(self):
+        with self._lock:
+            series = sorted((chave, (list(s[0]), s[1], s[2])) for chave, s in self._series.items())
+        for chave, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip((*self.limites, "+Inf"), contagens):
+                acumulado += contagem
+                le = limite if limite == "+Inf" else _numero(limite)
+                yield f"{self.nome}_bucket{_formatar_rotulos((*self.rotulos, 'le'), (*chave, le))} {acumulado}"
+            yield f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_numero(soma)}"
+            yield f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(nomes, valores):
+    if not nomes:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)) + "}"
+
+
+def _registrar_metrica(metrica):
+    existente = _metricas.setdefault(metrica.nome, metrica)
+    if type(existente) is not type(metrica) or existente.rotulos != metrica.rotulos:
+        raise ValueError(f"métrica {metrica.nome} já registrada com outro tipo/rótulos")
+    return existente
+
+
+def contador(nome, ajuda, rotulos=()):
+    return _registrar_metrica(Contador(nome, ajuda, rotulos))
+
+
+def histograma(nome, ajuda, rotulos=(), limites=LIMITES_PADRAO):
+    return _registrar_metrica(Histograma(nome, ajuda, rotulos, limites))
+
+
+# 🔹 Métricas da aplicação
+
+ETAPAS = histograma("agente_fiscal_etapa_segundos", "Duração das etapas do upload e do chat", ("etapa",))
+LLM_CHAMADAS = contador("agente_fiscal_llm_chamadas_total", "Chamadas aos provedores de IA", ("provedor", "uso", "resultado"))
+LLM_TOKENS = contador(
+    "agente_fiscal_llm_tokens_total",
+    "Tokens enviados/recebidos (informados pelo provedor; estimados em len/4 quando ele não informa)",
+    ("provedor", "tipo"),
+)
+CACHE = contador("agente_fiscal_cache_total", "Consultas aos caches (respostas do chat, extrações de PDF)", ("cache", "resultado"))
+NOTAS = contador("agente_fiscal_notas_total", "Notas enviadas pra gravação, por resultado", ("resultado",))
+PDFS = contador("agente_fiscal_pdfs_total", "PDFs por caminho de leitura (local, IA, cache...)", ("caminho",))
+
+
+@contextmanager
+def cronometrar(etapa):
+    """
+    with cronometrar("pdf_extracao"): ... -> observa a duração em agente_fiscal_etapa_segundos.
+    Conta também quando o bloco levanta exceção.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ETAPAS.observar(time.perf_counter() - inicio, etapa=etapa)
+
+
+def cronometrado(etapa):
+    """
+    Decorator: mesma medida de cronometrar() em volta da função inteira.
+    """
+    def decorar(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                ETAPAS.observar(time.perf_counter() - inicio, etapa=etapa)
+        return envolvida
+    return decorar
+
+
+def contar_llm(provedor, uso, resultado="ok", tokens_prompt=None, tokens_resposta=None):
+    LLM_CHAMADAS.incrementar(provedor=provedor, uso=uso, resultado=resultado)
+    if tokens_prompt:
+        LLM_TOKENS.incrementar(tokens_prompt, provedor=provedor, tipo="prompt")
+    if tokens_resposta:
+        LLM_TOKENS.incrementar(tokens_resposta, provedor=provedor, tipo="resposta")
+
+
+# 🔹 Medidas feitas em outro processo (pool de parsing)
+
+@contextmanager
+def coletar():
+    """
+    Enquanto ativo, as medidas desta thread vão pra uma lista (picklable) em vez do
+    registro do processo. Quem recebe a lista chama registrar() uma vez.
+    """
+    anterior = _coleta_ativa()
+    coleta = _local.coleta = []
+    try:
+        yield coleta
+    finally:
+        _local.coleta = anterior
+
+
+def registrar(coleta):
+    for nome, chave, valor in coleta or ():
+        metrica = _metricas.get(nome)
+        if metrica is not None:
+            metrica._aplicar(tuple(chave), valor)
+
+
+def texto_prometheus():
+    """
+    Todas as métricas no formato de exposição texto 0.0.4 do Prometheus.
+    """
+    linhas = []
+    for metrica in list(_metricas.values()):
+        linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        linhas.extend(metrica._linhas())
+    return "\n".join(linhas) + "\n"
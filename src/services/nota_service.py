@@ -0,0 +1,246 @@
+# src/services/nota_service.py
+# Persistência de notas fiscais: salvamento unitário e em lote (bulk insert).
+# Cada nota pertence à empresa que a enviou (dados["owner_cnpj"], preenchido na ingestão);
+# duplicidade, versão dos dados do chat e resumo mensal são por empresa.
+
+import os
+import logging
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota, para_decimal, para_data
+from services.resumo_service import acumular_resumo
+from services.cache_respostas import incrementar_versao_dados
+from services.metricas import cronometrado, NOTAS
+
+logger = logging.getLogger(__name__)
+
+# Quantas notas por lote de INSERT (executemany); ajustável por ambiente
+TAMANHO_LOTE_PADRAO = int(os.environ.get("DB_TAMANHO_LOTE", "500"))
+
+
+def _linha_nota(dados_nota):
+    """
+    Converte o dict do parser (XML/CSV/PDF) nos valores da tabela notas_fiscais.
+    """
+    return {
+        "owner_cnpj": str(dados_nota.get("owner_cnpj") or "").strip(),
+        "numero": str(dados_nota.get("numero", "")).strip(),
+        "data_emissao": para_data(dados_nota.get("data_emissao")),
+        "cnpj_emitente": str(dados_nota.get("cnpj_emitente", "")).strip(),
+        "nome_emitente": dados_nota.get("nome_emitente", ""),
+        "ie_emitente": dados_nota.get("ie_emitente", ""),
+        "endereco_emitente": dados_nota.get("endereco_emitente", ""),
+        "cnpj_destinatario": dados_nota.get("cnpj_destinatario", ""),
+        "nome_destinatario": dados_nota.get("nome_destinatario", ""),
+        "ie_destinatario": dados_nota.get("ie_destinatario", ""),
+        "endereco_destinatario": dados_nota.get("endereco_destinatario", ""),
+        "chave_nfe": dados_nota.get("chave_nfe") or None,  # Vazia não pode colidir na unique
+        "natureza_operacao": dados_nota.get("natureza_operacao", ""),
+        "valor_total_nota": para_decimal(dados_nota.get("valor_total_nota")),
+        "tipo_operacao": dados_nota.get("tipo_operacao", ""),
+        "versao": dados_nota.get("versao", ""),
+    }
+
+
+def _linhas_itens(dados_nota):
+    """
+    Converte a lista 'itens' nos valores da tabela itens_nota (nota_id é preenchido no insert).
+    """
+    return [
+        {
+            "codigo_produto": item_data.get("codigo_produto", ""),
+            "descricao_produto": item_data.get("descricao_produto", ""),
+            "ncm": item_data.get("ncm", ""),
+            "cst_ipi": item_data.get("cst_ipi", ""),
+            "cfop": item_data.get("cfop", ""),
+            "unidade": item_data.get("unidade", ""),
+            "quantidade": para_decimal(item_data.get("quantidade")),
+            "valor_unitario": para_decimal(item_data.get("valor_unitario")),
+            "valor_total": para_decimal(item_data.get("valor_total")),
+            "cst_icms": item_data.get("cst_icms", ""),
+            "cst_pis": item_data.get("cst_pis", ""),
+            "cst_cofins": item_data.get("cst_cofins", ""),
+            "cest": item_data.get("cest", ""),
+            # Impostos do item_data (do parser XML/CSV; null da IA vira 0)
+            "icms_valor": float(item_data.get("icms_valor") or 0),
+            "ipi_valor": float(item_data.get("ipi_valor") or 0),
+            "pis_valor": float(item_data.get("pis_valor") or 0),
+            "cofins_valor": float(item_data.get("cofins_valor") or 0),
+        }
+        for item_data in dados_nota.get("itens", []) or []
+    ]
+
+
+def _chave_dedup(linha):
+    # Duplicidade na mesma empresa: chave_nfe se fornecida, senão numero+cnpj_emitente+data_emissao
+    if linha["chave_nfe"]:
+        return (linha["owner_cnpj"], linha["chave_nfe"])
+    return (linha["owner_cnpj"], linha["numero"], linha["cnpj_emitente"], linha["data_emissao"])
+
+
+_COLUNAS_DEDUP = (NotaFiscal.owner_cnpj, NotaFiscal.numero, NotaFiscal.cnpj_emitente, NotaFiscal.data_emissao)
+
+
+def _consulta_dedup(tuplas):
+    """
+    Candidatos a duplicidade pra tuplas (owner_cnpj, numero, cnpj_emitente, data_emissao).
+    Um IN por coluna (e não tuple_ IN) porque o SQLite só usa ix_notas_owner_dedup assim;
+    o resultado é um superconjunto, filtrado contra as tuplas por quem chama.
+    """
+    donos, numeros, cnpjs, datas = (set(valores) for valores in zip(*tuplas))
+    return select(*_COLUNAS_DEDUP).where(
+        NotaFiscal.owner_cnpj.in_(donos), NotaFiscal.numero.in_(numeros),
+        NotaFiscal.cnpj_emitente.in_(cnpjs), NotaFiscal.data_emissao.in_(datas),
+    )
+
+
+def _chaves_existentes(session, linhas):
+    """
+    Uma consulta por tipo de chave (IN set-based) em vez de um SELECT por nota.
+    """
+    chaves = {_chave_dedup(l) for l in linhas if l["chave_nfe"]}
+    tuplas = {_chave_dedup(l) for l in linhas if not l["chave_nfe"]}
+    existentes = set()
+    if chaves:
+        donos, chaves_nfe = (set(valores) for valores in zip(*chaves))
+        existentes.update(
+            t for t in map(tuple, session.execute(
+                select(NotaFiscal.owner_cnpj, NotaFiscal.chave_nfe)
+                .where(NotaFiscal.owner_cnpj.in_(donos), NotaFiscal.chave_nfe.in_(chaves_nfe))
+            )) if t in chaves
+        )
+    completas = {t for t in tuplas if t[3] is not None}
+    if completas:
+        existentes.update(t for t in map(tuple, session.execute(_consulta_dedup(completas))) if t in completas)
+    for dono, numero, cnpj, _ in tuplas - completas:
+        # Sem data (ex: fallback do PDF): NULL não casa em IN, checa com IS NULL
+        if session.query(NotaFiscal.id).filter(
+            NotaFiscal.owner_cnpj == dono, NotaFiscal.numero == numero,
+            NotaFiscal.cnpj_emitente == cnpj, NotaFiscal.data_emissao.is_(None),
+        ).first():
+            existentes.add((dono, numero, cnpj, None))
+    return existentes
+
+
+def _inserir_notas(session, novos):
+    """
+    Insere notas e itens com executemany, soma tudo no resumo mensal e incrementa a
+    versão dos dados dos CNPJs envolvidos (cache do chat), tudo na mesma transação.
+    novos: lista de (linha_nota, linhas_itens). O RETURNING ordenado pelos parâmetros
+    devolve os ids na mesma ordem das linhas.
+    """
+    if not novos:
+        return
+    ids = session.execute(
+        insert(NotaFiscal).returning(NotaFiscal.id, sort_by_parameter_order=True),
+        [linha for linha, _ in novos],
+    ).scalars().all()
+
+    linhas_itens = []
+    for nota_id, (_, itens) in zip(ids, novos):
+        for item in itens:
+            item["nota_id"] = nota_id
+            linhas_itens.append(item)
+    if linhas_itens:
+        session.execute(insert(ItemNota), linhas_itens)
+    acumular_resumo(session, novos)
+    incrementar_versao_dados(session, [
+        cnpj for linha, _ in novos
+        for cnpj in ((linha["owner_cnpj"],) if linha["owner_cnpj"] else (linha["cnpj_emitente"], linha["cnpj_destinatario"]))
+    ])
+
+
+def _contar_resultados(resultados):
+    for resultado in resultados:
+        if resultado["ok"]:
+            NOTAS.incrementar(resultado="gravada")
+        else:
+            NOTAS.incrementar(resultado="duplicada" if resultado["reason"] == "duplicado" else "erro")
+
+
+@cronometrado("db_salvar_notas")
+def salvar_notas_no_db(lista_dados, tamanho_lote=None):
+    """
+    Salva várias notas (dicts do parser, com lista 'itens') numa única transação.
+    Duplicidade checada com uma consulta IN por lote; notas e itens inseridos
+    via executemany em lotes de tamanho_lote notas (padrão DB_TAMANHO_LOTE).
+    Retorna uma lista alinhada com lista_dados, no mesmo formato de
+    salvar_nota_no_db: {"ok": True} ou {"ok": False, "reason": ...}.
+    """
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE_PADRAO
+    resultados = [None] * len(lista_dados)
+
+    preparados = []  # (indice, linha_nota, linhas_itens)
+    for i, dados_nota in enumerate(lista_dados):
+        try:
+            preparados.append((i, _linha_nota(dados_nota), _linhas_itens(dados_nota)))
+        except Exception as e:
+            logger.error("ERRO SALVAR NOTA: %s", e)
+            resultados[i] = {"ok": False, "reason": str(e)}
+
+    session = SessionLocal()
+    try:
+        vistos = set()  # Duplicadas dentro do próprio upload
+        novos = []
+        for inicio in range(0, len(preparados), tamanho_lote):
+            lote = preparados[inicio:inicio + tamanho_lote]
+            existentes = _chaves_existentes(session, [linha for _, linha, _ in lote])
+            novos_lote = []
+            for i, linha, itens in lote:
+                chave = _chave_dedup(linha)
+                if chave in existentes or chave in vistos:
+                    resultados[i] = {"ok": False, "reason": "duplicado"}
+                    continue
+                vistos.add(chave)
+                novos_lote.append((i, linha, itens))
+            _inserir_notas(session, [(linha, itens) for _, linha, itens in novos_lote])
+            novos.extend(novos_lote)
+
+        session.commit()
+        for i, _, _ in novos:
+            resultados[i] = {"ok": True}
+        logger.debug("NOTAS SALVAS EM LOTE: %s notas, %s itens", len(novos), sum(len(itens) for _, _, itens in novos))
+
+    except Exception as e:
+        # Falha no lote (ex: corrida com outro upload na unique owner_cnpj+chave_nfe):
+        # desfaz tudo e refaz nota a nota, pra cada uma ter seu próprio resultado
+        session.rollback()
+        pendentes = [(i, linha, itens) for i, linha, itens in preparados if resultados[i] is None]
+        # Nota única que bateu na unique: refazer relê a duplicidade (a outra já commitou)
+        if len(pendentes) == 1 and not isinstance(e, IntegrityError):
+            logger.error("ERRO SALVAR NOTA: %s", e)
+            resultados[pendentes[0][0]] = {"ok": False, "reason": str(e)}
+        else:
+            logger.error("ERRO SALVAR LOTE, refazendo nota a nota: %s", e)
+            for i, linha, itens in pendentes:
+                resultados[i] = _salvar_individual(linha, itens)
+    finally:
+        session.close()
+
+    _contar_resultados(resultados)
+    return resultados
+
+
+def _salvar_individual(linha, itens):
+    session = SessionLocal()
+    try:
+        if _chave_dedup(linha) in _chaves_existentes(session, [linha]):
+            return {"ok": False, "reason": "duplicado"}
+        _inserir_notas(session, [(linha, itens)])
+        session.commit()
+        return {"ok": True}
+    except Exception as e:
+        session.rollback()
+        logger.error("ERRO SALVAR NOTA: %s", e)
+        return {"ok": False, "reason": str(e)}
+    finally:
+        session.close()
+
+
+def salvar_nota_no_db(dados_nota):
+    """
+    Espera um dict com campos da nota e uma lista 'itens'.
+    Salva no banco usando SessionLocal (atalho para uma nota só de salvar_notas_no_db).
+    """
+    return salvar_notas_no_db([dados_nota])[0]
@@ -0,0 +1,188 @@
+# src/services/resumo_service.py
+# Livro fiscal mensal (tabela resumo_mensal): totais por empresa/mês/tipo/CFOP/NCM
+# acumulados na mesma transação que grava as notas, pra dashboard e chat lerem
+# somas prontas em vez de varrer itens. Reconstrução completa (em src/, com a
+# ingestão parada): python -m services.resumo_service [--cnpj 12345678000195]
+
+import logging
+import argparse
+from collections import defaultdict
+from decimal import Decimal
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota, para_decimal
+from models.resumo_mensal import ResumoMensal
+
+logger = logging.getLogger(__name__)
+
+_CHAVE = ("cnpj", "ano_mes", "tipo_operacao", "cfop", "ncm")
+_TOTAIS = ("quantidade_itens", "valor_total", "icms_valor", "ipi_valor", "pis_valor", "cofins_valor")
+_IMPOSTOS = ("icms_valor", "ipi_valor", "pis_valor", "cofins_valor")
+_ZERO = Decimal(0)
+
+
+def _novos_totais():
+    return [0, _ZERO, _ZERO, _ZERO, _ZERO, _ZERO]
+
+
+def _acumular(agregado, nota, itens, cnpj=None):
+    """
+    Soma uma nota (dict com data_emissao/cnpjs/owner_cnpj/valor_total_nota) e seus itens
+    no agregado. A nota entra só pra empresa dona: como Saída se ela é a emitente, Entrada
+    se é a destinatária (nota sem dono: pros dois lados). Sem data não entra (não há mês).
+    Sem itens, o valor_total_nota vai numa linha com cfop/ncm vazios.
+    """
+    data = nota["data_emissao"]
+    if data is None:
+        return
+    dono = nota.get("owner_cnpj") or None
+    lados = [
+        (doc, tipo)
+        for doc, tipo in ((nota["cnpj_emitente"], "Saída"), (nota["cnpj_destinatario"], "Entrada"))
+        if doc and (dono is None or doc == dono) and (cnpj is None or doc == cnpj)
+    ]
+    if not lados:
+        return
+
+    if itens:
+        parcelas = [
+            (
+                item.get("cfop") or "", item.get("ncm") or "",
+                [1, para_decimal(item.get("valor_total")) or _ZERO]
+                + [para_decimal(item.get(imposto)) or _ZERO for imposto in _IMPOSTOS],
+            )
+            for item in itens
+        ]
+    else:
+        parcelas = [("", "", [0, para_decimal(nota.get("valor_total_nota")) or _ZERO, _ZERO, _ZERO, _ZERO, _ZERO])]
+
+    ano_mes = data.strftime("%Y-%m")
+    for doc, tipo in lados:
+        for cfop, ncm, valores in parcelas:
+            totais = agregado[(doc, ano_mes, tipo, cfop, ncm)]
+            for i, valor in enumerate(valores):
+                totais[i] += valor
+
+
+def _linhas(agregado):
+    return [dict(zip(_CHAVE, chave), **dict(zip(_TOTAIS, totais))) for chave, totais in agregado.items()]
+
+
+def _somar_no_banco(session, linhas):
+    """
+    Upsert somando os totais nas linhas já existentes (ON CONFLICT no SQLite e no
+    PostgreSQL; nos demais bancos, SELECT + UPDATE/INSERT linha a linha).
+    """
+    dialeto = session.get_bind().dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        stmt = (sqlite_insert if dialeto == "sqlite" else pg_insert)(ResumoMensal.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(_CHAVE),
+            set_={campo: getattr(ResumoMensal.__table__.c, campo) + getattr(stmt.excluded, campo) for campo in _TOTAIS},
+        )
+        session.execute(stmt, linhas)
+        return
+
+    for linha in linhas:
+        existente = session.query(ResumoMensal).filter_by(**{campo: linha[campo] for campo in _CHAVE}).first()
+        if existente is None:
+            session.add(ResumoMensal(**linha))
+        else:
+            for campo in _TOTAIS:
+                setattr(existente, campo, getattr(existente, campo) + linha[campo])
+
+
+def acumular_resumo(session, novos):
+    """
+    Chamado por nota_service na transação que insere as notas (novos: lista de
+    (linha_nota, linhas_itens) já normalizadas); commit/rollback ficam com quem chama.
+    """
+    agregado = defaultdict(_novos_totais)
+    for nota, itens in novos:
+        _acumular(agregado, nota, itens)
+    if agregado:
+        _somar_no_banco(session, _linhas(agregado))
+
+
+def reconstruir_resumo(cnpj=None, tamanho_lote=5000):
+    """
+    Recalcula resumo_mensal (tudo ou só um CNPJ) a partir das notas, numa transação:
+    apaga as linhas e insere os totais recalculados. Retorna quantas linhas gravou.
+    """
+    session = SessionLocal()
+    try:
+        agregado = defaultdict(_novos_totais)
+        consulta = select(
+            NotaFiscal.id, NotaFiscal.data_emissao, NotaFiscal.cnpj_emitente,
+            NotaFiscal.cnpj_destinatario, NotaFiscal.owner_cnpj, NotaFiscal.valor_total_nota,
+        ).order_by(NotaFiscal.id).limit(tamanho_lote)
+        if cnpj:
+            consulta = consulta.where(NotaFiscal.owner_cnpj == cnpj)
+
+        ultimo_id, total_notas = 0, 0
+        while True:
+            notas = session.execute(consulta.where(NotaFiscal.id > ultimo_id)).mappings().all()
+            if not notas:
+                break
+            itens = defaultdict(list)
+            for item in session.execute(
+                select(ItemNota.nota_id, ItemNota.cfop, ItemNota.ncm, ItemNota.valor_total, *(
+                    getattr(ItemNota, imposto) for imposto in _IMPOSTOS
+                )).where(ItemNota.nota_id.in_([nota["id"] for nota in notas]))
+            ).mappings():
+                itens[item["nota_id"]].append(item)
+            for nota in notas:
+                _acumular(agregado, nota, itens.get(nota["id"]), cnpj)
+            ultimo_id = notas[-1]["id"]
+            total_notas += len(notas)
+
+        apagar = delete(ResumoMensal)
+        if cnpj:
+            apagar = apagar.where(ResumoMensal.cnpj == cnpj)
+        session.execute(apagar)
+        linhas = _linhas(agregado)
+        for inicio in range(0, len(linhas), tamanho_lote):
+            session.execute(insert(ResumoMensal), linhas[inicio:inicio + tamanho_lote])
+        session.commit()
+        logger.info("RESUMO MENSAL RECONSTRUIDO: %s notas -> %s linhas", total_notas, len(linhas))
+        return len(linhas)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def totais_mensais(db, cnpj, meses=12, tipo_operacao=None):
+    """
+    Totais por mês e tipo (somando CFOP/NCM) dos últimos `meses` meses com movimento,
+    do mais recente pro mais antigo. Lê só resumo_mensal: custo proporcional aos meses.
+    """
+    filtros = [ResumoMensal.cnpj == cnpj]
+    if tipo_operacao:
+        filtros.append(ResumoMensal.tipo_operacao == tipo_operacao)
+    ultimos_meses = (
+        select(ResumoMensal.ano_mes).where(*filtros).distinct()
+        .order_by(ResumoMensal.ano_mes.desc()).limit(meses).scalar_subquery()
+    )
+    somas = [func.sum(getattr(ResumoMensal, campo)).label(campo) for campo in _TOTAIS]
+    linhas = db.execute(
+        select(ResumoMensal.ano_mes, ResumoMensal.tipo_operacao, *somas)
+        .where(*filtros, ResumoMensal.ano_mes.in_(ultimos_meses))
+        .group_by(ResumoMensal.ano_mes, ResumoMensal.tipo_operacao)
+        .order_by(ResumoMensal.ano_mes.desc(), ResumoMensal.tipo_operacao)
+    ).mappings().all()
+    return [dict(linha) for linha in linhas]
+
+
+if __name__ == "__main__":
+    from database.connection import engine, Base
+    from services.logs import configurar_logs
+    configurar_logs()
+    parser = argparse.ArgumentParser(description="Reconstrói a tabela resumo_mensal a partir das notas")
+    parser.add_argument("--cnpj", help="Só este CNPJ (padrão: todos)")
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    print(f"✅ resumo_mensal reconstruído: {reconstruir_resumo(args.cnpj)} linhas")
@@ -0,0 +1,286 @@
+# src/services/roteador_perguntas.py
+# Perguntas numéricas do chat (totais, impostos, ranking de produtos, notas por CFOP)
+# respondidas direto com SQL sobre notas_fiscais/itens_nota, sem ida e volta à IA.
+# Cada intenção é um regex sobre a pergunta normalizada (minúscula, sem acento) e uma
+# função de consulta; pergunta que não casa com nenhuma, é aberta ou tem palavras fora
+# do vocabulário do roteador (nome, produto, dia...) volta pra IA.
+
+import re
+import calendar
+import unicodedata
+from datetime import date, timedelta
+from sqlalchemy import select, func, case, and_
+from models.nota_fiscal import NotaFiscal, ItemNota
+
+_MESES = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+_MESES_ABREV = {nome[:3]: numero for nome, numero in _MESES.items()}
+_NOMES_MES = {numero: nome for nome, numero in _MESES.items()}
+_NOMES_MES[3] = "março"
+
+_IMPOSTOS = ("icms", "ipi", "pis", "cofins")
+
+# Perguntas de opinião/explicação: mesmo citando valores, quem responde é a IA
+_RE_ABERTA = re.compile(
+    r"\b(por ?que|porque|como|explique|explica|devo|deveria|posso|pode|vale a pena|compensa|"
+    r"recomenda|sugere|simples nacional|aliquota|regime|planejamento|diferenca entre)\b"
+)
+_RE_QUANTITATIVA = re.compile(r"\b(quanto|quantos|quantas|qual|quais|total|soma|somar|valor|top|maiores|ranking|liste|mostre)\b")
+
+_RE_ENTRE = re.compile(r"entre (\d{1,2})/(\d{1,2})/(\d{4}) e (\d{1,2})/(\d{1,2})/(\d{4})")
+_RE_MES_NUMERICO = re.compile(r"(?<![\d/])\b(\d{1,2})/(\d{4})\b")  # 03/2024, não o fim de 15/03/2024
+_RE_MES_NOME = re.compile(r"\b(" + "|".join(_MESES) + r")\b(?:\s+(?:de\s+)?(\d{4}))?")
+_RE_MES_ABREV = re.compile(r"\b(" + "|".join(_MESES_ABREV) + r")[/-](\d{4})\b")
+_RE_ULTIMOS_MESES = re.compile(r"\bultimos (\d{1,2}) meses\b")
+_RE_ANO = re.compile(r"\b(20\d{2})\b")
+
+_RE_TOP_N = re.compile(r"\b(?:top|maiores|principais|(\d{1,2}) produtos)\s*(\d{1,2})?")
+
+# Tudo que as intenções, o tipo (_RE_SAIDA/_RE_ENTRADA) e o período entendem; qualquer
+# outra palavra manda a pergunta pra IA
+_VOCABULARIO = set("""
+    o a os as um uma de do da dos das d em no na nos nas ao aos e com para pra pro por pelo pela pelos pelas
+    eu me meu minha meus minhas nosso nossa nossos nossas empresa que foi foram ser sao teve tive tivemos
+    quanto quantos quantas qual quais total totais soma somar somado valor valores geral todo toda todos todas
+    periodo ate hoje agora atualmente mostre mostrar liste listar diga informe
+    top maiores principais ranking mais produtos produto itens item vendidos vendidas comprados compradas
+    notas nota fiscais fiscal nfe nfes numero quantidade cada cfop cfops
+    icms ipi pis cofins imposto impostos tributo tributos pago pagos paguei paga recolhido recolhidos devido
+    saida saidas venda vendas vendi vendido vendida faturamento faturei faturado faturada emitida emitidas
+    entrada entradas compra compras comprei comprado comprada recebida recebidas
+""".split())
+
+_RE_SAIDA = re.compile(r"\b(saidas?|vendas?|vendi|vendid[oa]s?|faturamento|fature[il]|faturad[oa]|emitidas?)\b")
+_RE_ENTRADA = re.compile(r"\b(entradas?|compras?|comprei|comprad[oa]s?|recebidas?)\b")
+
+
+def normalizar(texto):
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", sem_acento.lower()).strip()
+
+
+def _mes(ano, mes):
+    inicio = date(ano, mes, 1)
+    return inicio, inicio + timedelta(days=calendar.monthrange(ano, mes)[1]), f"em {_NOMES_MES[mes]}/{ano}"
+
+
+def _mes_sem_ano(mes, hoje):
+    # "em março" = o último março até hoje
+    return _mes(hoje.year if mes <= hoje.month else hoje.year - 1, mes)
+
+
+def _periodo_e_trecho(texto, hoje):
+    """
+    (período, (início, fim) do trecho da pergunta que o definiu) ou (None, None).
+    """
+    m = _RE_ENTRE.search(texto)
+    if m:
+        d1, m1, a1, d2, m2, a2 = map(int, m.groups())
+        try:
+            inicio, fim = date(a1, m1, d1), date(a2, m2, d2)
+        except ValueError:
+            return None, None
+        return (inicio, fim + timedelta(days=1), f"de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}"), m.span()
+    m = _RE_MES_NUMERICO.search(texto)
+    if m and 1 <= int(m.group(1)) <= 12:
+        return _mes(int(m.group(2)), int(m.group(1))), m.span()
+    m = _RE_MES_ABREV.search(texto)
+    if m:
+        return _mes(int(m.group(2)), _MESES_ABREV[m.group(1)]), m.span()
+    m = _RE_MES_NOME.search(texto)
+    if m:
+        mes = _MESES[m.group(1)]
+        return (_mes(int(m.group(2)), mes) if m.group(2) else _mes_sem_ano(mes, hoje)), m.span()
+    m = re.search(r"\b(mes passado|ultimo mes)\b", texto)
+    if m:
+        anterior = hoje.replace(day=1) - timedelta(days=1)
+        return _mes(anterior.year, anterior.month), m.span()
+    m = re.search(r"\b((n?es[st]e) mes|mes atual)\b", texto)
+    if m:
+        return _mes(hoje.year, hoje.month), m.span()
+    m = _RE_ULTIMOS_MESES.search(texto)
+    if m:
+        quantidade = max(1, int(m.group(1)))
+        ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - (quantidade - 1), 12)
+        inicio = date(ano, mes + 1, 1)
+        return (inicio, _mes(hoje.year, hoje.month)[1], f"nos últimos {quantidade} meses"), m.span()
+    m = re.search(r"\bano passado\b", texto)
+    if m:
+        return (date(hoje.year - 1, 1, 1), date(hoje.year, 1, 1), f"em {hoje.year - 1}"), m.span()
+    m = re.search(r"\b((n?es[st]e) ano|ano atual)\b", texto)
+    if m:
+        return (date(hoje.year, 1, 1), date(hoje.year + 1, 1, 1), f"em {hoje.year}"), m.span()
+    m = _RE_ANO.search(texto)
+    if m:
+        ano = int(m.group(1))
+        return (date(ano, 1, 1), date(ano + 1, 1, 1), f"em {ano}"), m.span()
+    return None, None
+
+
+def periodo_pergunta(texto, hoje=None):
+    """
+    Período citado na pergunta normalizada: (inicio, fim_exclusivo, descrição) ou None
+    (sem período = todas as notas; também quando a data citada não existe, ex: 31/02).
+    """
+    return _periodo_e_trecho(texto, hoje or date.today())[0]
+
+
+def _sobras(texto, trecho_periodo):
+    """
+    Palavras da pergunta que o roteador não interpreta (nome de fornecedor, produto, dia,
+    número de nota, segundo período...). Com sobra, o filtro pedido não entraria no SQL.
+    """
+    if trecho_periodo:
+        texto = texto[:trecho_periodo[0]] + " " + texto[trecho_periodo[1]:]
+    texto = _RE_TOP_N.sub(" ", texto)
+    return [palavra for palavra in re.findall(r"[a-z0-9]+", texto) if palavra not in _VOCABULARIO]
+
+
+def tipo_pergunta(texto):
+    saida, entrada = bool(_RE_SAIDA.search(texto)), bool(_RE_ENTRADA.search(texto))
+    if saida and not entrada:
+        return "Saída"
+    if entrada and not saida:
+        return "Entrada"
+    return None
+
+
+def moeda(valor):
+    return "R$ " + f"{float(valor or 0):,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _papel(cnpj):
+    # Papel do usuário na nota (mesma regra de calcular_tipo_operacao)
+    return case(
+        (NotaFiscal.cnpj_emitente == cnpj, "Saída"),
+        (NotaFiscal.cnpj_destinatario == cnpj, "Entrada"),
+        else_="Desconhecida",
+    )
+
+
+def _filtros(cnpj, tipo, periodo):
+    filtros = [NotaFiscal.owner_cnpj == cnpj]  # Só notas da empresa (ix_notas_owner_data)
+    if tipo == "Saída":
+        filtros.append(NotaFiscal.cnpj_emitente == cnpj)
+    elif tipo == "Entrada":
+        filtros.append(NotaFiscal.cnpj_destinatario == cnpj)
+    if periodo:
+        filtros.append(and_(NotaFiscal.data_emissao >= periodo[0], NotaFiscal.data_emissao < periodo[1]))
+    return filtros
+
+
+def _escopo(tipo, periodo):
+    rotulo = {"Saída": "saídas", "Entrada": "entradas"}.get(tipo, "entradas e saídas")
+    return f"{rotulo} {periodo[2]}" if periodo else f"{rotulo}, todo o período"
+
+
+# 🔹 Intenções: cada uma recebe (db, texto, cnpj, tipo, periodo) e devolve o texto da resposta
+
+def _notas_por_cfop(db, texto, cnpj, tipo, periodo):
+    linhas = db.execute(
+        select(ItemNota.cfop, func.count(func.distinct(NotaFiscal.id)), func.sum(ItemNota.valor_total))
+        .join(NotaFiscal, ItemNota.nota_id == NotaFiscal.id)
+        .where(*_filtros(cnpj, tipo, periodo))
+        .group_by(ItemNota.cfop)
+        .order_by(func.count(func.distinct(NotaFiscal.id)).desc())
+    ).all()
+    if not linhas:
+        return f"Nenhuma nota encontrada ({_escopo(tipo, periodo)})."
+    corpo = "\n".join(f"- CFOP {cfop or 'N/A'}: {notas} notas, {moeda(valor)}" for cfop, notas, valor in linhas)
+    return f"Notas por CFOP ({_escopo(tipo, periodo)}):\n{corpo}"
+
+
+def _top_produtos(db, texto, cnpj, tipo, periodo):
+    m = _RE_TOP_N.search(texto)
+    numeros = [int(n) for n in (m.groups() if m else ()) if n]
+    limite = max(1, min(numeros[0] if numeros else 5, 50))
+    tipo = tipo or ("Entrada" if re.search(r"\bcomprad", texto) else "Saída")
+    linhas = db.execute(
+        select(ItemNota.descricao_produto, func.sum(ItemNota.valor_total).label("valor"), func.sum(ItemNota.quantidade))
+        .join(NotaFiscal, ItemNota.nota_id == NotaFiscal.id)
+        .where(*_filtros(cnpj, tipo, periodo))
+        .group_by(ItemNota.descricao_produto)
+        .order_by(func.sum(ItemNota.valor_total).desc())
+        .limit(limite)
+    ).all()
+    if not linhas:
+        return f"Nenhum produto encontrado ({_escopo(tipo, periodo)})."
+    corpo = "\n".join(
+        f"{i}. {descricao or 'N/A'}: {moeda(valor)} (qtd {float(qtd or 0):g})"
+        for i, (descricao, valor, qtd) in enumerate(linhas, 1)
+    )
+    return f"Top {len(linhas)} produtos por valor ({_escopo(tipo, periodo)}):\n{corpo}"
+
+
+def _impostos(db, texto, cnpj, tipo, periodo):
+    pedidos = [imposto for imposto in _IMPOSTOS if re.search(rf"\b{imposto}\b", texto)] or list(_IMPOSTOS)
+    colunas = [func.coalesce(func.sum(getattr(ItemNota, f"{imposto}_valor")), 0) for imposto in pedidos]
+    papel = _papel(cnpj)
+    linhas = db.execute(
+        select(papel, *colunas)
+        .join(NotaFiscal, ItemNota.nota_id == NotaFiscal.id)
+        .where(*_filtros(cnpj, tipo, periodo))
+        .group_by(papel)
+        .order_by(papel)
+    ).all()
+    if not linhas:
+        return f"Nenhum imposto encontrado ({_escopo(tipo, periodo)})."
+    partes = []
+    for papel_nota, *valores in linhas:
+        detalhe = ", ".join(f"{imposto.upper()} {moeda(valor)}" for imposto, valor in zip(pedidos, valores))
+        partes.append(f"- {papel_nota}: {detalhe}")
+    return f"Impostos ({_escopo(tipo, periodo)}):\n" + "\n".join(partes)
+
+
+def _contagem_notas(db, texto, cnpj, tipo, periodo):
+    papel = _papel(cnpj)
+    linhas = db.execute(
+        select(papel, func.count(NotaFiscal.id)).where(*_filtros(cnpj, tipo, periodo)).group_by(papel).order_by(papel)
+    ).all()
+    total = sum(n for _, n in linhas)
+    detalhe = "; ".join(f"{papel_nota}: {n}" for papel_nota, n in linhas)
+    return f"{total} notas ({_escopo(tipo, periodo)})" + (f" — {detalhe}." if len(linhas) > 1 else ".")
+
+
+def _total_valor(db, texto, cnpj, tipo, periodo):
+    papel = _papel(cnpj)
+    linhas = db.execute(
+        select(papel, func.coalesce(func.sum(NotaFiscal.valor_total_nota), 0), func.count(NotaFiscal.id))
+        .where(*_filtros(cnpj, tipo, periodo))
+        .group_by(papel)
+        .order_by(papel)
+    ).all()
+    if not linhas:
+        return f"Nenhuma nota encontrada ({_escopo(tipo, periodo)})."
+    partes = [f"- {papel_nota}: {moeda(valor)} ({notas} notas)" for papel_nota, valor, notas in linhas]
+    return f"Total ({_escopo(tipo, periodo)}):\n" + "\n".join(partes)
+
+
+# (nome, regex, função): a primeira que casar responde
+INTENCOES = [
+    ("notas_por_cfop", re.compile(r"\bnotas\b.*\b(por|cada) cfop\b|\bcfops?\b.*\b(quantas|numero de|quantidade de) notas\b|\b(quantas|numero de|quantidade de) notas\b.*\bcfops?\b"), _notas_por_cfop),
+    ("top_produtos", re.compile(r"\b(top|maiores|principais|ranking)\b.*\bprodutos?\b|\bprodutos?\b.*\bmais (vendid|comprad)|\b\d{1,2} produtos\b"), _top_produtos),
+    ("impostos", re.compile(r"\b(icms|ipi|pis|cofins|impostos?|tributos?)\b"), _impostos),
+    ("contagem_notas", re.compile(r"\b(quantas|numero de|quantidade de) notas\b"), _contagem_notas),
+    ("total_valor", re.compile(r"\b(quanto|total|soma|valor)\b.*\b(vend|vendi|fatur|compr|saidas?|entradas?|notas)"), _total_valor),
+]
+
+
+def responder_com_sql(db, pergunta, cnpj, hoje=None):
+    """
+    Resposta calculada no banco pra perguntas numéricas reconhecidas:
+    {"resposta": texto, "intencao": nome}, ou None se a pergunta deve ir pra IA.
+    """
+    texto = normalizar(pergunta)
+    if _RE_ABERTA.search(texto) or not _RE_QUANTITATIVA.search(texto):
+        return None
+    for nome, padrao, responder in INTENCOES:
+        if padrao.search(texto):
+            periodo, trecho = _periodo_e_trecho(texto, hoje or date.today())
+            if _sobras(texto, trecho):
+                return None  # Filtro que o SQL não aplicaria (fornecedor, produto, dia...): IA responde
+            resposta = responder(db, texto, cnpj, tipo_pergunta(texto), periodo)
+            return {"resposta": resposta, "intencao": nome}
+    return None
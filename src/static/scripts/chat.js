@@ -29,22 +29,65 @@ document.addEventListener("DOMContentLoaded", () => {
     enviarBtn.textContent = "Enviando...";
 
     try {
-      const resposta = await fetch("/api/chat", {
+      // Streaming (SSE): o texto aparece conforme a IA gera, sem esperar a resposta inteira
+      const resposta = await fetch("/api/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ pergunta, apiKey })
       });
 
-      const data = await resposta.json();
-      chatBox.removeChild(loadingMsg);  // Remove loading
-
-      if (resposta.ok && data.resposta) {
-        addMessage("🤖 " + data.resposta, "bot");
-      } else {
+      if (!(resposta.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+        // Erro antes da IA (validação, login, banco): vem como JSON
+        const data = await resposta.json();
+        chatBox.removeChild(loadingMsg);
         addMessage("⚠️ Erro: " + (data.erro || "Sem resposta da IA."), "bot");
+        return;
+      }
+
+      let botMsg = null;
+      let texto = "";
+      const tratarEvento = (evento) => {
+        if (evento.tipo === "inicio") {
+          // origem "sql": calculado direto das notas, sem IA
+          texto = evento.origem === "sql" ? "📊 " : "🤖 ";
+        } else if (evento.tipo === "token") {
+          if (!botMsg) {
+            chatBox.removeChild(loadingMsg);
+            botMsg = addMessage("", "bot");
+          }
+          texto += evento.texto;
+          botMsg.textContent = texto;
+          chatBox.scrollTop = chatBox.scrollHeight;
+        } else if (evento.tipo === "erro") {
+          if (!botMsg) chatBox.removeChild(loadingMsg);
+          botMsg = null;
+          addMessage("⚠️ Erro: " + evento.erro, "bot");
+        }
+      };
+
+      const leitor = resposta.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let terminou = false;
+      while (!terminou) {
+        const { value, done } = await leitor.read();
+        terminou = done;
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        // Eventos SSE terminam em linha em branco; o resto fica no buffer
+        const blocos = buffer.split("\n\n");
+        buffer = blocos.pop();
+        for (const bloco of blocos) {
+          const linha = bloco.split("\n").find((l) => l.startsWith("data:"));
+          if (linha) tratarEvento(JSON.parse(linha.slice(5)));
+        }
+      }
+
+      if (!botMsg && loadingMsg.parentNode) {
+        chatBox.removeChild(loadingMsg);
+        addMessage("⚠️ Erro: Sem resposta da IA.", "bot");
       }
     } catch (err) {
-      chatBox.removeChild(loadingMsg);
+      if (loadingMsg.parentNode) chatBox.removeChild(loadingMsg);
       addMessage("❌ Erro na comunicação com o servidor.", "bot");
       console.error("Erro:", err);
     } finally {